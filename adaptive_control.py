@@ -0,0 +1,178 @@
+"""
+Control adaptativo de resolución, frecuencia y calidad para el tiempo real
+El servidor mide la latencia de cada frame (espera en cola + procesamiento) y los
+frames descartados por sesión, y recomienda al cliente un nivel de calidad: escala
+de captura, frames por segundo y calidad JPEG. Mientras el cliente no se adapta,
+el servidor procesa a la resolución recomendada y amplía los bordes.
+"""
+
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Niveles de calidad de mejor a peor: (escala de captura, fps, calidad JPEG)
+DEFAULT_LEVELS = (
+    (1.0, 30, 0.8),
+    (0.75, 24, 0.7),
+    (0.5, 15, 0.6),
+    (0.5, 10, 0.5),
+    (0.35, 8, 0.5),
+)
+
+
+class _SessionState:
+    """Estado adaptativo de una sesión"""
+
+    __slots__ = ('level', 'latency_ema', 'frames_since_change', 'drops_since_change',
+                 'source_width', 'source_height', 'last_seen', 'changes')
+
+    def __init__(self):
+        self.level = 0
+        self.latency_ema = None
+        self.frames_since_change = 0
+        self.drops_since_change = 0
+        self.source_width = 0
+        self.source_height = 0
+        self.last_seen = time.monotonic()
+        self.changes = 0
+
+
+class AdaptiveController:
+    """
+    Recomendaciones de calidad por sesión a partir de la latencia observada
+    Baja un nivel si la latencia media supera el intervalo entre frames del nivel actual
+    o si se descartan frames; sube un nivel si la latencia cabe holgadamente en el
+    intervalo del nivel superior. Entre cambios se esperan cooldown_frames frames.
+
+    Args:
+        levels: Niveles (escala, fps, calidad JPEG) de mejor a peor
+        cooldown_frames: Frames mínimos entre dos cambios de nivel
+        headroom: Fracción del intervalo del nivel superior que debe sobrar para subir
+        smoothing: Peso de la latencia nueva en la media exponencial
+        session_ttl: Segundos de inactividad antes de olvidar una sesión
+    """
+
+    def __init__(self, levels=DEFAULT_LEVELS, cooldown_frames: int = 15, headroom: float = 0.5,
+                 smoothing: float = 0.2, session_ttl: float = 60.0):
+        self.levels = tuple(levels)
+        self.cooldown_frames = cooldown_frames
+        self.headroom = headroom
+        self.smoothing = smoothing
+        self.session_ttl = session_ttl
+        self._sessions: Dict[str, _SessionState] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, session_id: str) -> _SessionState:
+        """Estado de la sesión, creándolo si no existe (llamar con el lock tomado)"""
+        now = time.monotonic()
+        expired = [sid for sid, state in self._sessions.items() if now - state.last_seen > self.session_ttl]
+        for sid in expired:
+            del self._sessions[sid]
+        state = self._sessions.get(session_id)
+        if state is None:
+            state = self._sessions[session_id] = _SessionState()
+        state.last_seen = now
+        return state
+
+    def processing_size(self, session_id: str, width: int, height: int) -> Tuple[int, int]:
+        """
+        Tamaño al que procesar un frame de width x height
+        El tamaño más grande recibido se toma como resolución de origen de la cámara; si el
+        frame supera la resolución recomendada (el cliente aún no se adaptó), se reduce.
+
+        Returns:
+            (ancho, alto) de procesamiento
+        """
+        with self._lock:
+            state = self._state(session_id)
+            if width * height > state.source_width * state.source_height:
+                state.source_width, state.source_height = width, height
+            target_width, target_height = self._target_size(state)
+        if width <= target_width and height <= target_height:
+            return width, height
+        return target_width, target_height
+
+    def _target_size(self, state: _SessionState) -> Tuple[int, int]:
+        """Resolución recomendada a partir de la de origen (dimensiones pares)"""
+        scale = self.levels[state.level][0]
+        width = max(2, int(round(state.source_width * scale / 2)) * 2)
+        height = max(2, int(round(state.source_height * scale / 2)) * 2)
+        return width, height
+
+    def observe(self, session_id: str, latency: Optional[float], dropped: bool = False) -> Tuple[dict, bool]:
+        """
+        Registra el resultado de un frame y recalcula el nivel
+
+        Args:
+            session_id: Sesión
+            latency: Segundos desde que llegó el frame hasta tener los bordes (None si falló por saturación)
+            dropped: El frame se descartó o el servidor estaba saturado
+
+        Returns:
+            Tupla (recomendación, True si cambió el nivel)
+        """
+        with self._lock:
+            state = self._state(session_id)
+            state.frames_since_change += 1
+            if dropped or latency is None:
+                state.drops_since_change += 1
+            else:
+                state.latency_ema = latency if state.latency_ema is None else (
+                    self.smoothing * latency + (1 - self.smoothing) * state.latency_ema
+                )
+
+            changed = False
+            if state.frames_since_change >= self.cooldown_frames:
+                interval = 1.0 / self.levels[state.level][1]
+                overloaded = state.drops_since_change > 0 or (state.latency_ema or 0) > interval
+                if overloaded and state.level < len(self.levels) - 1:
+                    state.level += 1
+                    changed = True
+                elif not overloaded and state.level > 0:
+                    better_interval = 1.0 / self.levels[state.level - 1][1]
+                    if (state.latency_ema or 0) < better_interval * self.headroom:
+                        state.level -= 1
+                        changed = True
+                if changed:
+                    state.changes += 1
+                    state.frames_since_change = 0
+                    state.drops_since_change = 0
+                    # La latencia medida pertenece al nivel anterior
+                    state.latency_ema = None
+            return self._recommendation(state), changed
+
+    def recommendation(self, session_id: str) -> dict:
+        """Recomendación actual de la sesión"""
+        with self._lock:
+            return self._recommendation(self._state(session_id))
+
+    def _recommendation(self, state: _SessionState) -> dict:
+        scale, fps, quality = self.levels[state.level]
+        width, height = self._target_size(state)
+        return {
+            'level': state.level,
+            'scale': scale,
+            'width': width,
+            'height': height,
+            'fps': fps,
+            'jpeg_quality': quality,
+            'latency_ms': round(state.latency_ema * 1000, 2) if state.latency_ema is not None else None
+        }
+
+    def stats(self) -> dict:
+        """Nivel y latencia de cada sesión"""
+        with self._lock:
+            return {
+                sid: dict(self._recommendation(state), changes=state.changes)
+                for sid, state in self._sessions.items()
+            }
+
+
+def upscale_edges(edges: np.ndarray, width: int, height: int) -> np.ndarray:
+    """Amplía un mapa de bordes procesado a resolución reducida (vecino más cercano: sigue siendo binario)"""
+    if edges.shape[1] == width and edges.shape[0] == height:
+        return edges
+    return cv2.resize(edges, (width, height), interpolation=cv2.INTER_NEAREST)
@@ -1,26 +1,28 @@
 from flask import Flask
-import os
 
-from routes import init_routes
+import config
 
-app = Flask(__name__)
 
-# Configuración
-UPLOAD_FOLDER = 'static/uploads'
-RESULT_FOLDER = 'static/results'
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
-MAX_FILE_SIZE = 16 * 1024 * 1024  # 16 MB
+def create_app():
+    """
+    Crea la aplicación con la configuración de config.py (y las variables de entorno CANNY_*)
+    Las rutas, y con ellas OpenCV/NumPy, se importan aquí y no al importar este módulo;
+    la calibración y el primer pipeline se ejecutan en segundo plano (ver warmup.py).
+    Cada llamada crea una aplicación independiente, con su motor, cachés y colas en
+    app.extensions (ver routes.AppServices); la instancia la crea el punto de entrada.
+    """
+    # Logging con LOG_LEVEL / LOG_FILE de config.py
+    config.configure_logging()
 
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
+    app = Flask(__name__)
+    # Carpetas, tamaño máximo de subida y cookies
+    config.init_app(app)
 
-# Crear carpetas si no existen
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(RESULT_FOLDER, exist_ok=True)
+    from routes import init_routes
+    init_routes(app, config.UPLOAD_FOLDER, config.RESULT_FOLDER, config.ALLOWED_EXTENSIONS)
+    return app
 
-# Inicializar rutas
-init_routes(app, UPLOAD_FOLDER, RESULT_FOLDER, ALLOWED_EXTENSIONS)
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
-
+    app = create_app()
+    app.run(debug=config.DEBUG, host=config.SERVER_HOST, port=config.SERVER_PORT)
@@ -0,0 +1,412 @@
+"""
+Modo de servidor asíncrono (ASGI)
+Expone la misma aplicación que app.py sobre asyncio, de modo que las conexiones
+lentas o inactivas no ocupan un hilo cada una:
+
+- Los cuerpos de las peticiones se reciben de forma asíncrona y solo entonces se
+  entregan a las rutas de Flask (register_routes), que se ejecutan en un pool acotado.
+  Las subidas de vídeo se vuelcan a un fichero temporal según llegan, sin plazo total.
+- POST /api/process-url espera la descarga remota en el bucle de eventos y envía
+  el trabajo de CPU al motor de procesamiento.
+- El WebSocket /ws/realtime espera cada frame sin bloquear un hilo por cliente.
+
+Se lanza con server.py (uvicorn):
+
+    python server.py --mode asgi --workers 4
+"""
+
+import asyncio
+import io
+import json
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+import config
+import routes
+from app import create_app
+from image_processor import process_image_bytes_job
+from metrics import IN_FLIGHT, REQUEST_BYTES, REQUEST_ERRORS, REQUEST_SECONDS, REQUESTS_TOTAL, server_timing_header
+from processing_engine import EngineSaturated
+from remote_fetcher import FetchError, FetchTooLarge, fetch_image_bytes_async
+from response_formats import OutputOptions, encode_edges
+
+_END = object()
+
+
+class AsgiApplication:
+    """
+    Adaptador ASGI de la aplicación Flask con rutas nativas para la E/S lenta
+
+    Args:
+        wsgi_app: Aplicación Flask creada con create_app() (rutas y servicios ya registrados)
+        wsgi_threads: Hilos para las rutas que se ejecutan en Flask y para la codificación
+        body_timeout: Segundos máximos para recibir el cuerpo de una petición
+        body_idle_timeout: Segundos máximos sin recibir datos de una subida de vídeo
+        spool_memory: Bytes de una subida de vídeo que se guardan en memoria antes de pasar a disco
+    """
+
+    def __init__(self, wsgi_app, wsgi_threads: int = 64, body_timeout: float = 60.0,
+                 body_idle_timeout: float = 30.0, spool_memory: int = 1024 * 1024):
+        self.wsgi_app = wsgi_app
+        self.services = wsgi_app.extensions[routes.EXTENSION_KEY]
+        self.body_timeout = body_timeout
+        self.body_idle_timeout = body_idle_timeout
+        self.spool_memory = spool_memory
+        self._executor = ThreadPoolExecutor(max_workers=wsgi_threads, thread_name_prefix='asgi-wsgi')
+        self._http_routes = {('POST', '/api/process-url'): self._process_url}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        elif scope['type'] == 'websocket':
+            if scope['path'] == '/ws/realtime':
+                await self._realtime_websocket(receive, send)
+            else:
+                await send({'type': 'websocket.close', 'code': 1000})
+        elif scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self.services.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # ==================== HTTP ====================
+
+    async def _http(self, scope, receive, send):
+        # Límite por ruta (las subidas de vídeo admiten más que las de imágenes)
+        max_body = routes.max_upload_size(scope['path'])
+        try:
+            if scope['path'] == routes.VIDEO_UPLOAD_PATH:
+                body = await self._spool_body(receive, max_body)
+            else:
+                body = await asyncio.wait_for(self._read_body(receive, max_body), self.body_timeout)
+        except asyncio.TimeoutError:
+            await _send_json(send, 408, {'success': False, 'message': 'Tiempo de subida agotado'})
+            return
+        except _BodyTooLarge:
+            limit_mb = max_body // (1024 * 1024)
+            await _send_json(send, 413, {'success': False, 'message': f'Archivo demasiado grande. Máximo {limit_mb} MB'})
+            return
+        if body is None:
+            return  # El cliente se desconectó
+
+        if not isinstance(body, bytes):
+            # Subida volcada a un fichero temporal: solo la consume Flask
+            with body:
+                await self._wsgi(scope, body, send)
+            return
+        handler = self._http_routes.get((scope['method'], scope['path']))
+        if handler is not None:
+            await self._native(handler, scope, body, send)
+        else:
+            await self._wsgi(scope, io.BytesIO(body), send)
+
+    async def _read_body(self, receive, max_body):
+        """Recibe el cuerpo completo sin bloquear un hilo; None si el cliente se desconecta"""
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > max_body:
+                raise _BodyTooLarge()
+            chunks.append(chunk)
+            if not message.get('more_body', False):
+                return b''.join(chunks)
+
+    async def _spool_body(self, receive, max_body):
+        """
+        Recibe una subida de vídeo en un SpooledTemporaryFile a medida que llegan los bloques
+        
+        El límite de tamaño se comprueba con cada bloque y el plazo es de inactividad
+        (body_idle_timeout entre bloques), no total: una subida lenta pero continua termina.
+        
+        Returns:
+            Fichero temporal en la posición 0 (el llamador lo cierra) o None si el cliente se desconecta
+        
+        Raises:
+            asyncio.TimeoutError: Si pasan body_idle_timeout segundos sin recibir datos
+            _BodyTooLarge: Si el cuerpo supera max_body
+        """
+        loop = asyncio.get_running_loop()
+        spool = tempfile.SpooledTemporaryFile(max_size=self.spool_memory)
+        size = 0
+        try:
+            while True:
+                message = await asyncio.wait_for(receive(), self.body_idle_timeout)
+                if message['type'] == 'http.disconnect':
+                    spool.close()
+                    return None
+                chunk = message.get('body', b'')
+                size += len(chunk)
+                if size > max_body:
+                    raise _BodyTooLarge()
+                if chunk:
+                    # Pasado spool_memory la escritura va a disco: fuera del bucle de eventos
+                    await loop.run_in_executor(None, spool.write, chunk)
+                if not message.get('more_body', False):
+                    spool.seek(0)
+                    return spool
+        except BaseException:
+            spool.close()
+            raise
+
+    async def _wsgi(self, scope, body, send):
+        """Ejecuta la petición en Flask dentro del pool y transmite la respuesta por bloques (body: fichero en la posición 0)"""
+        loop = asyncio.get_running_loop()
+        environ = _build_environ(scope, body)
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+            return lambda data: None
+
+        iterable = await loop.run_in_executor(self._executor, self.wsgi_app, environ, start_response)
+        try:
+            iterator = iter(iterable)
+            await send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+            while True:
+                chunk = await loop.run_in_executor(self._executor, next, iterator, _END)
+                if chunk is _END:
+                    break
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            # close() ejecuta el teardown de Flask (métricas de peticiones en curso)
+            if hasattr(iterable, 'close'):
+                await loop.run_in_executor(self._executor, iterable.close)
+
+    async def _native(self, handler, scope, body, send):
+        """Ejecuta una ruta asíncrona y registra sus métricas como lo hace Flask"""
+        endpoint = scope['path']
+        start = time.perf_counter()
+        IN_FLIGHT.inc(endpoint)
+        REQUEST_BYTES.observe(len(body), endpoint)
+        status = 500
+        try:
+            status, headers, payload, timings = await handler(scope, body)
+            if config.SERVER_TIMING_HEADER and timings:
+                headers.append((b'server-timing', server_timing_header(timings, time.perf_counter() - start).encode()))
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            await send({'type': 'http.response.body', 'body': payload})
+        finally:
+            IN_FLIGHT.dec(endpoint)
+            REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint)
+            REQUESTS_TOTAL.inc(endpoint, str(status))
+            if status >= 400:
+                REQUEST_ERRORS.inc(endpoint, str(status))
+
+    async def _process_url(self, scope, body):
+        """POST /api/process-url: descarga esperada en el bucle, CPU en el motor de procesamiento"""
+        try:
+            data = json.loads(body or b'{}')
+            if not isinstance(data, dict):
+                raise ValueError('Se esperaba un objeto JSON')
+        except ValueError as e:
+            return _json_parts(400, {'success': False, 'message': f'JSON inválido: {e}'})
+
+        try:
+            image_url = data.get('url')
+            threshold1 = int(data.get('threshold1', 100))
+            threshold2 = int(data.get('threshold2', 200))
+
+            if not image_url:
+                return _json_parts(400, {'success': False, 'message': 'URL no proporcionada'})
+
+            try:
+                options = OutputOptions.from_params(data, _header(scope, b'accept'), routes.montage_mode())
+                backend = routes.request_backend(data)
+            except ValueError as e:
+                return _json_parts(400, {'success': False, 'message': str(e)})
+
+            download_start = time.perf_counter()
+            image_data = await fetch_image_bytes_async(image_url)
+            download = time.perf_counter() - download_start
+            engine = self.services.processing_engine
+            if engine.mode == 'process':
+                image_data = bytes(image_data)   # memoryview no se puede enviar a otro proceso
+
+            future = engine.submit(
+                process_image_bytes_job, image_data, threshold1, threshold2, 0, options.to_dict(), backend
+            )
+            result = await asyncio.wait_for(asyncio.wrap_future(future), config.PROCESSING_TIMEOUT)
+            timings = dict(result.get('timings') or {}, download=download)
+            routes.note_timings(timings)
+
+            # Los almacenes de resultados y renditions son los de esta aplicación
+            with self.wsgi_app.app_context():
+                result_path, edges_path = routes.persist_results_async(result, options)
+                payload = routes.attach_renditions(
+                    routes.url_result_payload(result, result_path, edges_path), result, options, image_data
+                )
+            # La respuesta (base64 incluido) se construye fuera del bucle de eventos
+            status, headers, payload = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._format_response, options, result, payload
+            )
+            return status, headers, payload, timings
+
+        except EngineSaturated as e:
+            status, headers, payload, timings = _json_parts(503, {'success': False, 'message': str(e)})
+            headers.append((b'retry-after', b'1'))
+            return status, headers, payload, timings
+        except FetchTooLarge as e:
+            return _json_parts(413, {'success': False, 'message': str(e)})
+        except FetchError as e:
+            return _json_parts(502, {'success': False, 'message': str(e)})
+        except Exception as e:
+            return _json_parts(500, {'success': False, 'message': f'Error: {str(e)}'})
+
+    def _format_response(self, options, result, payload):
+        """Respuesta negociada de routes.format_response convertida a (estado, cabeceras, cuerpo)"""
+        with self.wsgi_app.app_context():
+            response, status = routes.format_response(options, result['result_bytes'], result['edges_bytes'], payload)
+            headers = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in response.headers.items()]
+            return status, headers, response.get_data()
+
+    # ==================== WEBSOCKET ====================
+
+    async def _realtime_websocket(self, receive, send):
+        """/ws/realtime con el mismo protocolo que la ruta de flask-sock, sin un hilo por cliente"""
+        message = await receive()
+        if message['type'] != 'websocket.connect':
+            return
+        await send({'type': 'websocket.accept'})
+
+        loop = asyncio.get_running_loop()
+        params = dict(routes.STREAM_DEFAULTS)
+        session_id = 'ws-' + uuid.uuid4().hex
+        stream_options = OutputOptions(format='png')
+        recommendation_sent = False
+
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                return
+
+            # Mensaje de control: actualizar parámetros en mitad del stream
+            if message.get('text') is not None:
+                try:
+                    stream_options = routes.apply_stream_control(params, stream_options, json.loads(message['text']))
+                except (ValueError, TypeError, AttributeError):
+                    await _send_ws_json(send, {'success': False, 'message': 'Parámetros inválidos'})
+                continue
+
+            frame = message.get('bytes')
+            if not frame:
+                await _send_ws_json(send, {'success': False, 'message': 'Frame vacío'})
+                continue
+
+            start = time.perf_counter()
+            try:
+                future = self.services.frame_scheduler.submit(
+                    session_id, session_id, frame, params['width'], params['height'],
+                    params['threshold1'], params['threshold2'], params['backend']
+                )
+                edges = await asyncio.wait_for(asyncio.wrap_future(future), config.REALTIME_FRAME_TIMEOUT)
+                adaptive, changed = self._observe_realtime(session_id, time.perf_counter() - start)
+                if adaptive is not None and (changed or not recommendation_sent):
+                    await _send_ws_json(send, dict(adaptive, type='adaptive'))
+                    recommendation_sent = True
+                edges_bytes = await loop.run_in_executor(self._executor, encode_edges, edges, stream_options)
+                await send({'type': 'websocket.send', 'bytes': edges_bytes})
+            except ValueError as e:
+                await _send_ws_json(send, {'success': False, 'message': str(e)})
+            except cv2.error:
+                await _send_ws_json(send, {'success': False, 'message': 'No se pudo procesar el frame'})
+            except (asyncio.TimeoutError, EngineSaturated):
+                self._observe_realtime(session_id, None, dropped=True)
+                await _send_ws_json(send, {'success': False, 'message': 'Servidor saturado, reintente'})
+
+
+    def _observe_realtime(self, session_id, latency, dropped=False):
+        """routes.observe_realtime con el control adaptativo de esta aplicación"""
+        with self.wsgi_app.app_context():
+            return routes.observe_realtime(session_id, latency, dropped)
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+def _header(scope, name: bytes) -> str:
+    for key, value in scope.get('headers', []):
+        if key == name:
+            return value.decode('latin-1')
+    return ''
+
+
+def _json_parts(status, body):
+    """(estado, cabeceras, cuerpo, tiempos) de una respuesta JSON"""
+    payload = json.dumps(body).encode('utf-8')
+    return status, [(b'content-type', b'application/json'), (b'content-length', str(len(payload)).encode())], payload, None
+
+
+async def _send_json(send, status, body):
+    status, headers, payload, _ = _json_parts(status, body)
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': payload})
+
+
+async def _send_ws_json(send, body):
+    await send({'type': 'websocket.send', 'text': json.dumps(body)})
+
+
+def _build_environ(scope, body) -> dict:
+    """Entorno WSGI (PEP 3333) de una petición ASGI con el cuerpo ya recibido (fichero en la posición 0)"""
+    body.seek(0, io.SEEK_END)
+    length = body.tell()
+    body.seek(0)
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'CONTENT_LENGTH': str(length),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = name if name == 'CONTENT_TYPE' else f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+# Punto de entrada de uvicorn: cada proceso del servidor crea aquí su aplicación
+application = AsgiApplication(
+    create_app(),
+    wsgi_threads=config.ASGI_WSGI_THREADS,
+    body_timeout=config.ASGI_BODY_TIMEOUT,
+    body_idle_timeout=config.ASGI_BODY_IDLE_TIMEOUT,
+    spool_memory=config.ASGI_SPOOL_MEMORY_BYTES
+)
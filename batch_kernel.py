@@ -0,0 +1,147 @@
+"""
+Canny por lotes para imágenes pequeñas (miniaturas)
+Las imágenes se empaquetan en un atlas (una ranura por imagen, rodeada por un
+marco reflejado) y la conversión a grises y el suavizado Gaussiano se ejecutan
+una sola vez sobre el atlas completo. La supresión de no máximos y la histéresis
+se aplican sobre vistas de cada ranura (sin copias) y los porcentajes de bordes
+se devuelven como un único vector.
+
+El marco, del radio del kernel Gaussiano más el de la apertura Sobel de Canny,
+reproduce BORDER_REFLECT_101 de GaussianBlur y Canny ve cada ranura como una
+imagen aislada, así que el resultado coincide píxel a píxel con
+detect_image_edges imagen a imagen. Las imágenes con un lado no mayor que el
+marco (donde la reflexión se repetiría) se procesan de una en una.
+"""
+
+from collections import defaultdict
+from typing import Dict, List, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+# Radio de la apertura Sobel 3x3 que usa cv2.Canny
+_SOBEL_RADIUS = 1
+
+
+def _border(kernel: Tuple[int, int], sigma: float) -> int:
+    """Marco alrededor de cada imagen en su ranura: radio del kernel Gaussiano más el de Sobel"""
+    if min(kernel) <= 0:
+        # Kernel derivado de sigma, como hace GaussianBlur con imágenes de 8 bits
+        side = int(round(sigma * 6 + 1)) | 1
+        kernel = tuple(k if k > 0 else side for k in kernel)
+    return max(kernel) // 2 + _SOBEL_RADIUS
+
+
+def _size_class(height: int, width: int) -> Tuple[int, int]:
+    """Clase de tamaño: siguiente potencia de 2 de cada lado (limita el relleno desperdiciado)"""
+    return 1 << max(0, (height - 1).bit_length()), 1 << max(0, (width - 1).bit_length())
+
+
+def _reflect_border(slot: np.ndarray, height: int, width: int, pad: int):
+    """Rellena en su sitio el marco alrededor de la imagen (BORDER_REFLECT_101; requiere lados > pad)"""
+    bottom, right = pad + height, pad + width
+    for offset in range(1, pad + 1):
+        slot[..., pad - offset, pad:right] = slot[..., pad + offset, pad:right]
+        slot[..., bottom - 1 + offset, pad:right] = slot[..., bottom - 1 - offset, pad:right]
+    # Las columnas se reflejan después de las filas: así las esquinas también quedan reflejadas
+    for offset in range(1, pad + 1):
+        slot[..., :bottom + pad, pad - offset] = slot[..., :bottom + pad, pad + offset]
+        slot[..., :bottom + pad, right - 1 + offset] = slot[..., :bottom + pad, right - 1 - offset]
+
+
+def _gray(image: np.ndarray) -> np.ndarray:
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+
+
+def _blur_atlas(images: Sequence[np.ndarray], kernel: Tuple[int, int], sigma: float, pad: int) -> np.ndarray:
+    """
+    Grises + suavizado de varias imágenes con una llamada a OpenCV por etapa
+
+    Returns:
+        Atlas suavizado (imágenes, alto de ranura, ancho de ranura); la imagen i ocupa
+        [i, pad:pad + alto, pad:pad + ancho]
+    """
+    count = len(images)
+    max_height = max(image.shape[0] for image in images)
+    max_width = max(image.shape[1] for image in images)
+    uniform = len(set(image.shape for image in images)) == 1
+    slot_height, slot_width = max_height + 2 * pad, max_width + 2 * pad
+    atlas = np.zeros((count, slot_height, slot_width), dtype=np.uint8)
+
+    if uniform:
+        # Misma forma: una sola conversión sobre la pila y un solo relleno vectorizado
+        stack = np.stack(images)
+        if stack.ndim == 4:
+            stack = cv2.cvtColor(stack.reshape(count * max_height, max_width, 3), cv2.COLOR_BGR2GRAY)
+        atlas[:, pad:pad + max_height, pad:pad + max_width] = stack.reshape(count, max_height, max_width)
+        _reflect_border(atlas, max_height, max_width, pad)
+    else:
+        for index, image in enumerate(images):
+            height, width = image.shape[:2]
+            atlas[index, pad:pad + height, pad:pad + width] = _gray(image)
+            _reflect_border(atlas[index], height, width, pad)
+
+    blurred = cv2.GaussianBlur(atlas.reshape(count * slot_height, slot_width), tuple(kernel), sigma)
+    return blurred.reshape(count, slot_height, slot_width)
+
+
+def detect_edges_batch(images: Sequence[np.ndarray], threshold1: int, threshold2: int,
+                       kernel=(5, 5), sigma: float = 1.5,
+                       max_atlas_pixels: int = 16 * 1024 * 1024) -> Tuple[List[np.ndarray], np.ndarray]:
+    """
+    Aplica suavizado Gaussiano + Canny a un lote de imágenes
+
+    Las imágenes se agrupan por clase de tamaño (potencia de 2) y cada grupo se procesa
+    como un atlas de como máximo max_atlas_pixels píxeles. Las imágenes con un lado no
+    mayor que el marco del kernel se procesan solas.
+
+    Args:
+        images: Imágenes BGR o en escala de grises (pueden tener tamaños distintos)
+        threshold1: Umbral Bajo
+        threshold2: Umbral Alto
+        kernel: Tamaño del kernel Gaussiano
+        sigma: Sigma del kernel Gaussiano
+        max_atlas_pixels: Píxeles máximos de cada atlas
+
+    Returns:
+        Tupla con (lista de mapas de bordes en el orden de entrada, vector de porcentajes de bordes)
+    """
+    if not images:
+        return [], np.zeros(0, dtype=np.float64)
+
+    pad = _border(kernel, sigma)
+    edges: List[np.ndarray] = [None] * len(images)
+    groups: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+    for index, image in enumerate(images):
+        height, width = image.shape[:2]
+        if min(height, width) <= pad:
+            # El marco no se puede reflejar sin repetir: mismo camino que imagen a imagen
+            edges[index] = cv2.Canny(cv2.GaussianBlur(_gray(image), tuple(kernel), sigma), threshold1, threshold2)
+        else:
+            groups[_size_class(height, width)].append(index)
+
+    for (class_height, class_width), indices in groups.items():
+        per_atlas = max(1, max_atlas_pixels // ((class_height + 2 * pad) * (class_width + 2 * pad)))
+        for start in range(0, len(indices), per_atlas):
+            chunk = indices[start:start + per_atlas]
+            blurred = _blur_atlas([images[index] for index in chunk], kernel, sigma, pad)
+            for slot, index in enumerate(chunk):
+                height, width = images[index].shape[:2]
+                edges[index] = cv2.Canny(blurred[slot, pad:pad + height, pad:pad + width],
+                                         threshold1, threshold2)
+    return edges, edge_percentages(edges)
+
+
+def edge_percentages(edges: Sequence[np.ndarray]) -> np.ndarray:
+    """
+    Porcentaje de píxeles de borde de cada mapa, como un único vector
+
+    Args:
+        edges: Mapas de bordes
+
+    Returns:
+        Vector de porcentajes redondeados a 2 decimales
+    """
+    counts = np.fromiter((cv2.countNonZero(edge) for edge in edges), dtype=np.float64, count=len(edges))
+    sizes = np.fromiter((edge.size for edge in edges), dtype=np.float64, count=len(edges))
+    return np.round(counts / sizes * 100, 2)
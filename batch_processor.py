@@ -0,0 +1,482 @@
+"""
+Procesamiento por lotes de directorios, archivos zip/tar y listas de ficheros
+Se usa desde el endpoint /api/batch y como herramienta de línea de comandos:
+
+    python batch_processor.py imagenes/ --output bordes/ --manifest manifiesto.jsonl
+
+La lectura de los ficheros se adelanta en un hilo (prefetch) mientras un pool de
+trabajadores aplica Canny; las imágenes pequeñas se agrupan en un solo trabajo
+con el kernel por lotes (batch_kernel). Los resultados salen en cuanto terminan
+y se anotan en un manifiesto CSV/JSONL que permite reanudar un trabajo interrumpido.
+"""
+
+import argparse
+import csv
+import json
+import os
+import queue
+import sys
+import tarfile
+import threading
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Callable, Iterable, Iterator, List, Optional, Set, Tuple
+
+from batch_kernel import detect_edges_batch
+from edge_backends import gaussian_params
+from image_processor import (
+    calculate_edge_percentage,
+    decode_image_bytes,
+    detect_image_edges,
+    encode_edges_png
+)
+from persistence import write_file_atomic
+from processing_engine import EngineSaturated, ProcessingEngine
+
+DEFAULT_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
+MANIFEST_FIELDS = ['name', 'status', 'edge_percentage', 'image_width', 'image_height', 'edges_path', 'elapsed_ms', 'error']
+
+_DONE = object()
+
+# Fuente de imágenes: pares (nombre, función que devuelve los bytes)
+BatchItems = Iterable[Tuple[str, Callable[[], bytes]]]
+
+
+def _has_allowed_extension(name: str, extensions: Set[str]) -> bool:
+    return '.' in name and name.rsplit('.', 1)[1].lower() in extensions
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def iter_directory(path: str, extensions: Set[str] = DEFAULT_EXTENSIONS) -> BatchItems:
+    """
+    Recorre un directorio (recursivamente) en orden estable
+    
+    Args:
+        path: Directorio raíz
+        extensions: Extensiones admitidas
+    
+    Returns:
+        Iterador de (nombre relativo, lector)
+    """
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for filename in sorted(files):
+            if _has_allowed_extension(filename, extensions):
+                full_path = os.path.join(root, filename)
+                name = os.path.relpath(full_path, path).replace(os.sep, '/')
+                yield name, (lambda p=full_path: _read_file(p))
+
+
+def iter_file_list(paths: Iterable[str], extensions: Set[str] = DEFAULT_EXTENSIONS) -> BatchItems:
+    """Recorre una lista explícita de rutas"""
+    for path in paths:
+        if _has_allowed_extension(path, extensions):
+            yield path, (lambda p=path: _read_file(p))
+
+
+def iter_archive(source, extensions: Set[str] = DEFAULT_EXTENSIONS) -> BatchItems:
+    """
+    Recorre las imágenes de un archivo zip o tar (tar.gz, tar.bz2...)
+    
+    Args:
+        source: Ruta del archivo o un objeto fichero con seek
+        extensions: Extensiones admitidas
+    
+    Returns:
+        Iterador de (nombre dentro del archivo, lector)
+    """
+    if zipfile.is_zipfile(source):
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and _has_allowed_extension(info.filename, extensions):
+                    yield info.filename, (lambda i=info: archive.read(i))
+        return
+
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    try:
+        archive = tarfile.open(fileobj=source, mode='r:*') if hasattr(source, 'read') else tarfile.open(source, mode='r:*')
+    except tarfile.TarError:
+        raise ValueError("El archivo no es un zip ni un tar válido")
+    with archive:
+        for member in archive:
+            if member.isfile() and _has_allowed_extension(member.name, extensions):
+                yield member.name, (lambda m=member: archive.extractfile(m).read())
+
+
+def iter_source(path: str, extensions: Set[str] = DEFAULT_EXTENSIONS) -> BatchItems:
+    """Elige el iterador adecuado para un directorio, un archivo o un fichero .txt con una ruta por línea"""
+    if os.path.isdir(path):
+        return iter_directory(path, extensions)
+    if path.endswith('.txt'):
+        with open(path, 'r', encoding='utf-8') as f:
+            paths = [line.strip() for line in f if line.strip()]
+        return iter_file_list(paths, extensions)
+    return iter_archive(path, extensions)
+
+
+def safe_relative_path(name: str) -> str:
+    """Convierte un nombre de un archivo en una ruta relativa segura (sin '..' ni rutas absolutas)"""
+    parts = [part for part in name.replace('\\', '/').split('/') if part not in ('', '.', '..')]
+    return os.path.join(*parts) if parts else 'imagen'
+
+
+def process_batch_item(name: str, image_bytes: bytes, threshold1: int, threshold2: int,
+                       output_dir: Optional[str] = None) -> dict:
+    """
+    Procesa una imagen del lote: decodifica, aplica Canny y opcionalmente guarda los bordes
+    
+    Args:
+        name: Nombre de la imagen dentro del lote
+        image_bytes: Contenido de la imagen
+        threshold1: Umbral Bajo para Canny
+        threshold2: Umbral Alto para Canny
+        output_dir: Carpeta donde guardar los bordes (None para no guardar)
+    
+    Returns:
+        Registro con las estadísticas de la imagen
+    """
+    start = time.perf_counter()
+    original_image = decode_image_bytes(image_bytes)
+    _, edges = detect_image_edges(original_image, threshold1, threshold2)
+    edges_path = _save_edges(name, edges, output_dir)
+
+    return {
+        'name': name,
+        'status': 'ok',
+        'edge_percentage': float(calculate_edge_percentage(edges)),
+        'image_width': original_image.shape[1],
+        'image_height': original_image.shape[0],
+        'edges_path': edges_path,
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 2),
+        'error': None,
+    }
+
+
+def _save_edges(name: str, edges, output_dir: Optional[str]) -> Optional[str]:
+    """Guarda los bordes de una imagen del lote y devuelve su ruta (None si no se guardan)"""
+    if not output_dir:
+        return None
+    edges_path = os.path.join(output_dir, safe_relative_path(name).rsplit('.', 1)[0] + '_edges.png')
+    os.makedirs(os.path.dirname(edges_path), exist_ok=True)
+    write_file_atomic(edges_path, encode_edges_png(edges))
+    return edges_path
+
+
+def process_batch_chunk(entries: List[Tuple[str, bytes]], threshold1: int, threshold2: int,
+                        output_dir: Optional[str] = None) -> List[dict]:
+    """
+    Procesa varias imágenes pequeñas en un único trabajo del motor con el kernel por lotes
+    Reparte el coste de envío al motor entre todas las imágenes y aplica grises, suavizado
+    y porcentajes de bordes sobre el lote completo (ver batch_kernel).
+    
+    Args:
+        entries: Pares (nombre, contenido) de las imágenes
+        threshold1: Umbral Bajo para Canny
+        threshold2: Umbral Alto para Canny
+        output_dir: Carpeta donde guardar los bordes (None para no guardar)
+    
+    Returns:
+        Registros de cada imagen (los fallos de decodificación como registros de error)
+    """
+    start = time.perf_counter()
+    records = []
+    names, images = [], []
+    for name, image_bytes in entries:
+        try:
+            images.append(decode_image_bytes(image_bytes))
+            names.append(name)
+        except Exception as e:
+            records.append(_error_record(name, e))
+
+    kernel, sigma = gaussian_params()
+    edges_list, percentages = detect_edges_batch(images, threshold1, threshold2, kernel, sigma)
+    for name, image, edges, percentage in zip(names, images, edges_list, percentages):
+        try:
+            edges_path = _save_edges(name, edges, output_dir)
+        except Exception as e:
+            records.append(_error_record(name, e))
+            continue
+        records.append({
+            'name': name,
+            'status': 'ok',
+            'edge_percentage': float(percentage),
+            'image_width': image.shape[1],
+            'image_height': image.shape[0],
+            'edges_path': edges_path,
+            'elapsed_ms': None,
+            'error': None,
+        })
+
+    # Tiempo del lote repartido entre sus imágenes
+    elapsed_ms = round((time.perf_counter() - start) * 1000 / max(1, len(entries)), 2)
+    for record in records:
+        if record['status'] == 'ok':
+            record['elapsed_ms'] = elapsed_ms
+    return records
+
+
+def _error_record(name: str, error: Exception) -> dict:
+    return {
+        'name': name, 'status': 'error', 'edge_percentage': None, 'image_width': None,
+        'image_height': None, 'edges_path': None, 'elapsed_ms': None, 'error': str(error),
+    }
+
+
+def _prefetch(items: BatchItems, buffer: queue.Queue, stop: threading.Event):
+    """Lee los bytes de las imágenes por adelantado (E/S fuera de los trabajadores de CPU)"""
+    try:
+        for name, read in items:
+            if stop.is_set():
+                break
+            try:
+                buffer.put((name, read(), None))
+            except Exception as e:
+                buffer.put((name, None, e))
+    except Exception as e:
+        buffer.put(('<fuente>', None, e))
+    finally:
+        buffer.put(_DONE)
+
+
+def process_batch(items: BatchItems, engine: ProcessingEngine, threshold1: int = 100, threshold2: int = 200,
+                  output_dir: Optional[str] = None, max_in_flight: int = 4, prefetch: int = 8,
+                  skip: Optional[Set[str]] = None, chunk_size: int = 1,
+                  chunk_max_bytes: int = 1024 * 1024) -> Iterator[dict]:
+    """
+    Procesa un lote y devuelve los registros a medida que terminan (no en orden de entrada)
+    
+    Args:
+        items: Fuente de imágenes (nombre, lector)
+        engine: Motor de procesamiento donde se ejecuta cada imagen
+        threshold1: Umbral Bajo para Canny
+        threshold2: Umbral Alto para Canny
+        output_dir: Carpeta donde guardar los bordes (None para no guardar)
+        max_in_flight: Trabajos (imágenes o grupos) procesándose a la vez
+        prefetch: Imágenes leídas por adelantado
+        skip: Nombres ya procesados (reanudación)
+        chunk_size: Imágenes agrupadas en cada trabajo del motor (1 desactiva el kernel por lotes)
+        chunk_max_bytes: Tamaño máximo de una imagen para agruparla; las mayores van solas
+    
+    Returns:
+        Iterador de registros con las estadísticas de cada imagen
+    """
+    skip = skip or set()
+    buffer = queue.Queue(maxsize=max(1, prefetch))
+    stop = threading.Event()
+    reader = threading.Thread(
+        target=_prefetch,
+        args=(((name, read) for name, read in items if name not in skip), buffer, stop),
+        name='batch-prefetch',
+        daemon=True
+    )
+    reader.start()
+
+    in_flight = {}
+    pending_chunk = None
+    held_item = None
+    exhausted = False
+    try:
+        while True:
+            # Llenar el pool hasta max_in_flight trabajos
+            while (not exhausted or pending_chunk is not None) and len(in_flight) < max_in_flight:
+                chunk = pending_chunk
+                pending_chunk = None
+                if chunk is None:
+                    chunk = []
+                    while len(chunk) < chunk_size:
+                        if held_item is not None:
+                            item, held_item = held_item, None
+                        elif not chunk:
+                            item = buffer.get()
+                        else:
+                            # No esperar a completar el grupo si la lectura va por detrás
+                            try:
+                                item = buffer.get_nowait()
+                            except queue.Empty:
+                                break
+                        if item is _DONE:
+                            exhausted = True
+                            break
+                        name, data, error = item
+                        if error is not None:
+                            yield _error_record(name, error)
+                            continue
+                        if chunk_size > 1 and len(data) > chunk_max_bytes:
+                            # Imagen grande: va sola por el camino de una imagen
+                            if chunk:
+                                held_item = item
+                            else:
+                                chunk.append((name, data))
+                            break
+                        chunk.append((name, data))
+                    if not chunk:
+                        continue
+                try:
+                    if len(chunk) == 1 and (chunk_size == 1 or len(chunk[0][1]) > chunk_max_bytes):
+                        future = engine.submit(process_batch_item, chunk[0][0], chunk[0][1],
+                                               threshold1, threshold2, output_dir)
+                    else:
+                        future = engine.submit(process_batch_chunk, chunk, threshold1, threshold2, output_dir)
+                except EngineSaturated:
+                    # El motor está ocupado por otras peticiones: reintentar cuando termine algo
+                    pending_chunk = chunk
+                    if not in_flight:
+                        time.sleep(0.05)
+                    break
+                in_flight[future] = [name for name, _ in chunk]
+
+            if not in_flight:
+                if exhausted and pending_chunk is None:
+                    return
+                continue
+
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                names = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    for name in names:
+                        yield _error_record(name, e)
+                    continue
+                if isinstance(result, list):
+                    yield from result
+                else:
+                    yield result
+    finally:
+        stop.set()
+        for future in in_flight:
+            future.cancel()
+        # Desbloquear el hilo de lectura si estaba esperando hueco en la cola
+        while reader.is_alive():
+            try:
+                buffer.get_nowait()
+            except queue.Empty:
+                reader.join(timeout=0.05)
+
+
+class ManifestWriter:
+    """
+    Manifiesto de resultados en CSV o JSONL (según la extensión), abierto en modo append
+    
+    Args:
+        path: Ruta del manifiesto
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.format = 'csv' if path.lower().endswith('.csv') else 'jsonl'
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'a', encoding='utf-8', newline='')
+        self._csv = None
+        if self.format == 'csv':
+            self._csv = csv.DictWriter(self._file, fieldnames=MANIFEST_FIELDS)
+            if is_new:
+                self._csv.writeheader()
+
+    def write(self, record: dict):
+        """Añade un registro y lo vuelca a disco (para poder reanudar tras una interrupción)"""
+        if self._csv is not None:
+            self._csv.writerow({field: record.get(field) for field in MANIFEST_FIELDS})
+        else:
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def load_completed(manifest_path: str) -> Set[str]:
+    """
+    Nombres procesados con éxito en un manifiesto existente
+    
+    Args:
+        manifest_path: Ruta del manifiesto CSV o JSONL
+    
+    Returns:
+        Conjunto de nombres a saltar al reanudar
+    """
+    completed = set()
+    if not os.path.exists(manifest_path):
+        return completed
+    with open(manifest_path, 'r', encoding='utf-8', newline='') as f:
+        if manifest_path.lower().endswith('.csv'):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            try:
+                if row.get('status') == 'ok':
+                    completed.add(row['name'])
+            except (AttributeError, KeyError):
+                continue
+    return completed
+
+
+def main(argv=None):
+    """Punto de entrada de la línea de comandos"""
+    parser = argparse.ArgumentParser(description='Canny Edge Detection por lotes')
+    parser.add_argument('input', help='Directorio, archivo zip/tar o fichero .txt con una ruta por línea')
+    parser.add_argument('--output', '-o', help='Carpeta donde guardar las imágenes de bordes')
+    parser.add_argument('--manifest', '-m', default='manifest.jsonl', help='Manifiesto de resultados (.csv o .jsonl)')
+    parser.add_argument('--threshold-low', type=int, default=100, help='Umbral Bajo (por defecto: 100)')
+    parser.add_argument('--threshold-high', type=int, default=200, help='Umbral Alto (por defecto: 200)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Procesos trabajadores')
+    parser.add_argument('--prefetch', type=int, default=16, help='Imágenes leídas por adelantado')
+    parser.add_argument('--chunk-size', type=int, default=16,
+                        help='Imágenes pequeñas agrupadas por trabajo con el kernel por lotes (1 lo desactiva)')
+    parser.add_argument('--no-resume', action='store_true', help='No saltar las imágenes ya presentes en el manifiesto')
+    args = parser.parse_args(argv)
+
+    if args.threshold_low < 0 or args.threshold_low >= args.threshold_high:
+        parser.error('Umbrales inválidos. Umbral Bajo debe ser menor que Umbral Alto')
+
+    skip = set() if args.no_resume else load_completed(args.manifest)
+    if skip:
+        print(f"Reanudando: {len(skip)} imágenes ya procesadas", file=sys.stderr)
+
+    engine = ProcessingEngine(mode='process', workers=args.workers, max_pending=args.workers * 2)
+    manifest = ManifestWriter(args.manifest)
+    processed = errors = 0
+    start = time.perf_counter()
+    try:
+        for record in process_batch(
+            iter_source(args.input),
+            engine,
+            threshold1=args.threshold_low,
+            threshold2=args.threshold_high,
+            output_dir=args.output,
+            max_in_flight=args.workers * 2,
+            prefetch=args.prefetch,
+            skip=skip,
+            chunk_size=max(1, args.chunk_size)
+        ):
+            manifest.write(record)
+            processed += 1
+            if record['status'] != 'ok':
+                errors += 1
+            if processed % 100 == 0:
+                rate = processed / (time.perf_counter() - start)
+                print(f"{processed} imágenes ({errors} errores) - {rate:.1f} img/s", file=sys.stderr)
+    except KeyboardInterrupt:
+        print("Interrumpido: vuelva a ejecutar el mismo comando para reanudar", file=sys.stderr)
+        return 130
+    finally:
+        manifest.close()
+        engine.shutdown(wait=False)
+
+    elapsed = time.perf_counter() - start
+    print(f"Completado: {processed} imágenes ({errors} errores) en {elapsed:.1f} s", file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,389 @@
+"""
+Benchmarks reproducibles del pipeline de imágenes y de los endpoints HTTP
+Genera imágenes sintéticas deterministas a varias resoluciones, mide cada etapa
+por separado y lanza carga concurrente contra /api/process y /api/process-realtime
+con el cliente de pruebas de Flask:
+
+    python benchmark.py --sizes 640x480,1920x1080 --output baseline.json
+    python benchmark.py --compare baseline.json --tolerance 0.15
+    python benchmark.py --verify
+
+Informa p50/p95/p99, rendimiento y pico de RSS, y guarda los resultados en JSON
+para compararlos entre ejecuciones (código de salida 1 si hay regresiones).
+Con --verify solo comprueba que los caminos optimizados coinciden píxel a píxel
+con el pipeline imagen a imagen (código de salida 1 si alguno difiere).
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+import config
+import image_processor
+from batch_kernel import detect_edges_batch
+from edge_backends import backend_names, backends_info, detect_edges
+from image_processor import (
+    apply_canny_edge_detection,
+    decode_image_bytes,
+    detect_image_edges,
+    encode_edges_png,
+    encode_image_to_base64,
+    process_realtime_frame,
+    save_result_image
+)
+
+# Métricas comparadas entre ejecuciones: (nombre, True si mayor es peor)
+COMPARED_METRICS = (('p50_ms', True), ('p95_ms', True), ('throughput', False))
+
+# Kernels Gaussianos y tamaños (ancho, alto) de las comprobaciones de equivalencia
+VERIFY_KERNELS = ((3, 3), (5, 5), (7, 7), (9, 9), (0, 0))
+VERIFY_SIZES = ((1, 1), (2, 3), (3, 2), (4, 4), (5, 9), (17, 6), (64, 48), (100, 75), (33, 128))
+
+
+def synthetic_image(width: int, height: int, seed: int = 0) -> np.ndarray:
+    """
+    Imagen BGR sintética y determinista: figuras geométricas sobre un degradado con ruido
+
+    Args:
+        width: Ancho en píxeles
+        height: Alto en píxeles
+        seed: Semilla del generador
+
+    Returns:
+        Imagen BGR
+    """
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(40, 200, width, dtype=np.float32)
+    image = np.repeat(np.tile(gradient, (height, 1))[:, :, None], 3, axis=2)
+    image = image.astype(np.uint8)
+    shapes = max(8, (width * height) // 20000)
+    for _ in range(shapes):
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        size = int(rng.integers(8, max(9, min(width, height) // 6)))
+        if rng.random() < 0.5:
+            cv2.circle(image, (x, y), size, color, -1)
+        else:
+            cv2.rectangle(image, (x, y), (x + size, y + size), color, -1)
+    noise = rng.normal(0, 6, image.shape)
+    return np.clip(image + noise, 0, 255).astype(np.uint8)
+
+
+def peak_rss_mb() -> float:
+    """Pico de memoria residente del proceso en MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa en KB y macOS en bytes
+    return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+def summarize(latencies: List[float], elapsed: float) -> dict:
+    """
+    Resume una serie de latencias
+
+    Args:
+        latencies: Duraciones en segundos
+        elapsed: Tiempo total de pared de la serie
+
+    Returns:
+        Diccionario con percentiles (ms), media, rendimiento (op/s) y pico de RSS
+    """
+    values = np.array(latencies) * 1000
+    return {
+        'count': len(latencies),
+        'mean_ms': round(float(values.mean()), 3),
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'p95_ms': round(float(np.percentile(values, 95)), 3),
+        'p99_ms': round(float(np.percentile(values, 99)), 3),
+        'throughput': round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+
+def time_calls(fn: Callable, iterations: int, warmup: int = 2) -> dict:
+    """Mide una función sin argumentos ejecutada secuencialmente"""
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        begin = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - begin)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def time_concurrent(fn: Callable[[int], None], requests: int, concurrency: int, warmup: int = 2) -> dict:
+    """Mide una función ejecutada requests veces desde concurrency hilos (recibe el índice del hilo)"""
+    for _ in range(warmup):
+        fn(0)
+
+    def timed(index):
+        begin = time.perf_counter()
+        fn(index % concurrency)
+        return time.perf_counter() - begin
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(timed, range(requests)))
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def bench_stages(sizes: List[Tuple[int, int]], iterations: int, workdir: str) -> Dict[str, dict]:
+    """Mide cada etapa del pipeline por separado a cada resolución"""
+    results = {}
+    image_processor.RESULT_FOLDER = workdir
+    for width, height in sizes:
+        label = f'{width}x{height}'
+        image = synthetic_image(width, height)
+        image_path = os.path.join(workdir, f'input_{label}.png')
+        cv2.imwrite(image_path, image)
+        image_bytes = cv2.imencode('.png', image)[1].tobytes()
+        frame_bytes = cv2.imencode('.jpg', image)[1].tobytes()
+        gray, edges = detect_image_edges(image, 100, 200)
+        result_name = f'result_{label}.png'
+        result_path = save_result_image(image, gray, edges, result_name)
+
+        stages = {
+            'decode_image_bytes': lambda: decode_image_bytes(image_bytes),
+            'detect_image_edges': lambda: detect_image_edges(image, 100, 200),
+            'apply_canny_edge_detection': lambda: apply_canny_edge_detection(image_path, 100, 200),
+            'save_result_image': lambda: save_result_image(image, gray, edges, result_name),
+            'encode_edges_png': lambda: encode_edges_png(edges),
+            'encode_image_to_base64': lambda: encode_image_to_base64(result_path),
+            'process_realtime_frame': lambda: process_realtime_frame(frame_bytes, width, height, 100, 200)
+        }
+        # Cada backend de bordes por separado sobre la misma imagen en grises
+        for backend in backend_names():
+            stages[f'detect_edges[{backend}]'] = lambda backend=backend: detect_edges(gray, 100, 200, backend)
+        for name, fn in stages.items():
+            results[f'stage/{name}/{label}'] = time_calls(fn, iterations)
+            print(f"  {name} {label}: p50 {results[f'stage/{name}/{label}']['p50_ms']} ms", file=sys.stderr)
+    return results
+
+
+def bench_endpoints(sizes: List[Tuple[int, int]], requests: int, concurrency: int, workdir: str) -> Dict[str, dict]:
+    """Carga concurrente contra /api/process y /api/process-realtime con el cliente de pruebas de Flask"""
+    from flask import Flask
+    import routes
+
+    # Sin caché: cada petición debe recorrer el pipeline completo
+    config.RESULT_CACHE_ENABLED = False
+    config.PERSIST_RESULTS = False
+    app = Flask(__name__)
+    app.config['MAX_CONTENT_LENGTH'] = config.MAX_FILE_SIZE
+    upload_folder = os.path.join(workdir, 'uploads')
+    result_folder = os.path.join(workdir, 'results')
+    os.makedirs(upload_folder, exist_ok=True)
+    os.makedirs(result_folder, exist_ok=True)
+    services = routes.init_routes(app, upload_folder, result_folder, config.ALLOWED_EXTENSIONS)
+    # La calibración y el calentamiento de los trabajadores no deben solaparse con las mediciones
+    services.warmup.wait()
+    clients = [app.test_client() for _ in range(concurrency)]
+
+    results = {}
+    for width, height in sizes:
+        label = f'{width}x{height}'
+        image = synthetic_image(width, height, seed=1)
+        png_bytes = cv2.imencode('.png', image)[1].tobytes()
+        jpg_bytes = cv2.imencode('.jpg', image)[1].tobytes()
+
+        def post_process(index):
+            response = clients[index].post('/api/process', data={
+                'file': (io.BytesIO(png_bytes), 'bench.png'),
+                'thresholdLow': '100',
+                'thresholdHigh': '200'
+            })
+            if response.status_code != 200:
+                raise RuntimeError(f'/api/process respondió {response.status_code}')
+
+        def post_realtime(index):
+            # Una sesión por hilo para que el planificador no descarte frames
+            response = clients[index].post('/api/process-realtime', data={
+                'frame': (io.BytesIO(jpg_bytes), 'frame.jpg'),
+                'width': str(width),
+                'height': str(height)
+            }, headers={'X-Session-Id': f'bench-{index}'})
+            if response.status_code != 200:
+                raise RuntimeError(f'/api/process-realtime respondió {response.status_code}')
+
+        for name, fn in (('api/process', post_process), ('api/process-realtime', post_realtime)):
+            key = f'endpoint/{name}/{label}'
+            results[key] = time_concurrent(fn, requests, concurrency)
+            print(f"  {name} {label}: p50 {results[key]['p50_ms']} ms, {results[key]['throughput']} req/s", file=sys.stderr)
+    services.close()
+    return results
+
+
+def verify_batch_kernel(threshold1: int = 100, threshold2: int = 200, sigma: float = 1.5) -> List[str]:
+    """
+    Comprueba que detect_edges_batch coincide con GaussianBlur + Canny imagen a imagen
+    con varios kernels, con lotes uniformes y mixtos, en color y en grises, e imágenes diminutas
+
+    Returns:
+        Lista de diferencias en texto (vacía si todo coincide)
+    """
+    mixed = [synthetic_image(width, height, seed) for seed, (width, height) in enumerate(VERIFY_SIZES)]
+    batches = {
+        'uniforme': [synthetic_image(64, 48, seed) for seed in range(6)],
+        'mixto': mixed,
+        'grises': [cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) for image in mixed],
+    }
+    mismatches = []
+    for kernel in VERIFY_KERNELS:
+        for name, images in batches.items():
+            # Atlas pequeño para que cada clase de tamaño ocupe varios atlas
+            edges, _ = detect_edges_batch(images, threshold1, threshold2, kernel, sigma,
+                                                    max_atlas_pixels=16 * 1024)
+            for index, image in enumerate(images):
+                gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+                expected = cv2.Canny(cv2.GaussianBlur(gray, kernel, sigma), threshold1, threshold2)
+                if not np.array_equal(edges[index], expected):
+                    differing = int(np.count_nonzero(edges[index] != expected))
+                    mismatches.append(f'batch kernel={kernel[0]}x{kernel[1]} lote={name} '
+                                      f'imagen {image.shape[1]}x{image.shape[0]}: {differing} píxeles distintos')
+    return mismatches
+
+
+def verify_backends(threshold_pairs=((100, 200), (10, 30), (200, 100))) -> List[str]:
+    """
+    Comprueba que los backends exactos disponibles coinciden con opencv en varios tamaños y umbrales
+
+    Returns:
+        Lista de diferencias en texto (vacía si todo coincide)
+    """
+    sizes = VERIFY_SIZES + ((640, 480),)
+    images = [cv2.cvtColor(synthetic_image(width, height, seed), cv2.COLOR_BGR2GRAY)
+              for seed, (width, height) in enumerate(sizes)]
+    exact = [info['name'] for info in backends_info()['backends']
+             if info['exact'] and info['available'] and info['name'] != 'opencv']
+    mismatches = []
+    for backend in exact:
+        for gray in images:
+            for threshold1, threshold2 in threshold_pairs:
+                expected = detect_edges(gray, threshold1, threshold2, 'opencv')
+                edges = detect_edges(gray, threshold1, threshold2, backend)
+                if not np.array_equal(edges, expected):
+                    differing = int(np.count_nonzero(edges != expected))
+                    mismatches.append(f'backend={backend} imagen {gray.shape[1]}x{gray.shape[0]} '
+                                      f'umbrales {threshold1}/{threshold2}: {differing} píxeles distintos')
+    return mismatches
+
+
+def compare(current: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """
+    Compara los resultados con una línea base
+
+    Args:
+        current: Resultados de esta ejecución
+        baseline: Resultados guardados
+        tolerance: Empeoramiento relativo admitido (0.1 = 10 %)
+
+    Returns:
+        Lista de regresiones en texto
+    """
+    regressions = []
+    for key, metrics in current.items():
+        reference = baseline.get(key)
+        if reference is None:
+            continue
+        for metric, higher_is_worse in COMPARED_METRICS:
+            old, new = reference.get(metric), metrics.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old if higher_is_worse else (old - new) / old
+            if change > tolerance:
+                regressions.append(f'{key} {metric}: {old} → {new} ({change:+.0%})')
+    return regressions
+
+
+def parse_sizes(value: str) -> List[Tuple[int, int]]:
+    """Convierte '640x480,1920x1080' en [(640, 480), (1920, 1080)]"""
+    sizes = []
+    for item in value.split(','):
+        width, height = item.lower().split('x')
+        sizes.append((int(width), int(height)))
+    return sizes
+
+
+def main(argv=None):
+    """Punto de entrada de la línea de comandos"""
+    parser = argparse.ArgumentParser(description='Benchmarks del pipeline Canny y de los endpoints')
+    parser.add_argument('--sizes', default='640x480,1280x720,1920x1080', help='Resoluciones (ANCHOxALTO separadas por comas)')
+    parser.add_argument('--iterations', type=int, default=20, help='Repeticiones por etapa')
+    parser.add_argument('--requests', type=int, default=40, help='Peticiones por endpoint y resolución')
+    parser.add_argument('--concurrency', type=int, default=4, help='Clientes concurrentes')
+    parser.add_argument('--only', choices=('stages', 'endpoints'), help='Ejecutar solo una parte')
+    parser.add_argument('--output', '-o', help='Guardar los resultados en este JSON')
+    parser.add_argument('--compare', help='JSON de línea base con el que comparar')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='Empeoramiento relativo admitido (por defecto: 0.10)')
+    parser.add_argument('--verify', action='store_true', help='Solo comprobar la equivalencia de los caminos optimizados')
+    args = parser.parse_args(argv)
+
+    if args.verify:
+        mismatches = verify_batch_kernel() + verify_backends()
+        for line in mismatches:
+            print(f"DIFERENCIA {line}", file=sys.stderr)
+        if mismatches:
+            return 1
+        print("Los caminos optimizados coinciden con el pipeline imagen a imagen", file=sys.stderr)
+        return 0
+
+    sizes = parse_sizes(args.sizes)
+    # Resultados comparables: el mismo número de hilos de OpenCV en cada ejecución
+    cv2.setNumThreads(cv2.getNumberOfCPUs())
+
+    results = {}
+    # Los mensajes del pipeline van a stderr para no mezclarse con el JSON
+    with tempfile.TemporaryDirectory(prefix='canny-bench-') as workdir, contextlib.redirect_stdout(sys.stderr):
+        if args.only != 'endpoints':
+            print("Etapas del pipeline:", file=sys.stderr)
+            results.update(bench_stages(sizes, args.iterations, workdir))
+        if args.only != 'stages':
+            print("Endpoints:", file=sys.stderr)
+            results.update(bench_endpoints(sizes, args.requests, args.concurrency, workdir))
+
+    report = {
+        'environment': {
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'processing_engine': config.PROCESSING_ENGINE
+        },
+        'parameters': vars(args),
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Resultados guardados en {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESIÓN {line}", file=sys.stderr)
+        if regressions:
+            return 1
+        print("Sin regresiones respecto a la línea base", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,7 @@
 """
 Archivo de configuración para la aplicación Flask
-Puedes modificar estos parámetros según tus necesidades
+Puedes modificar estos parámetros según tus necesidades o sobrescribirlos con
+variables de entorno CANNY_<NOMBRE> (p. ej. CANNY_PROCESSING_ENGINE=process).
 """
 
 import os
@@ -28,10 +29,114 @@ MAX_THRESHOLD = 500                       # Umbral máximo permitido
 GAUSSIAN_KERNEL = (5, 5)                  # Tamaño del kernel
 GAUSSIAN_SIGMA = 1.5                      # Sigma del kernel Gaussiano
 
+# ==================== CONFIGURACIÓN DE BACKENDS DE BORDES ====================
+EDGE_BACKEND = 'auto'                     # 'auto', 'opencv', 'numpy', 'sobel' u 'opencl' (las peticiones pueden fijar otro)
+EDGE_BACKEND_CALIBRATE = True             # Micro-benchmark al arrancar (en el calentamiento) para elegir el backend de 'auto'
+EDGE_BACKEND_CALIBRATION_SIZES = ((320, 240), (640, 480), (1280, 720), (1920, 1080))   # Tamaños medidos
+
 # ==================== CONFIGURACIÓN DE FLASK SERVER ====================
 SERVER_HOST = '0.0.0.0'                   # Host (0.0.0.0 = accesible desde cualquier IP)
 SERVER_PORT = 5000                        # Puerto
 THREADED = True                           # Ejecutar en modo multi-hilo
+SERVER_MODE = 'wsgi'                      # 'wsgi' (Flask con hilos) o 'asgi' (asyncio con uvicorn)
+SERVER_WORKERS = 1                        # Procesos del servidor (cada uno con su motor y sus cachés)
+ASGI_WSGI_THREADS = 64                    # Hilos para las rutas de Flask en modo ASGI
+ASGI_BODY_TIMEOUT = 60.0                  # Segundos máximos para recibir el cuerpo de una petición en modo ASGI
+ASGI_BODY_IDLE_TIMEOUT = 30.0             # Subidas de vídeo en modo ASGI: segundos máximos sin recibir datos (sin plazo total)
+ASGI_SPOOL_MEMORY_BYTES = 1024 * 1024     # Subidas de vídeo en modo ASGI: bytes en memoria antes de volcarlas a disco
+
+# ==================== CONFIGURACIÓN DE ARRANQUE ====================
+WARMUP_ENABLED = True                     # Calentar en segundo plano: calibración, trabajadores y un pipeline de prueba
+WARMUP_IMAGE_SIZE = (640, 480)            # Tamaño de la imagen sintética del calentamiento
+
+# ==================== CONFIGURACIÓN DEL MOTOR DE PROCESAMIENTO ====================
+PROCESSING_ENGINE = 'thread'              # 'thread' (OpenCV libera el GIL) o 'process'
+PROCESSING_WORKERS = os.cpu_count() or 1  # Trabajadores del pool
+PROCESSING_MAX_PENDING = PROCESSING_WORKERS * 4   # Límite de admisión (en ejecución + en cola); luego 503
+PROCESSING_TIMEOUT = 120.0                # Segundos máximos de espera por un trabajo
+
+# ==================== CONFIGURACIÓN DE PIPELINE EN MEMORIA ====================
+IN_MEMORY_PIPELINE = True                 # Decodificar/codificar en memoria, sin ficheros temporales
+PERSIST_UPLOADS = False                   # Guardar las subidas en UPLOAD_FOLDER (en segundo plano)
+PERSIST_RESULTS = True                    # Guardar montaje y bordes en RESULT_FOLDER (en segundo plano)
+PERSIST_WORKERS = 2                       # Hilos dedicados a escribir en disco
+
+# ==================== CONFIGURACIÓN DE DESCARGAS REMOTAS ====================
+URL_FETCH_TIMEOUT = 10.0                  # Segundos máximos por operación de red (conectar, cada lectura)
+URL_FETCH_DEADLINE = 30.0                 # Segundos máximos por descarga completa
+URL_FETCH_MAX_BYTES = MAX_FILE_SIZE       # Tamaño máximo de una imagen remota (se corta al recibir)
+URL_FETCH_POOL_SIZE = 4                   # Conexiones keep-alive inactivas conservadas por host
+URL_FETCH_CACHE_BYTES = 64 * 1024 * 1024  # Caché de descargas revalidada con ETag/Last-Modified (0 = desactivada)
+
+# ==================== CONFIGURACIÓN DE ALMACENAMIENTO ====================
+STORAGE_TTL = 7 * 24 * 3600               # Segundos desde la última escritura antes de borrar una subida o resultado (0 = nunca)
+STORAGE_UPLOAD_MAX_BYTES = 2 * 1024 * 1024 * 1024    # Cuota de UPLOAD_FOLDER: se borran primero los más antiguos (0 = sin cuota)
+STORAGE_RESULT_MAX_BYTES = 4 * 1024 * 1024 * 1024    # Cuota de RESULT_FOLDER (sin contar la caché de resultados)
+STORAGE_SWEEP_INTERVAL = 300.0            # Segundos entre pasadas de expulsión en segundo plano (0 = desactivadas)
+STORAGE_MAX_AGE = 24 * 3600               # Cache-Control max-age de /files (el contenido de un nombre no cambia)
+
+# ==================== CONFIGURACIÓN DE CACHÉ DE RESULTADOS ====================
+RESULT_CACHE_ENABLED = True               # Reutilizar resultados de imágenes y parámetros repetidos
+RESULT_CACHE_MEMORY_BYTES = 64 * 1024 * 1024     # Presupuesto del LRU en memoria: 64 MB
+RESULT_CACHE_DISK_BYTES = 1024 * 1024 * 1024     # Presupuesto en disco (RESULT_FOLDER/cache): 1 GB
+
+# ==================== CONFIGURACIÓN DE RENDITIONS ====================
+LAZY_RENDITIONS = True                    # JSON/multipart sin montaje: se genera bajo demanda en /api/results/<id>/<rendition>
+RENDITION_TTL = 600.0                     # Segundos sin uso antes de liberar un resultado y sus renditions
+RENDITION_MAX_BYTES = 512 * 1024 * 1024   # Memoria máxima para resultados y renditions generadas
+
+# ==================== CONFIGURACIÓN DE BARRIDO DE UMBRALES ====================
+PREPARED_IMAGE_TTL = 600.0                # Segundos sin uso antes de liberar una imagen preparada
+PREPARED_IMAGE_MAX_BYTES = 512 * 1024 * 1024     # Memoria máxima para imágenes preparadas
+SWEEP_MAX_THRESHOLDS = 64                 # Pares de umbrales máximos por petición
+
+# ==================== CONFIGURACIÓN DE ANALÍTICA ====================
+ANALYTICS_MAX_ROIS = 100000               # Regiones de interés máximas por petición en /api/analytics
+ANALYTICS_MAX_GRID = 512                  # Filas, columnas o bandas máximas de la rejilla
+ANALYTICS_MAX_BINS = 180                  # Intervalos máximos del histograma de orientaciones
+ANALYTICS_MAX_COORDINATE = 1 << 20        # |x|, |y|, ancho y alto máximos de una región de interés (si no, 400)
+
+# ==================== CONFIGURACIÓN DE LOTES ====================
+BATCH_MAX_FILES = 10000                   # Imágenes máximas por lote en /api/batch
+BATCH_MAX_IN_FLIGHT = PROCESSING_WORKERS  # Imágenes de un mismo lote procesándose a la vez
+BATCH_PREFETCH = 8                        # Imágenes leídas por adelantado
+BATCH_CHUNK_SIZE = 16                     # Imágenes pequeñas agrupadas por trabajo (1 desactiva el kernel por lotes)
+BATCH_CHUNK_MAX_BYTES = 1024 * 1024       # Imágenes mayores (en bytes) se procesan solas
+
+# ==================== CONFIGURACIÓN DE TRABAJOS ASÍNCRONOS ====================
+JOB_WORKERS = PROCESSING_WORKERS          # Trabajos asíncronos ejecutándose a la vez
+JOB_MAX_QUEUED = 64                       # Trabajos en espera admitidos (503 si se supera)
+JOB_RESULT_TTL = 600.0                    # Segundos que se conserva un trabajo terminado
+JOB_RESULT_MAX_BYTES = 256 * 1024 * 1024  # Bytes de resultados terminados en memoria (se eliminan los trabajos más antiguos)
+JOB_MAX_WAIT = 30.0                       # Segundos máximos de long-poll en /api/jobs/<id>?wait=
+
+# ==================== CONFIGURACIÓN DE VÍDEO ====================
+VIDEO_MAX_FILE_SIZE = 1024 * 1024 * 1024  # Máximo tamaño de un vídeo subido a /api/video: 1 GB (se vuelca a disco)
+VIDEO_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'webm', 'mpg', 'mpeg', 'm4v'}
+VIDEO_OUTPUT_EXTENSION = '.mp4'           # Contenedor del vídeo de bordes
+VIDEO_FOURCC = 'mp4v'                     # Códec del vídeo de bordes (debe estar en la compilación de OpenCV)
+VIDEO_JOB_WORKERS = 1                     # Vídeos procesándose a la vez (cada uno reparte sus frames en el motor)
+VIDEO_MAX_QUEUED = 16                     # Vídeos en espera admitidos (503 si se supera)
+VIDEO_MAX_IN_FLIGHT = PROCESSING_WORKERS  # Frames de un mismo vídeo en el motor a la vez (memoria acotada)
+VIDEO_MAX_FRAME_STEP = 1000               # Máximo de frame_step (procesar uno de cada N frames)
+
+# ==================== CONFIGURACIÓN DE IMÁGENES GRANDES ====================
+TILED_PROCESSING_PIXELS = 24_000_000      # Píxeles a partir de los cuales se procesa por mosaicos
+TILE_MEMORY_BUDGET = 512 * 1024 * 1024    # Memoria máxima por imagen grande (bytes)
+TILE_HALO = 32                            # Píxeles de solapamiento entre mosaicos
+PREVIEW_MAX_SIDE = 2048                   # Lado mayor del montaje de vista previa
+
+# ==================== CONFIGURACIÓN DE TIEMPO REAL ====================
+REALTIME_WORKERS = min(8, os.cpu_count() or 1)   # Frames procesándose a la vez (todas las sesiones)
+REALTIME_FRAME_TIMEOUT = 5.0              # Segundos máximos de espera por un frame
+REALTIME_MAX_FRAME_SIDE = 4096            # Ancho y alto máximos de un frame (width/height de las peticiones)
+REALTIME_SESSION_TTL = 60.0               # Segundos de inactividad antes de olvidar una sesión
+REALTIME_INCREMENTAL = True               # Recalcular solo los mosaicos que cambiaron entre frames
+REALTIME_TILE_SIZE = 32                   # Lado de los mosaicos del modo incremental
+REALTIME_CHANGE_THRESHOLD = 16            # Diferencia de gris que cuenta como cambio (por encima del ruido)
+REALTIME_TEMPORAL_SMOOTHING = 0.0         # Peso del pasado para reducir parpadeo (0 = desactivado)
+REALTIME_ADAPTIVE = True                  # Recomendar resolución/fps/calidad según la carga del servidor
+REALTIME_ADAPTIVE_COOLDOWN = 15           # Frames mínimos entre dos cambios de nivel
 
 # ==================== CONFIGURACIÓN DE RESULTADOS ====================
 RESULT_DPI = 100                          # DPI de las imágenes de resultado
@@ -39,8 +144,11 @@ RESULT_FORMAT = 'PNG'                     # Formato de las imágenes
 OVERLAY_ALPHA = 0.3                       # Opacidad del overlay de bordes
 
 # ==================== CONFIGURACIÓN DE LOGGING ====================
-LOG_LEVEL = 'DEBUG'                       # Nivel de logging
-LOG_FILE = 'app.log'                      # Archivo de log
+LOG_LEVEL = 'INFO'                        # Nivel de logging (DEBUG registra cada petición)
+LOG_FILE = 'app.log'                      # Archivo de log (None para solo consola)
+
+# ==================== CONFIGURACIÓN DE MÉTRICAS ====================
+SERVER_TIMING_HEADER = True               # Añadir la cabecera Server-Timing con los tiempos por etapa
 
 # ==================== CONFIGURACIÓN DE SESIÓN ====================
 SESSION_COOKIE_SECURE = False              # True para HTTPS
@@ -55,6 +163,38 @@ PRESET_THRESHOLDS = {
     'objetos_definidos': {'threshold1': 80, 'threshold2': 240, 'description': 'Buen balance para contornos claros'},
 }
 
+def configure_logging():
+    """
+    Configura el logging con LOG_LEVEL y LOG_FILE
+    Los mensajes se encolan y un hilo aparte los escribe, para que la consola
+    o el disco no bloqueen los hilos de petición. Solo configura la primera vez
+    (create_app() puede llamarse varias veces en un mismo proceso).
+    """
+    global _log_listener
+    if _log_listener is not None:
+        return
+    import atexit
+    import logging
+    import logging.handlers
+    import queue
+
+    formatter = logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s')
+    handlers = [logging.StreamHandler()]
+    if LOG_FILE:
+        handlers.append(logging.FileHandler(LOG_FILE, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    listener.start()
+    atexit.register(listener.stop)
+    _log_listener = listener
+
+
 def init_app(app):
     """Inicializar la aplicación con la configuración"""
     # Crear carpetas si no existen
@@ -66,3 +206,60 @@ def init_app(app):
     app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
     app.config['SECRET_KEY'] = SECRET_KEY
     app.config['THREADED'] = THREADED
+    app.config['SESSION_COOKIE_SECURE'] = SESSION_COOKIE_SECURE
+    app.config['SESSION_COOKIE_HTTPONLY'] = SESSION_COOKIE_HTTPONLY
+    app.config['SESSION_COOKIE_SAMESITE'] = SESSION_COOKIE_SAMESITE
+
+
+def _parse_environment_value(name: str, raw: str, default):
+    """Convierte el valor de una variable de entorno al tipo del valor por defecto"""
+    import json
+
+    try:
+        if isinstance(default, bool):
+            if raw.lower() not in ('1', 'true', 'yes', 'on', '0', 'false', 'no', 'off'):
+                raise ValueError(raw)
+            return raw.lower() in ('1', 'true', 'yes', 'on')
+        if isinstance(default, int):
+            return int(raw)
+        if isinstance(default, float):
+            return float(raw)
+        if isinstance(default, (tuple, list, set, dict)):
+            value = json.loads(raw)
+            if isinstance(default, tuple):
+                return tuple(tuple(item) if isinstance(item, list) else item for item in value)
+            return type(default)(value)
+    except ValueError:
+        raise ValueError(f"Valor no válido en {ENV_PREFIX}{name}: {raw!r}")
+    # Cadenas: vacío = None (p. ej. CANNY_LOG_FILE= para registrar solo en consola)
+    return raw if raw != '' else None
+
+
+def load_environment(environ=None):
+    """
+    Sobrescribe la configuración con las variables de entorno ENV_PREFIX + nombre
+    Se ejecuta al importar el módulo, así que los procesos trabajadores (que lo
+    importan de nuevo) ven la misma configuración que el proceso principal.
+    """
+    environ = os.environ if environ is None else environ
+    settings = globals()
+    for name, default in list(settings.items()):
+        if name.isupper() and ENV_PREFIX + name in environ:
+            settings[name] = _parse_environment_value(name, environ[ENV_PREFIX + name], default)
+    # Los valores derivados siguen a sus bases sobrescritas, salvo que se fijen explícitamente
+    for name, derive in _DERIVED.items():
+        if ENV_PREFIX + name not in environ:
+            settings[name] = derive()
+
+
+ENV_PREFIX = 'CANNY_'
+_log_listener = None
+# Ajustes cuyo valor por defecto sale de otros ajustes (se recalculan tras leer el entorno)
+_DERIVED = {
+    'PROCESSING_MAX_PENDING': lambda: PROCESSING_WORKERS * 4,
+    'URL_FETCH_MAX_BYTES': lambda: MAX_FILE_SIZE,
+    'BATCH_MAX_IN_FLIGHT': lambda: PROCESSING_WORKERS,
+    'JOB_WORKERS': lambda: PROCESSING_WORKERS,
+    'VIDEO_MAX_IN_FLIGHT': lambda: PROCESSING_WORKERS,
+}
+load_environment()
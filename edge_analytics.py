@@ -0,0 +1,297 @@
+"""
+Analítica de mapas de bordes
+Se construye una sola vez una tabla de sumas (imagen integral) del mapa de bordes;
+a partir de ella el número de píxeles de borde de cualquier rectángulo sale con
+cuatro lecturas, así que miles de regiones de interés, rejillas y bandas se
+responden en tiempo O(1) por consulta. También cuenta contornos y calcula el
+histograma de orientaciones del gradiente en los píxeles de borde.
+"""
+
+import json
+from typing import Mapping, Optional
+
+import cv2
+import numpy as np
+
+from edge_backends import gaussian_params
+from image_processor import decode_image_bytes, detect_image_edges
+from metrics import StageTimer
+
+
+class EdgeIntegral:
+    """
+    Imagen integral de un mapa de bordes
+    
+    Args:
+        edges: Imagen de bordes (cualquier valor distinto de 0 es borde)
+    """
+
+    def __init__(self, edges: np.ndarray):
+        self.height, self.width = edges.shape[:2]
+        # 0/1 en uint8: la tabla cuenta píxeles (int32 basta para 2^31 píxeles)
+        _, binary = cv2.threshold(edges, 0, 1, cv2.THRESH_BINARY)
+        self.table = cv2.integral(binary, sdepth=cv2.CV_32S)
+
+    @property
+    def total(self) -> int:
+        """Píxeles de borde de toda la imagen"""
+        return int(self.table[-1, -1])
+
+    def count(self, x: int, y: int, width: int, height: int) -> int:
+        """Píxeles de borde de un rectángulo (recortado a la imagen)"""
+        return int(self.counts(np.array([[x, y, width, height]]))[0][0])
+
+    def counts(self, rects: np.ndarray):
+        """
+        Píxeles de borde de varios rectángulos a la vez
+        
+        Args:
+            rects: Matriz N x 4 con (x, y, ancho, alto); se recortan a la imagen
+        
+        Returns:
+            Tupla (píxeles de borde, área recortada) como vectores de N elementos
+        """
+        rects = np.asarray(rects, dtype=np.int64).reshape(-1, 4)
+        x0 = np.clip(rects[:, 0], 0, self.width)
+        y0 = np.clip(rects[:, 1], 0, self.height)
+        x1 = np.clip(rects[:, 0] + rects[:, 2], x0, self.width)
+        y1 = np.clip(rects[:, 1] + rects[:, 3], y0, self.height)
+        table = self.table
+        counts = table[y1, x1] - table[y0, x1] - table[y1, x0] + table[y0, x0]
+        return counts, (x1 - x0) * (y1 - y0)
+
+    def grid(self, rows: int, cols: int):
+        """
+        Píxeles de borde de cada celda de una rejilla que cubre la imagen
+        
+        Returns:
+            Tupla (píxeles de borde, área) como matrices rows x cols
+        """
+        ys = np.linspace(0, self.height, rows + 1).round().astype(np.int64)
+        xs = np.linspace(0, self.width, cols + 1).round().astype(np.int64)
+        corners = self.table[np.ix_(ys, xs)].astype(np.int64)
+        counts = corners[1:, 1:] - corners[:-1, 1:] - corners[1:, :-1] + corners[:-1, :-1]
+        return counts, np.outer(np.diff(ys), np.diff(xs))
+
+
+def percentages(counts: np.ndarray, areas: np.ndarray) -> np.ndarray:
+    """Porcentaje de bordes con dos decimales (0 en áreas vacías)"""
+    result = np.zeros(np.shape(counts), dtype=np.float64)
+    np.divide(counts * 100.0, areas, out=result, where=np.asarray(areas) > 0)
+    return np.round(result, 2)
+
+
+def count_contours(edges: np.ndarray, min_length: float = 0.0) -> dict:
+    """
+    Cuenta los contornos externos del mapa de bordes
+    
+    Args:
+        edges: Imagen de bordes
+        min_length: Longitud mínima (perímetro en píxeles) para contar un contorno
+    
+    Returns:
+        Diccionario con count, min_length, mean_length y max_length
+    """
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    lengths = np.array([cv2.arcLength(contour, True) for contour in contours], dtype=np.float64)
+    lengths = lengths[lengths >= min_length]
+    return {
+        'count': int(lengths.size),
+        'min_length': min_length,
+        'mean_length': round(float(lengths.mean()), 2) if lengths.size else 0.0,
+        'max_length': round(float(lengths.max()), 2) if lengths.size else 0.0,
+    }
+
+
+def orientation_histogram(gray_image: np.ndarray, edges: np.ndarray, bins: int) -> dict:
+    """
+    Histograma de la orientación del gradiente (0-180°) en los píxeles de borde
+    Los gradientes se calculan sobre la imagen suavizada con el mismo kernel que la detección.
+    
+    Args:
+        gray_image: Imagen en escala de grises
+        edges: Imagen de bordes del mismo tamaño
+        bins: Número de intervalos
+    
+    Returns:
+        Diccionario con bins, bin_width (grados) y counts
+    """
+    kernel, sigma = gaussian_params()
+    blurred = cv2.GaussianBlur(gray_image, tuple(kernel), sigma)
+    gx = cv2.Sobel(blurred, cv2.CV_16S, 1, 0, ksize=3)
+    gy = cv2.Sobel(blurred, cv2.CV_16S, 0, 1, ksize=3)
+    # Solo los píxeles de borde: sin ángulos ni magnitudes de la imagen completa
+    ys, xs = np.nonzero(edges)
+    angles = np.degrees(np.arctan2(gy[ys, xs], gx[ys, xs])) % 180.0
+    indices = np.minimum((angles * (bins / 180.0)).astype(np.int64), bins - 1)
+    return {
+        'bins': bins,
+        'bin_width': round(180.0 / bins, 4),
+        'counts': np.bincount(indices, minlength=bins).tolist(),
+    }
+
+
+def parse_analytics_params(params: Mapping, max_rois: int, max_grid: int, max_bins: int,
+                           max_coordinate: int = 1 << 20) -> dict:
+    """
+    Valida las consultas de analítica de una petición
+    Los campos compuestos pueden llegar como JSON dentro de un formulario.
+    
+    Args:
+        params: rois ([[x, y, ancho, alto], ...]), grid ([filas, columnas] o 'FxC'),
+            bands (número de bandas horizontales y verticales), orientation_bins, contours
+            y min_contour_length
+        max_rois: Regiones de interés máximas por petición
+        max_grid: Filas, columnas o bandas máximas
+        max_bins: Intervalos máximos del histograma de orientaciones
+        max_coordinate: Valor absoluto máximo de x e y, y máximo de ancho y alto de una región
+            (x + ancho cabe siempre en int64)
+    
+    Returns:
+        Diccionario serializable con las consultas (para enviarlo a otro proceso)
+    
+    Raises:
+        ValueError: Si algún parámetro no es válido
+    """
+    def field(name):
+        value = params.get(name)
+        if isinstance(value, str) and value.strip()[:1] in ('[', '{'):
+            value = json.loads(value)
+        return None if value in (None, '') else value
+
+    query = {}
+    try:
+        rois = field('rois')
+        if rois is not None:
+            query['rois'] = [[int(v) for v in roi] for roi in rois]
+        grid = field('grid')
+        if grid is not None:
+            rows, cols = grid.lower().split('x') if isinstance(grid, str) else grid
+            query['grid'] = [int(rows), int(cols)]
+        if field('bands') is not None:
+            query['bands'] = int(field('bands'))
+        if field('orientation_bins') is not None:
+            query['orientation_bins'] = int(field('orientation_bins'))
+        if str(field('contours')).lower() in ('1', 'true', 'yes'):
+            query['min_contour_length'] = float(field('min_contour_length') or 0.0)
+    except (TypeError, ValueError, OverflowError) as e:
+        raise ValueError(f'Parámetros de analítica inválidos: {e}')
+
+    rois = query.get('rois', [])
+    if len(rois) > max_rois:
+        raise ValueError(f'Se admiten como máximo {max_rois} regiones de interés')
+    if any(len(roi) != 4 or roi[2] < 0 or roi[3] < 0 for roi in rois):
+        raise ValueError('Cada región de interés debe ser [x, y, ancho, alto] con tamaño no negativo')
+    if any(abs(roi[0]) > max_coordinate or abs(roi[1]) > max_coordinate
+           or roi[2] > max_coordinate or roi[3] > max_coordinate for roi in rois):
+        raise ValueError(f'Las coordenadas y el tamaño de las regiones de interés no pueden superar {max_coordinate}')
+    if not all(1 <= n <= max_grid for n in query.get('grid', []) + [query.get('bands', 1)]):
+        raise ValueError(f'Las filas, columnas y bandas deben estar entre 1 y {max_grid}')
+    if not 1 <= query.get('orientation_bins', 1) <= max_bins:
+        raise ValueError(f'orientation_bins debe estar entre 1 y {max_bins}')
+    return query
+
+
+def analyze_edges(edges: np.ndarray, gray_image: Optional[np.ndarray], query: dict,
+                  timer: Optional[StageTimer] = None) -> dict:
+    """
+    Responde las consultas de analítica sobre un mapa de bordes
+    
+    Args:
+        edges: Imagen de bordes
+        gray_image: Imagen en escala de grises (solo para el histograma de orientaciones)
+        query: Consultas validadas (ver parse_analytics_params)
+        timer: Temporizador por etapas (opcional)
+    
+    Returns:
+        Diccionario serializable con las estadísticas pedidas
+    """
+    timer = timer or StageTimer()
+    with timer.stage('integral'):
+        integral = EdgeIntegral(edges)
+
+    result = {
+        'image_width': integral.width,
+        'image_height': integral.height,
+        'edge_pixels': integral.total,
+        'edge_percentage': round(integral.total * 100.0 / max(integral.width * integral.height, 1), 2),
+    }
+    with timer.stage('regions'):
+        if 'rois' in query:
+            counts, areas = integral.counts(np.array(query['rois'], dtype=np.int64))
+            # Listas paralelas en el orden de la petición: compactas con miles de regiones
+            result['rois'] = {
+                'edge_pixels': counts.tolist(),
+                'edge_percentage': percentages(counts, areas).tolist(),
+            }
+        if 'grid' in query:
+            counts, areas = integral.grid(*query['grid'])
+            result['grid'] = {
+                'rows': query['grid'][0],
+                'cols': query['grid'][1],
+                'edge_pixels': counts.tolist(),
+                'edge_percentage': percentages(counts, areas).tolist(),
+            }
+        if 'bands' in query:
+            n = query['bands']
+            horizontal = integral.grid(n, 1)
+            vertical = integral.grid(1, n)
+            result['bands'] = {
+                'horizontal': percentages(*horizontal)[:, 0].tolist(),
+                'vertical': percentages(*vertical)[0].tolist(),
+            }
+    if 'min_contour_length' in query:
+        with timer.stage('contours'):
+            result['contours'] = count_contours(edges, query['min_contour_length'])
+    if 'orientation_bins' in query:
+        if gray_image is None:
+            raise ValueError('El histograma de orientaciones necesita la imagen original')
+        with timer.stage('orientation'):
+            result['orientation'] = orientation_histogram(gray_image, edges, query['orientation_bins'])
+    return result
+
+
+def analyze_image_bytes_job(image_bytes: bytes, threshold1: int, threshold2: int, query: dict,
+                            backend: Optional[str] = None) -> dict:
+    """
+    Detecta los bordes de una imagen en memoria y responde las consultas de analítica
+    
+    Args:
+        image_bytes: Contenido de la imagen subida
+        threshold1: Umbral Bajo para Canny
+        threshold2: Umbral Alto para Canny
+        query: Consultas validadas (ver parse_analytics_params)
+        backend: Backend de detección (None para el predeterminado)
+    
+    Returns:
+        Estadísticas y tiempos por etapa
+    """
+    timer = StageTimer()
+    with timer.stage('decode'):
+        image = decode_image_bytes(image_bytes)
+    gray_image, edges = detect_image_edges(image, threshold1, threshold2, timer, backend)
+    return dict(analyze_edges(edges, gray_image, query, timer), timings=timer.timings)
+
+
+def analyze_edges_png_job(edges_png: bytes, source_bytes: Optional[bytes], query: dict) -> dict:
+    """
+    Responde las consultas de analítica sobre un resultado ya procesado
+    La imagen original solo se decodifica si se pide el histograma de orientaciones.
+    
+    Args:
+        edges_png: Bordes codificados en PNG
+        source_bytes: Contenido de la imagen original (o None)
+        query: Consultas validadas (ver parse_analytics_params)
+    
+    Returns:
+        Estadísticas y tiempos por etapa
+    """
+    timer = StageTimer()
+    with timer.stage('decode'):
+        edges = cv2.imdecode(np.frombuffer(edges_png, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        if edges is None:
+            raise ValueError("No se pudieron decodificar los bordes")
+        gray_image = None
+        if 'orientation_bins' in query and source_bytes is not None:
+            gray_image = cv2.cvtColor(decode_image_bytes(source_bytes), cv2.COLOR_BGR2GRAY)
+    return dict(analyze_edges(edges, gray_image, query, timer), timings=timer.timings)
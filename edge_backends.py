@@ -0,0 +1,332 @@
+"""
+Backends intercambiables de detección de bordes
+Todos comparten la misma interfaz (suavizado Gaussiano + detector) y se registran
+por nombre:
+
+- opencv: cv2.GaussianBlur + cv2.Canny (referencia de producción)
+- numpy: gradientes, supresión de no máximos e histéresis en NumPy puro (prepared_images), idéntico a
+  opencv; solo el suavizado Gaussiano compartido usa OpenCV
+- sobel: umbral sobre la magnitud del gradiente, sin supresión ni histéresis (rápido, bordes gruesos)
+- opencl: cv2.UMat (transparent API); sin dispositivo OpenCL se ejecuta en la CPU
+
+Con 'auto' se elige el backend exacto más rápido para el tamaño de la imagen según
+un micro-benchmark ejecutado al arrancar; las peticiones pueden fijar uno concreto.
+"""
+
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from metrics import StageTimer
+from prepared_images import compute_gradients_numpy, hysteresis_numpy, non_max_suppression
+
+AUTO = 'auto'
+
+# Ventaja mínima que debe tener un candidato sobre el primero para elegirlo en 'auto'
+_CALIBRATION_MARGIN = 0.1
+
+logger = logging.getLogger(__name__)
+
+
+class EdgeBackend:
+    """
+    Interfaz común de los backends: suavizar y detectar bordes sobre una imagen en grises
+
+    Atributos:
+        name: Nombre con el que se registra y se fija desde las peticiones
+        exact: True si el resultado es idéntico a cv2.Canny (apto para 'auto' y para la caché)
+        description: Descripción breve para /api/backends
+    """
+
+    name = ''
+    exact = True
+    description = ''
+
+    def available(self) -> bool:
+        """Indica si el backend puede usarse en esta instalación"""
+        return True
+
+    def blur(self, gray_image: np.ndarray, kernel: Tuple[int, int], sigma: float):
+        return cv2.GaussianBlur(gray_image, tuple(kernel), sigma)
+
+    def edges(self, blurred_image, threshold1: int, threshold2: int) -> np.ndarray:
+        raise NotImplementedError
+
+    def detect(self, gray_image: np.ndarray, threshold1: int, threshold2: int, kernel=(5, 5),
+               sigma: float = 1.5, timer: Optional[StageTimer] = None) -> np.ndarray:
+        """
+        Suaviza y detecta los bordes de una imagen en escala de grises
+
+        Args:
+            gray_image: Imagen en escala de grises
+            threshold1: Umbral Bajo
+            threshold2: Umbral Alto
+            kernel: Tamaño del kernel Gaussiano
+            sigma: Sigma del kernel Gaussiano
+            timer: Temporizador por etapas (opcional)
+
+        Returns:
+            Imagen de bordes (0/255)
+        """
+        timer = timer or StageTimer()
+        with timer.stage('blur'):
+            blurred_image = self.blur(gray_image, kernel, sigma)
+        with timer.stage('canny'):
+            return self.edges(blurred_image, threshold1, threshold2)
+
+    def info(self) -> dict:
+        return {'name': self.name, 'exact': self.exact, 'available': self.available(), 'description': self.description}
+
+
+class OpenCVBackend(EdgeBackend):
+    name = 'opencv'
+    description = 'cv2.GaussianBlur + cv2.Canny'
+
+    def edges(self, blurred_image, threshold1, threshold2):
+        return cv2.Canny(blurred_image, threshold1, threshold2)
+
+
+class NumpyBackend(EdgeBackend):
+    name = 'numpy'
+    description = 'Sobel, supresión de no máximos e histéresis en NumPy puro (referencia; suavizado con OpenCV)'
+
+    def edges(self, blurred_image, threshold1, threshold2):
+        gx, gy, magnitude = compute_gradients_numpy(blurred_image)
+        return hysteresis_numpy(non_max_suppression(gx, gy, magnitude), threshold1, threshold2)
+
+
+class SobelBackend(EdgeBackend):
+    name = 'sobel'
+    exact = False
+    description = 'Magnitud Sobel por encima del Umbral Alto (sin adelgazar; más rápido)'
+
+    def edges(self, blurred_image, threshold1, threshold2):
+        gx = cv2.Sobel(blurred_image, cv2.CV_16S, 1, 0, ksize=3, borderType=cv2.BORDER_REPLICATE)
+        gy = cv2.Sobel(blurred_image, cv2.CV_16S, 0, 1, ksize=3, borderType=cv2.BORDER_REPLICATE)
+        # Magnitud L1 como cv2.Canny; |gx| + |gy| <= 2040 cabe en int16
+        magnitude = cv2.add(cv2.absdiff(gx, 0), cv2.absdiff(gy, 0))
+        return cv2.compare(magnitude, float(max(threshold1, threshold2)), cv2.CMP_GT)
+
+
+class OpenCLBackend(EdgeBackend):
+    name = 'opencl'
+    description = 'cv2.UMat (OpenCL si hay dispositivo, si no CPU)'
+
+    def blur(self, gray_image, kernel, sigma):
+        return cv2.GaussianBlur(cv2.UMat(gray_image), tuple(kernel), sigma)
+
+    def edges(self, blurred_image, threshold1, threshold2):
+        return cv2.Canny(blurred_image, threshold1, threshold2).get()
+
+    def info(self):
+        return dict(super().info(), accelerated=bool(cv2.ocl.haveOpenCL() and cv2.ocl.useOpenCL()))
+
+
+_BACKENDS: Dict[str, EdgeBackend] = OrderedDict()
+
+# Configuración del proceso: se replica en los procesos trabajadores del motor
+_settings = {
+    'default': AUTO,
+    'kernel': (5, 5),
+    'sigma': 1.5,
+    'choices': ()       # ((píxeles, backend), ...) medidos por calibrate
+}
+
+
+def register_backend(backend: EdgeBackend) -> EdgeBackend:
+    """Registra (o reemplaza) un backend por su nombre"""
+    _BACKENDS[backend.name] = backend
+    return backend
+
+
+for _backend in (OpenCVBackend(), NumpyBackend(), SobelBackend(), OpenCLBackend()):
+    register_backend(_backend)
+
+
+def backend_names() -> List[str]:
+    """Nombres admitidos en las peticiones, incluido 'auto'"""
+    return [AUTO] + list(_BACKENDS)
+
+
+def validate_backend_name(name: Optional[str]) -> str:
+    """
+    Valida el backend pedido
+
+    Args:
+        name: Nombre pedido (None o vacío para el predeterminado)
+
+    Returns:
+        Nombre validado
+
+    Raises:
+        ValueError: si el backend no existe o no está disponible
+    """
+    if not name:
+        return _settings['default']
+    name = name.lower()
+    if name == AUTO:
+        return name
+    backend = _BACKENDS.get(name)
+    if backend is None:
+        raise ValueError(f'Backend no válido. Use: {", ".join(backend_names())}')
+    if not backend.available():
+        raise ValueError(f'El backend {name} no está disponible')
+    return name
+
+
+def is_exact(name: str) -> bool:
+    """True si el backend (o 'auto', que solo elige exactos) produce el mismo resultado que cv2.Canny"""
+    return name == AUTO or _BACKENDS[name].exact
+
+
+def configure_backends(default: str = AUTO, kernel=(5, 5), sigma: float = 1.5,
+                       choices: Optional[Sequence[Tuple[int, str]]] = None):
+    """
+    Configura el backend predeterminado y el kernel Gaussiano del proceso
+
+    Args:
+        default: Backend predeterminado ('auto' o un nombre registrado)
+        kernel: Tamaño del kernel Gaussiano
+        sigma: Sigma del kernel Gaussiano
+        choices: Tabla de 'auto' ((píxeles, backend), ...); None conserva la actual
+    """
+    _settings['default'] = validate_backend_name(default) if default != AUTO else AUTO
+    _settings['kernel'] = tuple(kernel)
+    _settings['sigma'] = float(sigma)
+    if choices is not None:
+        _settings['choices'] = tuple((int(pixels), name) for pixels, name in choices)
+
+
+def backend_settings() -> dict:
+    """Configuración actual (para replicarla en los procesos trabajadores con configure_backends)"""
+    return dict(_settings)
+
+
+def gaussian_params() -> Tuple[Tuple[int, int], float]:
+    """Kernel y sigma Gaussianos configurados"""
+    return _settings['kernel'], _settings['sigma']
+
+
+def select_backend(width: int, height: int, name: Optional[str] = None) -> EdgeBackend:
+    """
+    Resuelve el backend para una imagen
+
+    Args:
+        width: Ancho de la imagen
+        height: Alto de la imagen
+        name: Backend pedido (None para el predeterminado, 'auto' para el más rápido medido)
+
+    Returns:
+        Backend a usar
+    """
+    name = name or _settings['default']
+    if name != AUTO:
+        return _BACKENDS[name]
+    choices = _settings['choices']
+    if not choices:
+        return _BACKENDS['opencv']
+    # Tamaño calibrado más cercano en escala logarítmica
+    pixels = max(1, width * height)
+    _, chosen = min(choices, key=lambda choice: abs(math.log(pixels / choice[0])))
+    return _BACKENDS[chosen]
+
+
+def detect_edges(gray_image: np.ndarray, threshold1: int, threshold2: int, backend: Optional[str] = None,
+                 timer: Optional[StageTimer] = None) -> np.ndarray:
+    """
+    Suaviza y detecta bordes con el backend pedido y el kernel configurado
+
+    Args:
+        gray_image: Imagen en escala de grises
+        threshold1: Umbral Bajo
+        threshold2: Umbral Alto
+        backend: Nombre del backend (None para el predeterminado)
+        timer: Temporizador por etapas (opcional)
+
+    Returns:
+        Imagen de bordes (0/255)
+    """
+    selected = select_backend(gray_image.shape[1], gray_image.shape[0], backend)
+    return selected.detect(gray_image, threshold1, threshold2, _settings['kernel'], _settings['sigma'], timer)
+
+
+def _calibration_image(width: int, height: int) -> np.ndarray:
+    """Imagen determinista con bordes y ruido, como las fotos reales"""
+    rng = np.random.default_rng(width * 31 + height)
+    image = np.full((height, width), 128, dtype=np.uint8)
+    for _ in range(24):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        radius = int(rng.integers(4, max(5, min(width, height) // 4)))
+        cv2.circle(image, center, radius, int(rng.integers(0, 256)), -1)
+    return cv2.add(image, rng.integers(0, 24, image.shape, dtype=np.uint8))
+
+
+def calibrate(sizes: Iterable[Tuple[int, int]], candidates: Iterable[str] = ('opencv', 'opencl'),
+              repeats: int = 3, threshold1: int = 100, threshold2: int = 200) -> List[dict]:
+    """
+    Micro-benchmark de arranque: mide los backends exactos candidatos en cada tamaño
+    y guarda el más rápido de cada uno para 'auto'
+
+    Args:
+        sizes: Tamaños (ancho, alto) a medir
+        candidates: Backends candidatos por orden de preferencia (los no exactos o no disponibles se ignoran)
+        repeats: Repeticiones por medida (se toma la mejor)
+        threshold1: Umbral Bajo de la medida
+        threshold2: Umbral Alto de la medida
+
+    Returns:
+        Lista con el tamaño, el backend elegido y los milisegundos de cada candidato
+    """
+    names = [name for name in candidates
+             if name in _BACKENDS and _BACKENDS[name].exact and _BACKENDS[name].available()]
+    if not names:
+        raise ValueError('No hay backends exactos disponibles para calibrar')
+
+    report = []
+    choices = []
+    for width, height in sizes:
+        gray_image = _calibration_image(width, height)
+        timings = {}
+        for name in names:
+            backend = _BACKENDS[name]
+            try:
+                # Una ejecución de calentamiento (compilación de kernels OpenCL, cachés)
+                backend.detect(gray_image, threshold1, threshold2, _settings['kernel'], _settings['sigma'])
+                best = math.inf
+                for _ in range(max(1, repeats)):
+                    start = time.perf_counter()
+                    backend.detect(gray_image, threshold1, threshold2, _settings['kernel'], _settings['sigma'])
+                    best = min(best, time.perf_counter() - start)
+            except cv2.error as e:
+                logger.warning("backend %s falló en la calibración: %s", name, e)
+                continue
+            timings[name] = round(best * 1000, 3)
+        if not timings:
+            continue
+        # El primer candidato se mantiene salvo que otro sea claramente más rápido (ruido de medida)
+        chosen = next(iter(timings))
+        for name, ms in timings.items():
+            if ms < timings[chosen] * (1 - _CALIBRATION_MARGIN):
+                chosen = name
+        choices.append((width * height, chosen))
+        report.append({'width': width, 'height': height, 'backend': chosen, 'ms': timings})
+        logger.info("backend auto %dx%d -> %s %s", width, height, chosen, timings)
+
+    _settings['choices'] = tuple(choices)
+    return report
+
+
+def backends_info() -> dict:
+    """Backends registrados, predeterminado y tabla de 'auto'"""
+    return {
+        'default': _settings['default'],
+        'kernel': list(_settings['kernel']),
+        'sigma': _settings['sigma'],
+        'backends': [backend.info() for backend in _BACKENDS.values()],
+        'auto': [{'pixels': pixels, 'backend': name} for pixels, name in _settings['choices']]
+    }
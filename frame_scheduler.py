@@ -0,0 +1,161 @@
+"""
+Planificador de frames en tiempo real con política "el último frame gana"
+Mantiene un solo hueco por sesión: si llega un frame nuevo mientras el anterior
+sigue esperando, el anterior se descarta. El trabajo se ejecuta en un pool
+acotado de hilos para limitar el uso de CPU.
+"""
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+
+class FrameDropped(Exception):
+    """El frame fue reemplazado por uno más reciente antes de procesarse"""
+
+
+class _SessionSlot:
+    """Estado de una sesión: frame pendiente y contadores"""
+
+    __slots__ = ('pending', 'running', 'dropped', 'processed', 'errors',
+                 'queue_wait_total', 'queue_wait_max', 'last_seen')
+
+    def __init__(self):
+        self.pending = None          # (future, args, enqueued_at)
+        self.running = False
+        self.dropped = 0
+        self.processed = 0
+        self.errors = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.last_seen = time.monotonic()
+
+    def to_dict(self) -> dict:
+        completed = self.processed + self.errors
+        return {
+            'dropped': self.dropped,
+            'processed': self.processed,
+            'errors': self.errors,
+            'pending': self.pending is not None,
+            'queue_wait_avg_ms': round(self.queue_wait_total / completed * 1000, 2) if completed else 0.0,
+            'queue_wait_max_ms': round(self.queue_wait_max * 1000, 2),
+        }
+
+
+class FrameScheduler:
+    """
+    Planificador por sesión delante de la función de procesamiento de frames
+    
+    Args:
+        process_fn: Función que procesa un frame (recibe los argumentos de submit)
+        max_workers: Número máximo de frames procesándose a la vez
+        session_ttl: Segundos de inactividad tras los que se olvida una sesión
+    """
+
+    def __init__(self, process_fn: Callable, max_workers: int = 4, session_ttl: float = 60.0):
+        self._process_fn = process_fn
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='frame-worker')
+        self._sessions: Dict[str, _SessionSlot] = {}
+        self._lock = threading.Lock()
+        self._session_ttl = session_ttl
+        self.max_workers = max_workers
+
+    def submit(self, session_id: str, *args) -> Future:
+        """
+        Encola un frame para la sesión indicada
+        
+        Args:
+            session_id: Identificador de la sesión (cliente/cámara)
+            *args: Argumentos para la función de procesamiento
+        
+        Returns:
+            Future con el resultado; falla con FrameDropped si el frame se descarta
+        """
+        future = Future()
+        now = time.monotonic()
+        with self._lock:
+            self._expire_sessions(now)
+            slot = self._sessions.get(session_id)
+            if slot is None:
+                slot = self._sessions[session_id] = _SessionSlot()
+            slot.last_seen = now
+
+            # El último frame gana: descartar el que seguía esperando
+            if slot.pending is not None:
+                stale_future = slot.pending[0]
+                slot.dropped += 1
+                stale_future.set_exception(FrameDropped())
+            slot.pending = (future, args, now)
+
+            # Solo una tarea activa por sesión en el pool
+            if not slot.running:
+                slot.running = True
+                self._executor.submit(self._drain, slot)
+        return future
+
+    def _drain(self, slot: _SessionSlot):
+        """Procesa el frame pendiente más reciente de una sesión hasta vaciar su hueco"""
+        while True:
+            with self._lock:
+                if slot.pending is None:
+                    slot.running = False
+                    return
+                future, args, enqueued_at = slot.pending
+                slot.pending = None
+
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            wait = time.monotonic() - enqueued_at
+            try:
+                result = self._process_fn(*args)
+            except Exception as e:
+                with self._lock:
+                    slot.errors += 1
+                    slot.queue_wait_total += wait
+                    slot.queue_wait_max = max(slot.queue_wait_max, wait)
+                future.set_exception(e)
+                continue
+
+            with self._lock:
+                slot.processed += 1
+                slot.queue_wait_total += wait
+                slot.queue_wait_max = max(slot.queue_wait_max, wait)
+            future.set_result(result)
+
+    def _expire_sessions(self, now: float):
+        """Elimina sesiones inactivas (llamar con el lock tomado)"""
+        expired = [
+            session_id for session_id, slot in self._sessions.items()
+            if not slot.running and slot.pending is None and now - slot.last_seen > self._session_ttl
+        ]
+        for session_id in expired:
+            del self._sessions[session_id]
+
+    def stats(self, session_id: Optional[str] = None) -> dict:
+        """
+        Devuelve los contadores de una sesión o de todas
+        
+        Args:
+            session_id: Sesión concreta (None para todas)
+        
+        Returns:
+            Diccionario con dropped, processed, errors y tiempos de espera
+        """
+        with self._lock:
+            if session_id is not None:
+                slot = self._sessions.get(session_id)
+                return slot.to_dict() if slot else None
+            sessions = {sid: slot.to_dict() for sid, slot in self._sessions.items()}
+        return {
+            'max_workers': self.max_workers,
+            'active_sessions': len(sessions),
+            'dropped': sum(s['dropped'] for s in sessions.values()),
+            'processed': sum(s['processed'] for s in sessions.values()),
+            'sessions': sessions,
+        }
+
+    def shutdown(self):
+        """Detiene el pool de trabajadores"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -7,14 +7,26 @@ import cv2
 import numpy as np
 import os
 import base64
-import urllib.request
-from typing import Tuple
+import logging
+from typing import Optional, Tuple
 
-# Configuración de carpetas
-RESULT_FOLDER = 'static/results'
+import config
+from edge_backends import detect_edges, gaussian_params, select_backend
+from metrics import StageTimer
+from persistence import write_file_atomic
+from remote_fetcher import fetch_image_bytes
+from response_formats import OutputOptions, encode_edges, encode_result
+from tiled_processor import build_preview_panels, decode_gray_bytes, detect_edges_tiled, tile_size_for_budget
 
+# Configuración de carpetas (la misma que la aplicación, también en los procesos trabajadores)
+RESULT_FOLDER = config.RESULT_FOLDER
 
-def apply_canny_edge_detection(image_path: str, threshold1: int = 100, threshold2: int = 200, seed: int = 0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+logger = logging.getLogger(__name__)
+
+
+def apply_canny_edge_detection(image_path: str, threshold1: int = 100, threshold2: int = 200, seed: int = 0,
+                               timer: Optional[StageTimer] = None,
+                               backend: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
     """
     Aplica el algoritmo Canny Edge Detection a una imagen
     
@@ -23,34 +35,130 @@ def apply_canny_edge_detection(image_path: str, threshold1: int = 100, threshold
         threshold1: Umbral Bajo para la detección de bordes
         threshold2: Umbral Alto para la detección de bordes
         seed: Semilla para operaciones aleatorias (0 significa sin semilla)
+        timer: Temporizador por etapas (opcional)
+        backend: Backend de detección (None para el predeterminado)
     
     Returns:
         Tupla con (imagen_original, imagen_gris, imagen_bordes)
     """
+    timer = timer or StageTimer()
     # Establecer semilla si es diferente de 0
     if seed > 0:
         np.random.seed(seed)
         cv2.setRNGSeed(seed)
     
     # Cargar la imagen
-    original_image = cv2.imread(image_path)
+    with timer.stage('decode'):
+        original_image = cv2.imread(image_path)
+    
+    if original_image is None:
+        raise ValueError("No se pudo cargar la imagen")
+    
+    gray_image, edges = detect_image_edges(original_image, threshold1, threshold2, timer, backend)
+    
+    return original_image, gray_image, edges
+
+
+def decode_image_bytes(image_bytes: bytes) -> np.ndarray:
+    """
+    Decodifica una imagen directamente desde un buffer en memoria
+    
+    Args:
+        image_bytes: Contenido del fichero de imagen
+    
+    Returns:
+        Imagen en BGR
+    """
+    original_image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
     
     if original_image is None:
         raise ValueError("No se pudo cargar la imagen")
     
+    return original_image
+
+
+def detect_image_edges(original_image: np.ndarray, threshold1: int, threshold2: int,
+                       timer: Optional[StageTimer] = None, backend: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Convierte a escala de grises, suaviza y aplica Canny a una imagen ya decodificada
+    
+    Args:
+        original_image: Imagen en BGR
+        threshold1: Umbral Bajo para la detección de bordes
+        threshold2: Umbral Alto para la detección de bordes
+        timer: Temporizador por etapas (opcional)
+        backend: Backend de detección (None para el predeterminado, ver edge_backends)
+    
+    Returns:
+        Tupla con (imagen_gris, imagen_bordes)
+    """
+    timer = timer or StageTimer()
+    
     # Convertir a escala de grises
-    gray_image = cv2.cvtColor(original_image, cv2.COLOR_BGR2GRAY)
+    with timer.stage('grayscale'):
+        gray_image = cv2.cvtColor(original_image, cv2.COLOR_BGR2GRAY)
     
-    # Aplicar suavizado Gaussiano para reducir ruido
-    blurred_image = cv2.GaussianBlur(gray_image, (5, 5), 1.5)
+    # Suavizado Gaussiano + detector del backend (etapas 'blur' y 'canny')
+    edges = detect_edges(gray_image, threshold1, threshold2, backend, timer)
     
-    # Aplicar Canny Edge Detection
-    edges = cv2.Canny(blurred_image, threshold1, threshold2)
+    return gray_image, edges
+
+
+def build_result_montage(original_image: np.ndarray, gray_image: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """
+    Construye en memoria el montaje 2x2 (original, grises, bordes, overlay)
+    Cada panel se escribe directamente en su cuadrante de un único buffer de salida,
+    sin conversiones RGB intermedias ni copias de hstack/vstack.
     
-    return original_image, gray_image, edges
+    Args:
+        original_image: Imagen original en BGR
+        gray_image: Imagen en escala de grises
+        edges: Imagen de bordes detectados
+    
+    Returns:
+        Montaje en BGR
+    """
+    # Todos los paneles al tamaño de la imagen original
+    h, w = original_image.shape[:2]
+    if gray_image.shape[:2] != (h, w):
+        gray_image = cv2.resize(gray_image, (w, h), interpolation=cv2.INTER_AREA)
+    if edges.shape[:2] != (h, w):
+        edges = cv2.resize(edges, (w, h), interpolation=cv2.INTER_AREA)
+
+    montage = np.empty((2 * h, 2 * w, 3), dtype=np.uint8)
+    montage[:h, :w] = original_image
+    cv2.cvtColor(gray_image, cv2.COLOR_GRAY2BGR, dst=montage[:h, w:])
+    cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR, dst=montage[h:, :w])
+    # Overlay a partir del panel de bordes ya convertido
+    cv2.addWeighted(original_image, 0.7, montage[h:, :w], 0.3, 0, dst=montage[h:, w:])
 
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    cv2.putText(montage, 'Original', (10, 30), font, 0.9, (255,255,255), 2, cv2.LINE_AA)
+    cv2.putText(montage, 'Grayscale', (w+10, 30), font, 0.9, (255,255,255), 2, cv2.LINE_AA)
+    cv2.putText(montage, 'Edges', (10, h+30), font, 0.9, (255,255,255), 2, cv2.LINE_AA)
+    cv2.putText(montage, 'Overlay', (w+10, h+30), font, 0.9, (255,255,255), 2, cv2.LINE_AA)
+    return montage
 
-def save_result_image(original_image: np.ndarray, gray_image: np.ndarray, edges: np.ndarray, filename: str) -> str:
+
+def build_overlay(original_image: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """
+    Superpone los bordes a la imagen original en un único buffer de salida
+    
+    Args:
+        original_image: Imagen original en BGR
+        edges: Imagen de bordes del mismo tamaño
+    
+    Returns:
+        Overlay en BGR
+    """
+    overlay = np.empty_like(original_image)
+    cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR, dst=overlay)
+    cv2.addWeighted(original_image, 0.7, overlay, 0.3, 0, dst=overlay)
+    return overlay
+
+
+def save_result_image(original_image: np.ndarray, gray_image: np.ndarray, edges: np.ndarray, filename: str,
+                      timer: Optional[StageTimer] = None) -> str:
     """
     Guarda una imagen con la comparativa de la detección de bordes
     
@@ -58,82 +166,60 @@ def save_result_image(original_image: np.ndarray, gray_image: np.ndarray, edges:
         original_image: Imagen original en BGR
         gray_image: Imagen en escala de grises
         edges: Imagen de bordes detectados
-        filename: Nombre base del archivo de salida
+        filename: Nombre del archivo de salida en RESULT_FOLDER, o ruta absoluta
+        timer: Temporizador por etapas (opcional)
     
     Returns:
         Ruta del archivo guardado
     """
+    timer = timer or StageTimer()
     # Build a 2x2 montage using OpenCV to avoid matplotlib GUI/backends issues
     try:
-        print("🖼️ Generando imagen de resultado (OpenCV montage)...")
-        # Ensure images are in RGB for consistent display
-        orig_rgb = cv2.cvtColor(original_image, cv2.COLOR_BGR2RGB)
-
-        # Convert gray and edges to RGB
-        gray_rgb = cv2.cvtColor(gray_image, cv2.COLOR_GRAY2RGB)
-        edges_rgb = cv2.cvtColor(edges, cv2.COLOR_GRAY2RGB)
-
-        # Create overlay (orig_rgb already RGB)
-        edges_bgr = cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR)
-        edges_rgb_for_overlay = cv2.cvtColor(edges_bgr, cv2.COLOR_BGR2RGB)
-        overlay = cv2.addWeighted(orig_rgb, 0.7, edges_rgb_for_overlay, 0.3, 0)
-
-        # Resize all panels to the same size (use original image size)
-        h, w = orig_rgb.shape[:2]
-        target_size = (w, h)
-        def to_target(img):
-            if img.shape[0] == h and img.shape[1] == w:
-                return img
-            return cv2.resize(img, target_size, interpolation=cv2.INTER_AREA)
-
-        p1 = to_target(orig_rgb)
-        p2 = to_target(gray_rgb)
-        p3 = to_target(edges_rgb)
-        p4 = to_target(overlay)
-
-        # Stack into 2x2 grid
-        top = np.hstack((p1, p2))
-        bottom = np.hstack((p3, p4))
-        montage = np.vstack((top, bottom))
-
-        # Optionally add simple titles using OpenCV
-        font = cv2.FONT_HERSHEY_SIMPLEX
-        cv2.putText(montage, 'Original', (10, 30), font, 0.9, (255,255,255), 2, cv2.LINE_AA)
-        cv2.putText(montage, 'Grayscale', (w+10, 30), font, 0.9, (255,255,255), 2, cv2.LINE_AA)
-        cv2.putText(montage, 'Edges', (10, h+30), font, 0.9, (255,255,255), 2, cv2.LINE_AA)
-        cv2.putText(montage, 'Overlay', (w+10, h+30), font, 0.9, (255,255,255), 2, cv2.LINE_AA)
-
-        # Save as PNG (convert back to BGR for cv2.imwrite)
-        result_bgr = cv2.cvtColor(montage, cv2.COLOR_RGB2BGR)
+        with timer.stage('montage'):
+            result_bgr = build_result_montage(original_image, gray_image, edges)
+
+        # Save as PNG
         result_path = os.path.join(RESULT_FOLDER, filename)
-        print(f"💾 Guardando imagen de resultado en: {result_path}")
-        cv2.imwrite(result_path, result_bgr)
-        print("✓ Imagen de resultado guardada (OpenCV)")
+        with timer.stage('write'):
+            write_image_atomic(result_path, result_bgr)
+        logger.debug("imagen de resultado guardada path=%s", result_path)
         return result_path
-    except Exception as ex:
-        print(f"ERROR guardando imagen de resultado: {ex}")
+    except Exception:
+        logger.exception("error guardando imagen de resultado filename=%s", filename)
         raise
 
 
-def save_single_edge_image(edges: np.ndarray, filename: str) -> str:
+def save_single_edge_image(edges: np.ndarray, filename: str, timer: Optional[StageTimer] = None) -> str:
     """
     Guarda solo la imagen de bordes como PNG
     
     Args:
         edges: Imagen de bordes detectados
-        filename: Nombre del archivo de salida
+        filename: Nombre del archivo de salida en RESULT_FOLDER, o ruta absoluta
+        timer: Temporizador por etapas (opcional)
     
     Returns:
         Ruta del archivo guardado
     """
+    timer = timer or StageTimer()
     result_path = os.path.join(RESULT_FOLDER, filename)
-    cv2.imwrite(result_path, edges)
+    with timer.stage('write'):
+        write_image_atomic(result_path, edges)
     return result_path
 
 
-def process_realtime_frame(frame_data: bytes, width: int, height: int, threshold1: int, threshold2: int) -> np.ndarray:
+def write_image_atomic(path: str, image: np.ndarray):
+    """Codifica según la extensión de la ruta y escribe de forma atómica (nunca se sirve un fichero a medias)"""
+    success, encoded = cv2.imencode(os.path.splitext(path)[1], image)
+    if not success:
+        raise ValueError("Error codificando la imagen")
+    write_file_atomic(path, encoded.tobytes())
+
+
+def detect_frame_edges(frame_data: bytes, width: int, height: int, threshold1: int, threshold2: int,
+                       backend: Optional[str] = None) -> np.ndarray:
     """
-    Procesa un frame en tiempo real aplicando Canny Edge Detection
+    Decodifica un frame comprimido (JPEG/PNG) y devuelve su mapa de bordes
     
     Args:
         frame_data: Datos de la imagen en bytes
@@ -141,9 +227,10 @@ def process_realtime_frame(frame_data: bytes, width: int, height: int, threshold
         height: Alto del frame
         threshold1: Umbral Bajo
         threshold2: Umbral Alto
+        backend: Backend de detección (None para el predeterminado)
     
     Returns:
-        Imagen de bordes en formato BGR
+        Imagen de bordes de un solo canal
     """
     # Convertir bytes a array numpy
     frame_array = np.frombuffer(frame_data, dtype=np.uint8)
@@ -153,6 +240,25 @@ def process_realtime_frame(frame_data: bytes, width: int, height: int, threshold
     if frame is None:
         raise ValueError("No se pudo decodificar el frame")
     
+    return detect_decoded_frame_edges(frame, width, height, threshold1, threshold2, backend)
+
+
+def detect_decoded_frame_edges(frame: np.ndarray, width: int, height: int, threshold1: int, threshold2: int,
+                               backend: Optional[str] = None) -> np.ndarray:
+    """
+    Mapa de bordes de un frame ya decodificado (webcam o vídeo)
+    
+    Args:
+        frame: Frame BGR
+        width: Ancho de salida
+        height: Alto de salida
+        threshold1: Umbral Bajo
+        threshold2: Umbral Alto
+        backend: Backend de detección (None para el predeterminado)
+    
+    Returns:
+        Imagen de bordes de un solo canal
+    """
     # Redimensionar si es necesario
     if frame.shape[0] != height or frame.shape[1] != width:
         frame = cv2.resize(frame, (width, height))
@@ -160,11 +266,25 @@ def process_realtime_frame(frame_data: bytes, width: int, height: int, threshold
     # Convertir a escala de grises
     gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
     
-    # Aplicar suavizado Gaussiano
-    blurred = cv2.GaussianBlur(gray, (5, 5), 1.5)
+    # Suavizado Gaussiano + detector del backend
+    return detect_edges(gray, threshold1, threshold2, backend)
+
+
+def process_realtime_frame(frame_data: bytes, width: int, height: int, threshold1: int, threshold2: int) -> np.ndarray:
+    """
+    Procesa un frame en tiempo real aplicando Canny Edge Detection
     
-    # Aplicar Canny Edge Detection
-    edges = cv2.Canny(blurred, threshold1, threshold2)
+    Args:
+        frame_data: Datos de la imagen en bytes
+        width: Ancho del frame
+        height: Alto del frame
+        threshold1: Umbral Bajo
+        threshold2: Umbral Alto
+    
+    Returns:
+        Imagen de bordes en formato BGR
+    """
+    edges = detect_frame_edges(frame_data, width, height, threshold1, threshold2)
     
     # Convertir bordes a BGR para enviar como imagen
     edges_bgr = cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR)
@@ -172,6 +292,35 @@ def process_realtime_frame(frame_data: bytes, width: int, height: int, threshold
     return edges_bgr
 
 
+def encode_image_png(image: np.ndarray) -> bytes:
+    """
+    Codifica una imagen como PNG en memoria, sin pasar por disco
+    
+    Args:
+        image: Imagen (BGR o un solo canal)
+    
+    Returns:
+        Bytes del PNG
+    """
+    success, encoded = cv2.imencode('.png', image)
+    if not success:
+        raise ValueError("Error codificando la imagen")
+    return encoded.tobytes()
+
+
+def encode_edges_png(edges: np.ndarray) -> bytes:
+    """
+    Codifica un mapa de bordes de un solo canal como PNG en memoria
+    
+    Args:
+        edges: Imagen de bordes
+    
+    Returns:
+        Bytes del PNG
+    """
+    return encode_image_png(edges)
+
+
 def encode_image_to_base64(image_path: str) -> str:
     """
     Codifica una imagen a base64 para transmisión en JSON
@@ -190,7 +339,22 @@ def encode_image_to_base64(image_path: str) -> str:
         return None
 
 
-def process_image_from_url(image_url: str, threshold1: int = 100, threshold2: int = 200) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+def png_data_uri(png_bytes: bytes) -> str:
+    """
+    Convierte bytes PNG en un data URI para transmisión en JSON
+    
+    Args:
+        png_bytes: Imagen codificada en PNG
+    
+    Returns:
+        Imagen codificada en formato data URI
+    """
+    return 'data:image/png;base64,' + base64.b64encode(png_bytes).decode('utf-8')
+
+
+def process_image_from_url(image_url: str, threshold1: int = 100, threshold2: int = 200,
+                           timer: Optional[StageTimer] = None,
+                           backend: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
     """
     Descarga y procesa una imagen desde una URL
     
@@ -198,26 +362,254 @@ def process_image_from_url(image_url: str, threshold1: int = 100, threshold2: in
         image_url: URL de la imagen
         threshold1: Umbral Bajo para Canny
         threshold2: Umbral Alto para Canny
+        timer: Temporizador por etapas (opcional)
+        backend: Backend de detección (None para el predeterminado)
     
     Returns:
         Tupla con (imagen_original, imagen_gris, imagen_bordes)
     """
-    # Descargar la imagen
-    with urllib.request.urlopen(image_url) as response:
-        image_array = np.asarray(bytearray(response.read()), dtype=np.uint8)
-        image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
+    timer = timer or StageTimer()
+    # Descargar la imagen (pool de conexiones, límites de tiempo y tamaño, caché con revalidación)
+    with timer.stage('download'):
+        image_data = fetch_image_bytes(image_url)
+    # Decodificar directamente sobre el buffer recibido, sin copiarlo
+    with timer.stage('decode'):
+        image = cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), cv2.IMREAD_COLOR)
     
     if image is None:
-        raise ValueError("No se pudo descargar la imagen desde la URL")
+        raise ValueError("No se pudo decodificar la imagen descargada desde la URL")
     
     # Procesar imagen
-    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    blurred_image = cv2.GaussianBlur(gray_image, (5, 5), 1.5)
-    edges = cv2.Canny(blurred_image, threshold1, threshold2)
+    gray_image, edges = detect_image_edges(image, threshold1, threshold2, timer, backend)
     
     return image, gray_image, edges
 
 
+def process_image_file_job(image_path: str, threshold1: int, threshold2: int, seed: int,
+                           result_path: str, edges_path: str, backend: Optional[str] = None) -> dict:
+    """
+    Pipeline completo para una imagen en disco, pensado para ejecutarse en el motor de procesamiento
+    
+    Args:
+        image_path: Ruta de la imagen
+        threshold1: Umbral Bajo para Canny
+        threshold2: Umbral Alto para Canny
+        seed: Semilla para operaciones aleatorias
+        result_path: Ruta absoluta del montaje de resultado (FileStore.path del almacén de resultados)
+        edges_path: Ruta absoluta de la imagen de bordes
+        backend: Backend de detección (None para el predeterminado)
+    
+    Returns:
+        Diccionario con rutas, imágenes PNG en bytes y estadísticas
+    """
+    timer = StageTimer()
+    original_image, gray_image, edges = apply_canny_edge_detection(
+        image_path, threshold1=threshold1, threshold2=threshold2, seed=seed, timer=timer, backend=backend
+    )
+    return _finish_job(original_image, gray_image, edges, result_path, edges_path, timer, backend)
+
+
+def process_image_url_job(image_url: str, threshold1: int, threshold2: int,
+                          result_path: str, edges_path: str, backend: Optional[str] = None) -> dict:
+    """
+    Pipeline completo para una imagen remota, pensado para ejecutarse en el motor de procesamiento
+    
+    Args:
+        image_url: URL de la imagen
+        threshold1: Umbral Bajo para Canny
+        threshold2: Umbral Alto para Canny
+        result_path: Ruta absoluta del montaje de resultado (FileStore.path del almacén de resultados)
+        edges_path: Ruta absoluta de la imagen de bordes
+        backend: Backend de detección (None para el predeterminado)
+    
+    Returns:
+        Diccionario con rutas, imágenes PNG en bytes y estadísticas
+    """
+    timer = StageTimer()
+    image, gray_image, edges = process_image_from_url(image_url, threshold1, threshold2, timer, backend)
+    return _finish_job(image, gray_image, edges, result_path, edges_path, timer, backend)
+
+
+def process_image_bytes_job(image_bytes: bytes, threshold1: int, threshold2: int, seed: int = 0,
+                            output: Optional[dict] = None, backend: Optional[str] = None) -> dict:
+    """
+    Pipeline completo en memoria: decodifica del buffer de la petición y codifica con imencode
+    
+    Args:
+        image_bytes: Contenido de la imagen subida
+        threshold1: Umbral Bajo para Canny
+        threshold2: Umbral Alto para Canny
+        seed: Semilla para operaciones aleatorias
+        output: Opciones de salida (OutputOptions.to_dict()); por defecto, montaje y bordes en PNG
+        backend: Backend de detección (None para el predeterminado)
+    
+    Returns:
+        Diccionario con las imágenes codificadas y estadísticas
+    """
+    if seed > 0:
+        np.random.seed(seed)
+        cv2.setRNGSeed(seed)
+    
+    timer = StageTimer()
+    with timer.stage('decode'):
+        original_image = decode_image_bytes(image_bytes)
+    gray_image, edges = detect_image_edges(original_image, threshold1, threshold2, timer, backend)
+    return _encode_job(original_image, gray_image, edges, output, timer, backend)
+
+
+def process_image_url_memory_job(image_url: str, threshold1: int, threshold2: int,
+                                 output: Optional[dict] = None, backend: Optional[str] = None) -> dict:
+    """
+    Pipeline en memoria para una imagen remota (sin ficheros temporales)
+    
+    Args:
+        image_url: URL de la imagen
+        threshold1: Umbral Bajo para Canny
+        threshold2: Umbral Alto para Canny
+        output: Opciones de salida (OutputOptions.to_dict())
+        backend: Backend de detección (None para el predeterminado)
+    
+    Returns:
+        Diccionario con las imágenes codificadas y estadísticas
+    """
+    timer = StageTimer()
+    options = OutputOptions(**output) if output else OutputOptions()
+    if not options.lazy_result:
+        image, gray_image, edges = process_image_from_url(image_url, threshold1, threshold2, timer, backend)
+        return _encode_job(image, gray_image, edges, output, timer, backend)
+    
+    # Montaje bajo demanda: el llamador necesita el contenido descargado para generarlo después
+    with timer.stage('download'):
+        image_data = fetch_image_bytes(image_url)
+    with timer.stage('decode'):
+        image = decode_image_bytes(image_data)
+    gray_image, edges = detect_image_edges(image, threshold1, threshold2, timer, backend)
+    return dict(_encode_job(image, gray_image, edges, output, timer, backend), source_bytes=bytes(image_data))
+
+
+def process_large_image_bytes_job(image_bytes: bytes, threshold1: int, threshold2: int,
+                                  memory_budget: int, halo: int, preview_max_side: int,
+                                  output: Optional[dict] = None, seed: int = 0,
+                                  backend: Optional[str] = None) -> dict:
+    """
+    Pipeline por mosaicos para imágenes muy grandes con memoria acotada
+    Los bordes se devuelven a resolución completa y el montaje como vista previa reducida.
+    
+    Args:
+        image_bytes: Contenido de la imagen subida
+        threshold1: Umbral Bajo para Canny
+        threshold2: Umbral Alto para Canny
+        memory_budget: Bytes máximos para procesar la imagen
+        halo: Píxeles de solapamiento entre mosaicos
+        preview_max_side: Lado mayor del montaje de vista previa
+        output: Opciones de salida (OutputOptions.to_dict())
+        seed: Semilla para operaciones aleatorias
+        backend: Backend de detección aplicado a cada mosaico (None para el predeterminado)
+    
+    Returns:
+        Diccionario con las imágenes codificadas y estadísticas
+    """
+    if seed > 0:
+        np.random.seed(seed)
+        cv2.setRNGSeed(seed)
+    
+    options = OutputOptions(**output) if output else OutputOptions()
+    timer = StageTimer()
+    with timer.stage('decode'):
+        gray_image = decode_gray_bytes(image_bytes)
+    height, width = gray_image.shape
+    tile_size = tile_size_for_budget(width, height, memory_budget, halo)
+    # 'auto' se resuelve una vez, con el tamaño de un mosaico completo con halo
+    selected = select_backend(min(width, tile_size + 2 * halo), min(height, tile_size + 2 * halo), backend)
+    # Suavizado y Canny se intercalan mosaico a mosaico: se miden juntos
+    kernel, sigma = gaussian_params()
+    with timer.stage('canny'):
+        edges = detect_edges_tiled(gray_image, threshold1, threshold2, tile_size, halo, kernel, sigma, selected.name)
+
+    result_bytes = edges_bytes = None
+    # La vista previa ya es reducida: se genera aunque se pida el montaje bajo demanda
+    if options.needs_result or options.lazy_result:
+        with timer.stage('montage'):
+            montage = build_result_montage(*build_preview_panels(image_bytes, gray_image, edges, preview_max_side))
+        with timer.stage('encode'):
+            result_bytes = encode_result(montage, options)
+    if options.needs_edges:
+        with timer.stage('encode'):
+            edges_bytes = encode_edges(edges, options)
+    return {
+        'result_bytes': result_bytes,
+        'edges_bytes': edges_bytes,
+        'edge_percentage': calculate_edge_percentage(edges),
+        'image_width': width,
+        'image_height': height,
+        'tile_size': tile_size,
+        'backend': selected.name,
+        'timings': timer.timings
+    }
+
+
+def _encode_job(original_image: np.ndarray, gray_image: np.ndarray, edges: np.ndarray,
+                output: Optional[dict] = None, timer: Optional[StageTimer] = None,
+                backend: Optional[str] = None) -> dict:
+    """Codifica en memoria solo lo que pide el formato de salida y devuelve bytes, estadísticas y tiempos"""
+    options = OutputOptions(**output) if output else OutputOptions()
+    timer = timer or StageTimer()
+    result_bytes = edges_bytes = None
+    if options.needs_result:
+        with timer.stage('montage'):
+            montage = build_result_montage(original_image, gray_image, edges)
+        with timer.stage('encode'):
+            result_bytes = encode_result(montage, options)
+    if options.needs_edges:
+        with timer.stage('encode'):
+            edges_bytes = encode_edges(edges, options)
+    result = {
+        'result_bytes': result_bytes,
+        'edges_bytes': edges_bytes,
+        'edge_percentage': calculate_edge_percentage(edges),
+        'image_width': original_image.shape[1],
+        'image_height': original_image.shape[0],
+        'backend': select_backend(original_image.shape[1], original_image.shape[0], backend).name,
+        'timings': timer.timings
+    }
+    if options.lazy_result:
+        # Bordes en PNG para generar las renditions bajo demanda (se reutilizan si ya lo son)
+        if edges_bytes is not None and options.is_default_png:
+            result['edges_png'] = edges_bytes
+        else:
+            with timer.stage('encode'):
+                result['edges_png'] = encode_edges_png(edges)
+    return result
+
+
+def _finish_job(original_image: np.ndarray, gray_image: np.ndarray, edges: np.ndarray,
+                result_path: str, edges_path: str, timer: Optional[StageTimer] = None,
+                backend: Optional[str] = None) -> dict:
+    """Guarda el montaje y los bordes, y devuelve solo bytes, estadísticas y tiempos (sin arrays) al llamador"""
+    # Un nombre suelto acabaría en RESULT_FOLDER del proceso trabajador, fuera del almacén que lo sirve
+    if not (os.path.isabs(result_path) and os.path.isabs(edges_path)):
+        raise ValueError("Las rutas de salida deben ser absolutas (FileStore.path)")
+    timer = timer or StageTimer()
+    result_path = save_result_image(original_image, gray_image, edges, result_path, timer)
+    edges_path = save_single_edge_image(edges, edges_path, timer)
+    with timer.stage('read'):
+        with open(result_path, 'rb') as f:
+            result_bytes = f.read()
+        with open(edges_path, 'rb') as f:
+            edges_bytes = f.read()
+    return {
+        'result_image': result_path,
+        'edges_image': edges_path,
+        'result_bytes': result_bytes,
+        'edges_bytes': edges_bytes,
+        'edge_percentage': calculate_edge_percentage(edges),
+        'image_width': original_image.shape[1],
+        'image_height': original_image.shape[0],
+        'backend': select_backend(original_image.shape[1], original_image.shape[0], backend).name,
+        'timings': timer.timings
+    }
+
+
 def calculate_edge_percentage(edges: np.ndarray) -> float:
     """
     Calcula el porcentaje de píxeles de borde detectados
@@ -228,4 +620,4 @@ def calculate_edge_percentage(edges: np.ndarray) -> float:
     Returns:
         Porcentaje de bordes encontrados
     """
-    return round((np.sum(edges > 0) / edges.size) * 100, 2)
+    return round((cv2.countNonZero(edges) / edges.size) * 100, 2)
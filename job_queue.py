@@ -0,0 +1,328 @@
+"""
+Cola de trabajos asíncronos con prioridades y consulta de estado
+Las peticiones largas (subidas grandes, descargas por URL) se encolan y devuelven
+un identificador al instante; el resultado se consulta por sondeo o long-poll.
+Todo el estado vive en el proceso: no requiere servicios externos.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple, Type
+
+# Prioridades: menor valor = se atiende antes
+PRIORITIES = {'high': 0, 'normal': 1, 'low': 2}
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class JobQueueFull(Exception):
+    """La cola de trabajos alcanzó su capacidad máxima"""
+
+
+def result_nbytes(result: Any) -> int:
+    """Bytes de un resultado: los valores binarios de primer nivel del diccionario (imágenes codificadas)"""
+    if not isinstance(result, dict):
+        return 0
+    return sum(len(value) for value in result.values() if isinstance(value, (bytes, bytearray, memoryview)))
+
+
+class Job:
+    """Estado de un trabajo encolado"""
+
+    __slots__ = ('id', 'kind', 'priority', 'status', 'result', 'error', 'attempts',
+                 'created_at', 'started_at', 'finished_at', 'progress', '_fn', '_args')
+
+    def __init__(self, kind: str, priority: int, fn: Callable, args: tuple, progress=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.priority = priority
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.attempts = 0
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.progress = progress
+        self._fn = fn
+        self._args = args
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def timing(self) -> dict:
+        """Tiempos del trabajo en segundos (espera en cola, ejecución y total)"""
+        now = time.time()
+        started = self.started_at or (now if not self.finished else self.finished_at)
+        ended = self.finished_at or now
+        return {
+            'queued_seconds': round(started - self.created_at, 4),
+            'run_seconds': round(ended - self.started_at, 4) if self.started_at else 0.0,
+            'total_seconds': round(ended - self.created_at, 4)
+        }
+
+    def to_dict(self) -> dict:
+        """Resumen serializable del trabajo (sin el resultado)"""
+        summary = {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'priority': self.priority,
+            'attempts': self.attempts,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'timing': self.timing()
+        }
+        if self.progress is not None:
+            summary['progress'] = self.progress.to_dict()
+        return summary
+
+
+class JobQueue:
+    """
+    Cola acotada con prioridades y un grupo de hilos que ejecuta los trabajos
+    
+    Args:
+        workers: Hilos que ejecutan trabajos a la vez
+        max_queued: Trabajos en espera admitidos (los que exceden se rechazan)
+        result_ttl: Segundos que se conserva un trabajo terminado
+        retry_on: Excepciones que devuelven el trabajo a la cola en lugar de fallar
+        retry_delay: Segundos de espera antes de reintentar
+        on_discard: Función llamada con los argumentos de cada trabajo que se descarta sin
+            ejecutarse (cancelado en espera o pendiente al cerrar la cola), p. ej. para
+            borrar sus ficheros de entrada
+        result_budget: Bytes de resultados terminados que se conservan; al superarlo se
+            eliminan los trabajos terminados más antiguos antes de su result_ttl (None = sin límite)
+        result_size: Función que mide un resultado en bytes
+    """
+
+    def __init__(self, workers: int = 2, max_queued: int = 100, result_ttl: float = 600.0,
+                 retry_on: Tuple[Type[BaseException], ...] = (), retry_delay: float = 0.5,
+                 on_discard: Optional[Callable] = None, result_budget: Optional[int] = None,
+                 result_size: Callable[[Any], int] = result_nbytes):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self.result_budget = result_budget
+        self.result_size = result_size
+        self.retry_on = retry_on
+        self.retry_delay = retry_delay
+        self.on_discard = on_discard
+        self._jobs: Dict[str, Job] = {}
+        # Trabajos terminados en el orden en que terminaron, con el tamaño de su resultado
+        self._finished: 'OrderedDict[str, int]' = OrderedDict()
+        self._result_bytes = 0
+        self._heap = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._threads = []
+        self._closed = False
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._expired = 0
+        self._evicted = 0
+
+    def _start_workers(self):
+        """Lanza los hilos de trabajo de forma perezosa (con el lock tomado)"""
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._worker, name=f'job-worker-{len(self._threads)}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _discard(self, jobs):
+        """Suelta los trabajos que no llegaron a ejecutarse y avisa a on_discard (sin el lock)"""
+        for job in jobs:
+            args, job._fn, job._args = job._args, None, None
+            if self.on_discard is not None and args is not None:
+                self.on_discard(*args)
+
+    def _queued_count(self) -> int:
+        return sum(1 for job in self._jobs.values() if job.status == QUEUED)
+
+    def _purge_expired(self):
+        """Elimina los trabajos terminados que superaron result_ttl (con el lock tomado)"""
+        limit = time.time() - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < limit]
+        for job_id in expired:
+            self._forget(job_id)
+        self._expired += len(expired)
+
+    def _finish(self, job: Job, size: int = 0):
+        """
+        Registra un trabajo terminado y, si los resultados superan result_budget, elimina
+        los terminados más antiguos (con el lock tomado)
+        """
+        self._finished[job.id] = size
+        self._result_bytes += size
+        if self.result_budget is None:
+            return
+        # El trabajo recién terminado se conserva aunque supere el presupuesto por sí solo
+        while self._result_bytes > self.result_budget and len(self._finished) > 1:
+            self._forget(next(iter(self._finished)))
+            self._evicted += 1
+
+    def _forget(self, job_id: str):
+        """Elimina un trabajo terminado y descuenta su resultado (con el lock tomado)"""
+        del self._jobs[job_id]
+        self._result_bytes -= self._finished.pop(job_id, 0)
+
+    def submit(self, fn: Callable, *args, kind: str = '', priority: int = PRIORITIES['normal'],
+               progress=None) -> Job:
+        """
+        Encola un trabajo
+        
+        Args:
+            fn: Función a ejecutar
+            *args: Argumentos de la función
+            kind: Tipo de trabajo (informativo)
+            priority: Prioridad (menor = antes)
+            progress: Objeto con to_dict() que la función actualiza; se incluye en el estado
+        
+        Returns:
+            Trabajo encolado
+        
+        Raises:
+            JobQueueFull: si ya hay max_queued trabajos en espera
+        """
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("La cola de trabajos está cerrada")
+            self._purge_expired()
+            if self._queued_count() >= self.max_queued:
+                self._rejected += 1
+                raise JobQueueFull("Cola de trabajos llena, reintente más tarde")
+            job = Job(kind, priority, fn, args, progress)
+            self._jobs[job.id] = job
+            heapq.heappush(self._heap, (priority, next(self._sequence), job))
+            self._start_workers()
+            self._condition.notify_all()
+            return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Devuelve el trabajo o None si no existe o ya expiró"""
+        with self._condition:
+            self._purge_expired()
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id: str, timeout: float) -> Optional[Job]:
+        """
+        Long-poll: espera hasta que el trabajo termine o pase timeout
+        
+        Returns:
+            El trabajo (terminado o no) o None si no existe
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            job = self._jobs.get(job_id)
+            while job is not None and not job.finished:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return job
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancela un trabajo en espera o descarta uno terminado
+        
+        Returns:
+            False si el trabajo no existe o ya se está ejecutando
+        """
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None or job.status == RUNNING:
+                return False
+            if job.status != QUEUED:
+                self._forget(job_id)
+                return True
+            job.status = CANCELLED
+            job.finished_at = time.time()
+            self._finish(job)
+            self._condition.notify_all()
+        self._discard([job])
+        return True
+
+    def _worker(self):
+        """Bucle de cada hilo: toma el trabajo de mayor prioridad y lo ejecuta"""
+        while True:
+            with self._condition:
+                while not self._heap and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                _, _, job = heapq.heappop(self._heap)
+                if job.status != QUEUED:
+                    continue
+                job.status = RUNNING
+                job.attempts += 1
+                if job.started_at is None:
+                    job.started_at = time.time()
+
+            try:
+                result, error = job._fn(*job._args), None
+            except self.retry_on:
+                # Sin capacidad en el motor: volver a la cola tras una pausa
+                time.sleep(self.retry_delay)
+                with self._condition:
+                    job.status = QUEUED
+                    heapq.heappush(self._heap, (job.priority, next(self._sequence), job))
+                    self._condition.notify_all()
+                continue
+            except Exception as e:
+                result, error = None, str(e)
+            size = self.result_size(result) if result is not None else 0
+
+            with self._condition:
+                job.result = result
+                job.error = error
+                job.status = FAILED if error is not None else DONE
+                job.finished_at = time.time()
+                job._fn = job._args = None
+                self._finish(job, size)
+                if error is not None:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+                self._condition.notify_all()
+
+    def stats(self) -> dict:
+        """Estadísticas de la cola"""
+        with self._condition:
+            self._purge_expired()
+            counts = {state: 0 for state in (QUEUED, RUNNING) + FINISHED_STATES}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return {
+                'workers': self.workers,
+                'max_queued': self.max_queued,
+                'result_ttl': self.result_ttl,
+                'result_budget': self.result_budget,
+                'result_bytes': self._result_bytes,
+                'jobs': counts,
+                'completed': self._completed,
+                'failed': self._failed,
+                'rejected': self._rejected,
+                'expired': self._expired,
+                'evicted': self._evicted
+            }
+
+    def shutdown(self):
+        """Detiene los hilos de trabajo (los trabajos en espera se descartan)"""
+        with self._condition:
+            self._closed = True
+            pending = [job for job in self._jobs.values() if job.status == QUEUED]
+            self._condition.notify_all()
+        self._discard(pending)
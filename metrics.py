@@ -0,0 +1,221 @@
+"""
+Métricas del servicio en formato de exposición de Prometheus
+Contadores, indicadores e histogramas con etiquetas, sin dependencias externas,
+y un temporizador por etapas (decodificar, grises, suavizado, Canny, montaje,
+codificar, escritura, base64) que alimenta los histogramas y la cabecera Server-Timing.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Límites de los histogramas de duración (segundos) y de tamaño (bytes)
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1024, 16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024, 16 * 1024 * 1024, 64 * 1024 * 1024)
+
+
+class StageTimer:
+    """
+    Acumula la duración de cada etapa de un trabajo
+    Se crea dentro del trabajo (hilo o proceso del motor) y sus tiempos viajan en el resultado.
+    """
+
+    __slots__ = ('timings',)
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    """Etiquetas en formato {a="x",b="y"}"""
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    """Base de las métricas con etiquetas"""
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: Tuple[str, ...]) -> Tuple[str, ...]:
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"{self.name} espera las etiquetas {self.label_names}")
+        return tuple(str(label) for label in labels)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.extend(self._render_sample(labels, value))
+        return lines
+
+    def _render_sample(self, labels, value) -> List[str]:
+        return [f'{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}']
+
+
+class Counter(_Metric):
+    """Contador monótono"""
+
+    kind = 'counter'
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """Valor que sube y baja"""
+
+    kind = 'gauge'
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, *labels: str, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """Histograma acumulativo con límites fijos"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels: str):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            counts = state[0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            state[1] += 1
+            state[2] += value
+
+    def _render_sample(self, labels, state) -> List[str]:
+        counts, total, value_sum = state
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            bucket_labels = _format_labels(self.label_names, labels, 'le="%s"' % bound)
+            lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+        bucket_labels = _format_labels(self.label_names, labels, 'le="+Inf"')
+        lines.append(f'{self.name}_bucket{bucket_labels} {total}')
+        lines.append(f'{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(value_sum)}')
+        lines.append(f'{self.name}_count{_format_labels(self.label_names, labels)} {total}')
+        return lines
+
+
+class Registry:
+    """Conjunto de métricas y de colectores evaluados en cada lectura"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, float]]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, float]]]):
+        """
+        Añade un colector: función que devuelve tuplas (nombre, tipo, ayuda, valor)
+        Se usa para exponer estadísticas que ya calculan la caché, el motor o la cola.
+        """
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Todas las métricas en formato de texto de Prometheus"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, kind, documentation, value in collector():
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {kind}')
+                lines.append(f'{name} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'canny_stage_seconds', 'Duración de cada etapa del pipeline', ['stage']
+))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'canny_http_request_seconds', 'Duración de las peticiones HTTP', ['endpoint']
+))
+REQUEST_BYTES = REGISTRY.register(Histogram(
+    'canny_http_request_bytes', 'Tamaño del cuerpo de las peticiones HTTP', ['endpoint'], buckets=SIZE_BUCKETS
+))
+REQUESTS_TOTAL = REGISTRY.register(Counter(
+    'canny_http_requests_total', 'Peticiones HTTP atendidas', ['endpoint', 'status']
+))
+REQUEST_ERRORS = REGISTRY.register(Counter(
+    'canny_http_errors_total', 'Peticiones HTTP con respuesta de error (4xx/5xx)', ['endpoint', 'status']
+))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    'canny_http_in_flight', 'Peticiones HTTP en curso', ['endpoint']
+))
+
+
+def record_timings(timings: Optional[Dict[str, float]]):
+    """Añade a los histogramas los tiempos por etapa devueltos por un trabajo"""
+    if timings:
+        for stage, seconds in timings.items():
+            STAGE_SECONDS.observe(seconds, stage)
+
+
+def server_timing_header(timings: Dict[str, float], total: Optional[float] = None) -> str:
+    """
+    Cabecera Server-Timing a partir de los tiempos por etapa
+
+    Args:
+        timings: Segundos por etapa
+        total: Duración total de la petición en segundos
+
+    Returns:
+        Valor de la cabecera (duraciones en milisegundos)
+    """
+    parts = [f'{stage};dur={seconds * 1000:.2f}' for stage, seconds in timings.items()]
+    if total is not None:
+        parts.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(parts)
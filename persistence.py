@@ -0,0 +1,92 @@
+"""
+Persistencia asíncrona de subidas y resultados
+Las escrituras a disco se hacen en segundo plano para que no sumen latencia
+a la respuesta. Cada fichero se escribe en un temporal y se renombra, de modo
+que nunca se sirve un PNG a medio escribir.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+def write_file_atomic(path: str, data: bytes) -> str:
+    """
+    Escribe un fichero de forma atómica (temporal + renombrado)
+    
+    Args:
+        path: Ruta de destino
+        data: Contenido
+    
+    Returns:
+        Ruta escrita
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return path
+
+
+class AsyncWriter:
+    """
+    Escritor en segundo plano con un pool pequeño de hilos
+    
+    Args:
+        workers: Hilos dedicados a escribir
+    """
+
+    def __init__(self, workers: int = 2):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='persist-writer')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._written = 0
+        self._failed = 0
+
+    def write(self, path: str, data: bytes) -> Future:
+        """
+        Encola la escritura de un fichero
+        
+        Args:
+            path: Ruta de destino
+            data: Contenido
+        
+        Returns:
+            Future con la ruta escrita
+        """
+        with self._lock:
+            self._pending += 1
+        future = self._executor.submit(self._write, path, data)
+        future.add_done_callback(self._done)
+        return future
+
+    @staticmethod
+    def _write(path: str, data: bytes) -> str:
+        start = time.perf_counter()
+        write_file_atomic(path, data)
+        STAGE_SECONDS.observe(time.perf_counter() - start, 'write')
+        return path
+
+    def _done(self, future: Future):
+        with self._lock:
+            self._pending -= 1
+            if future.exception() is not None:
+                self._failed += 1
+                logger.error("error guardando fichero en segundo plano: %s", future.exception())
+            else:
+                self._written += 1
+
+    def stats(self) -> dict:
+        """Escrituras pendientes, completadas y fallidas"""
+        with self._lock:
+            return {'pending': self._pending, 'written': self._written, 'failed': self._failed}
+
+    def shutdown(self, wait: bool = True):
+        """Espera a que terminen las escrituras pendientes y detiene el pool"""
+        self._executor.shutdown(wait=wait)
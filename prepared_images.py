@@ -0,0 +1,286 @@
+"""
+Imágenes preparadas para barridos de umbrales
+Al subir una imagen una sola vez se guardan la versión suavizada y la magnitud
+del gradiente ya adelgazada (supresión de no máximos), que no dependen de los
+umbrales. Cada par de umbrales solo ejecuta la histéresis.
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# tan(22.5°) y tan(67.5°) para clasificar la dirección del gradiente en 4 sectores
+_TAN_22_5 = 0.4142135623730951
+_TAN_67_5 = 2.414213562373095
+
+
+def compute_gradients(blurred_image: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Calcula los gradientes Sobel (apertura 3) y la magnitud L1, como cv2.Canny
+    
+    Args:
+        blurred_image: Imagen en escala de grises suavizada
+    
+    Returns:
+        Tupla con (gx, gy, magnitud)
+    """
+    gx = cv2.Sobel(blurred_image, cv2.CV_16S, 1, 0, ksize=3, borderType=cv2.BORDER_REPLICATE)
+    gy = cv2.Sobel(blurred_image, cv2.CV_16S, 0, 1, ksize=3, borderType=cv2.BORDER_REPLICATE)
+    # |gx| + |gy| <= 2040 con apertura 3, cabe sin desbordar en int16
+    magnitude = (np.abs(gx) + np.abs(gy)).astype(np.uint16)
+    return gx, gy, magnitude
+
+
+def non_max_suppression(gx: np.ndarray, gy: np.ndarray, magnitude: np.ndarray) -> np.ndarray:
+    """
+    Adelgaza los bordes manteniendo solo los máximos locales en la dirección del gradiente
+    
+    Args:
+        gx: Gradiente horizontal
+        gy: Gradiente vertical
+        magnitude: Magnitud del gradiente
+    
+    Returns:
+        Magnitud suprimida (0 donde el píxel no es máximo local)
+    """
+    ax = np.abs(gx.astype(np.float32))
+    ay = np.abs(gy.astype(np.float32))
+    padded = np.pad(magnitude, 1, mode='constant')
+    h, w = magnitude.shape
+
+    def neighbour(dy, dx):
+        return padded[1 + dy:1 + dy + h, 1 + dx:1 + dx + w]
+
+    horizontal = ay <= ax * _TAN_22_5
+    vertical = ay > ax * _TAN_67_5
+    diagonal = ~(horizontal | vertical)
+    same_sign = (gx.astype(np.int32) * gy.astype(np.int32)) > 0
+
+    # Igual que OpenCV: en horizontal/vertical estrictamente mayor que un vecino y
+    # mayor o igual que el otro; en diagonal estrictamente mayor que ambos
+    keep = np.zeros(magnitude.shape, dtype=bool)
+    keep |= horizontal & (magnitude > neighbour(0, -1)) & (magnitude >= neighbour(0, 1))
+    keep |= vertical & (magnitude > neighbour(-1, 0)) & (magnitude >= neighbour(1, 0))
+    keep |= diagonal & same_sign & (magnitude > neighbour(-1, -1)) & (magnitude > neighbour(1, 1))
+    keep |= diagonal & ~same_sign & (magnitude > neighbour(-1, 1)) & (magnitude > neighbour(1, -1))
+
+    return np.where(keep, magnitude, 0).astype(magnitude.dtype)
+
+
+def hysteresis(suppressed: np.ndarray, threshold1: int, threshold2: int) -> np.ndarray:
+    """
+    Histéresis de umbral: conserva los bordes débiles conectados (8 vecinos) a un borde fuerte
+    
+    Args:
+        suppressed: Magnitud tras la supresión de no máximos
+        threshold1: Umbral Bajo
+        threshold2: Umbral Alto
+    
+    Returns:
+        Imagen de bordes (0/255)
+    """
+    low, high = min(threshold1, threshold2), max(threshold1, threshold2)
+    candidates = (suppressed > low).view(np.uint8)
+    count, labels = cv2.connectedComponents(candidates, connectivity=8)
+    strong_labels = np.unique(labels[suppressed > high])
+    keep = np.zeros(count, dtype=np.uint8)
+    keep[strong_labels] = 255
+    keep[0] = 0
+    return keep[labels]
+
+
+def compute_gradients_numpy(blurred_image: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Gradientes Sobel (apertura 3) y magnitud L1 en NumPy puro, idénticos a compute_gradients
+    
+    Args:
+        blurred_image: Imagen en escala de grises suavizada
+    
+    Returns:
+        Tupla con (gx, gy, magnitud)
+    """
+    # BORDER_REPLICATE, como el Sobel interno de cv2.Canny
+    padded = np.pad(blurred_image, 1, mode='edge').astype(np.int32)
+    h, w = blurred_image.shape
+
+    def neighbour(dy, dx):
+        return padded[1 + dy:1 + dy + h, 1 + dx:1 + dx + w]
+
+    gx = (neighbour(-1, 1) + 2 * neighbour(0, 1) + neighbour(1, 1)
+          - neighbour(-1, -1) - 2 * neighbour(0, -1) - neighbour(1, -1))
+    gy = (neighbour(1, -1) + 2 * neighbour(1, 0) + neighbour(1, 1)
+          - neighbour(-1, -1) - 2 * neighbour(-1, 0) - neighbour(-1, 1))
+    magnitude = (np.abs(gx) + np.abs(gy)).astype(np.uint16)
+    return gx.astype(np.int16), gy.astype(np.int16), magnitude
+
+
+# Mitad de la vecindad 8: cada par de vecinos se visita una sola vez
+_HALF_NEIGHBOURHOOD = ((0, 1), (1, -1), (1, 0), (1, 1))
+
+
+def hysteresis_numpy(suppressed: np.ndarray, threshold1: int, threshold2: int) -> np.ndarray:
+    """
+    Histéresis en NumPy puro, idéntica a hysteresis: componentes 8-conexas de los
+    candidatos (por encima del Umbral Bajo) con union-find vectorizado, enganchando
+    cada raíz a la menor de sus vecinas y comprimiendo caminos por saltos de puntero
+    
+    Args:
+        suppressed: Magnitud tras la supresión de no máximos
+        threshold1: Umbral Bajo
+        threshold2: Umbral Alto
+    
+    Returns:
+        Imagen de bordes (0/255)
+    """
+    low, high = min(threshold1, threshold2), max(threshold1, threshold2)
+    h, w = suppressed.shape
+    candidates = suppressed > low
+    positions = np.flatnonzero(candidates)
+    edges = np.zeros(h * w, dtype=np.uint8)
+    if not positions.size:
+        return edges.reshape(h, w)
+
+    # Identificador compacto de cada candidato y pares de candidatos vecinos
+    ids = np.full((h, w), -1, dtype=np.int64)
+    ids.ravel()[positions] = np.arange(positions.size)
+    first, second = [], []
+    for dy, dx in _HALF_NEIGHBOURHOOD:
+        left, right = max(0, -dx), w - max(0, dx)
+        a = ids[:h - dy, left:right]
+        b = ids[dy:, left + dx:right + dx]
+        linked = (a >= 0) & (b >= 0)
+        first.append(a[linked])
+        second.append(b[linked])
+    first, second = np.concatenate(first), np.concatenate(second)
+
+    # parent[i] <= i siempre: no hay ciclos y cada vuelta solo reduce etiquetas
+    parent = np.arange(positions.size)
+    while True:
+        root_a, root_b = parent[first], parent[second]
+        pending = root_a != root_b
+        if not pending.any():
+            break
+        np.minimum.at(parent, np.maximum(root_a, root_b)[pending], np.minimum(root_a, root_b)[pending])
+        while True:
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                break
+            parent = jumped
+
+    strong_roots = np.zeros(positions.size, dtype=bool)
+    strong_roots[parent[suppressed.ravel()[positions] > high]] = True
+    edges[positions[strong_roots[parent]]] = 255
+    return edges.reshape(h, w)
+
+
+class PreparedImage:
+    """
+    Imagen con las etapas independientes de los umbrales ya calculadas
+    
+    Args:
+        image: Imagen original en BGR
+        kernel: Tamaño del kernel Gaussiano
+        sigma: Sigma del kernel Gaussiano
+    """
+
+    def __init__(self, image: np.ndarray, kernel=(5, 5), sigma: float = 1.5):
+        gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        blurred_image = cv2.GaussianBlur(gray_image, tuple(kernel), sigma)
+        gx, gy, magnitude = compute_gradients(blurred_image)
+        self.suppressed = non_max_suppression(gx, gy, magnitude)
+        self.height, self.width = gray_image.shape
+
+    def edges(self, threshold1: int, threshold2: int) -> np.ndarray:
+        """Mapa de bordes para un par de umbrales"""
+        return hysteresis(self.suppressed, threshold1, threshold2)
+
+    def sweep(self, thresholds: Iterable[Tuple[int, int]]) -> List[Tuple[int, int, np.ndarray]]:
+        """Evalúa varios pares de umbrales reutilizando los gradientes"""
+        return [(t1, t2, self.edges(t1, t2)) for t1, t2 in thresholds]
+
+    @property
+    def nbytes(self) -> int:
+        return self.suppressed.nbytes
+
+
+def prepare_image_bytes(image_bytes: bytes, kernel=(5, 5), sigma: float = 1.5) -> PreparedImage:
+    """
+    Decodifica una imagen en memoria y la prepara para barridos de umbrales
+    
+    Args:
+        image_bytes: Contenido de la imagen
+        kernel: Tamaño del kernel Gaussiano
+        sigma: Sigma del kernel Gaussiano
+    
+    Returns:
+        PreparedImage
+    """
+    image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("No se pudo cargar la imagen")
+    return PreparedImage(image, kernel, sigma)
+
+
+class PreparedImageStore:
+    """
+    Almacén en memoria de imágenes preparadas, con caducidad y presupuesto en bytes
+    
+    Args:
+        ttl: Segundos sin uso tras los que una imagen caduca
+        max_bytes: Bytes máximos ocupados por todas las imágenes preparadas
+    """
+
+    def __init__(self, ttl: float = 600.0, max_bytes: int = 512 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()   # id -> (PreparedImage, last_used)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def add(self, prepared: PreparedImage) -> str:
+        """Guarda una imagen preparada y devuelve su identificador"""
+        prepared_id = uuid.uuid4().hex
+        with self._lock:
+            self._expire(time.monotonic())
+            self._items[prepared_id] = (prepared, time.monotonic())
+            self._bytes += prepared.nbytes
+            # Expulsar las menos usadas si se supera el presupuesto
+            while self._bytes > self.max_bytes and len(self._items) > 1:
+                _, (evicted, _) = self._items.popitem(last=False)
+                self._bytes -= evicted.nbytes
+        return prepared_id
+
+    def get(self, prepared_id: str) -> Optional[PreparedImage]:
+        """Devuelve la imagen preparada (renovando su caducidad) o None"""
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            item = self._items.get(prepared_id)
+            if item is None:
+                return None
+            self._items[prepared_id] = (item[0], now)
+            self._items.move_to_end(prepared_id)
+            return item[0]
+
+    def remove(self, prepared_id: str) -> bool:
+        """Elimina una imagen preparada"""
+        with self._lock:
+            item = self._items.pop(prepared_id, None)
+            if item is None:
+                return False
+            self._bytes -= item[0].nbytes
+            return True
+
+    def _expire(self, now: float):
+        """Elimina las imágenes caducadas (llamar con el lock tomado)"""
+        while self._items:
+            prepared_id, (prepared, last_used) = next(iter(self._items.items()))
+            if now - last_used <= self.ttl:
+                break
+            del self._items[prepared_id]
+            self._bytes -= prepared.nbytes
@@ -0,0 +1,140 @@
+"""
+Motor de ejecución para el trabajo de CPU (decodificar → suavizar → Canny → codificar)
+Saca el procesamiento de los hilos de petición de Flask y lo envía a un pool
+de hilos (OpenCV libera el GIL) o de procesos, con un límite de admisión.
+"""
+
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional, Sequence
+
+
+class EngineSaturated(Exception):
+    """El motor no admite más trabajos: se alcanzó el límite de admisión"""
+
+
+def _init_process_worker(worker_setup: Optional[Callable] = None):
+    """Inicializa cada proceso trabajador: un hilo de OpenCV por proceso para no sobresuscribir la CPU"""
+    import cv2
+    cv2.setNumThreads(1)
+    # Estado del proceso principal que los trabajadores deben replicar (p. ej. el backend de bordes)
+    if worker_setup is not None:
+        worker_setup()
+
+
+def _run_worker_setups(functions: Sequence[Callable]):
+    for function in functions:
+        function()
+
+
+def chain_worker_setup(*functions: Callable) -> Callable:
+    """Combina varias funciones de inicialización en un único worker_setup (importable por los procesos)"""
+    return functools.partial(_run_worker_setups, functions)
+
+
+class ProcessingEngine:
+    """
+    Pool de ejecución con control de admisión
+    
+    Args:
+        mode: 'thread' (pool de hilos) o 'process' (pool de procesos)
+        workers: Número de trabajadores (por defecto, núcleos disponibles)
+        max_pending: Trabajos admitidos a la vez, en ejecución o en cola
+        worker_setup: Función sin argumentos (importable, p. ej. functools.partial) que se
+            ejecuta al arrancar cada proceso trabajador en modo 'process'
+    """
+
+    MODES = ('thread', 'process')
+
+    def __init__(self, mode: str = 'thread', workers: Optional[int] = None, max_pending: Optional[int] = None,
+                 worker_setup: Optional[Callable] = None):
+        if mode not in self.MODES:
+            raise ValueError(f"Modo de motor desconocido: {mode}")
+        self.mode = mode
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 4
+        self.worker_setup = worker_setup
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._executor = None
+
+    def _get_executor(self):
+        """Crea el pool de forma perezosa (los procesos solo se lanzan al primer uso)"""
+        with self._lock:
+            if self._executor is None:
+                if self.mode == 'process':
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn'),
+                        initializer=_init_process_worker,
+                        initargs=(self.worker_setup,)
+                    )
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='engine-worker')
+            return self._executor
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Envía un trabajo al pool
+        
+        Args:
+            fn: Función a ejecutar (debe ser importable a nivel de módulo en modo 'process')
+            *args, **kwargs: Argumentos de la función
+        
+        Returns:
+            Future con el resultado
+        
+        Raises:
+            EngineSaturated: si ya hay max_pending trabajos admitidos
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise EngineSaturated("Servidor saturado, reintente más tarde")
+
+        with self._lock:
+            self._in_flight += 1
+        try:
+            future = self._get_executor().submit(fn, *args, **kwargs)
+        except Exception:
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def run(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs):
+        """Envía un trabajo y espera su resultado"""
+        return self.submit(fn, *args, **kwargs).result(timeout=timeout)
+
+    def _release(self, _future):
+        with self._lock:
+            self._in_flight -= 1
+            self._completed += 1
+        self._slots.release()
+
+    def stats(self) -> dict:
+        """Estado del motor: modo, tamaño, trabajos en vuelo, completados y rechazados"""
+        with self._lock:
+            return {
+                'mode': self.mode,
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'in_flight': self._in_flight,
+                'completed': self._completed,
+                'rejected': self._rejected,
+            }
+
+    def shutdown(self, wait: bool = True):
+        """Detiene el pool"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
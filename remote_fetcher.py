@@ -0,0 +1,508 @@
+"""
+Descarga de imágenes remotas
+Conexiones HTTP keep-alive reutilizadas por host, tiempo máximo por operación y
+por descarga completa, y un límite de tamaño que se aplica mientras se recibe
+(sin leer nunca más de max_bytes). Los cuerpos con ETag o Last-Modified se guardan
+en una caché LRU y se revalidan con peticiones condicionales (304 Not Modified).
+fetch bloquea el hilo llamador; fetch_async hace lo mismo sobre asyncio (modo ASGI).
+"""
+
+import asyncio
+import http.client
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Bytes leídos por llamada cuando el servidor no envía Content-Length
+_CHUNK_SIZE = 64 * 1024
+_MAX_REDIRECTS = 5
+_REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+_USER_AGENT = 'edge-detection-webapp/1.0'
+
+
+class FetchError(ValueError):
+    """La imagen remota no se pudo descargar (red, estado HTTP, tiempo o tamaño)"""
+
+
+class FetchTooLarge(FetchError):
+    """La imagen remota supera el tamaño máximo permitido"""
+
+
+class RemoteFetcher:
+    """
+    Cliente HTTP con pool de conexiones, límites y caché de cuerpos descargados
+
+    Args:
+        max_bytes: Tamaño máximo de una imagen remota
+        timeout: Segundos máximos por operación de red (conectar, cada lectura)
+        deadline: Segundos máximos por descarga completa
+        pool_size: Conexiones inactivas conservadas por host
+        cache_bytes: Presupuesto de la caché de cuerpos (0 la desactiva)
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024, timeout: float = 10.0, deadline: float = 30.0,
+                 pool_size: int = 4, cache_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.deadline = deadline
+        self.pool_size = pool_size
+        self.cache_bytes = cache_bytes
+        self._pool: Dict[Tuple[str, str, int], List[http.client.HTTPConnection]] = {}
+        # Las conexiones asyncio pertenecen al bucle de eventos del servidor ASGI
+        self._async_pool: Dict[Tuple[str, str, int], List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]]] = {}
+        self._cache = OrderedDict()      # url -> (cuerpo, etag, last_modified)
+        self._cache_used = 0
+        self._lock = threading.Lock()
+        self._counters = {'downloads': 0, 'revalidated': 0, 'reused_connections': 0,
+                          'rejected_too_large': 0, 'failed': 0, 'bytes_downloaded': 0}
+
+    def fetch(self, url: str) -> memoryview:
+        """
+        Descarga una imagen remota (o la sirve desde la caché si no cambió)
+
+        Args:
+            url: URL http o https
+
+        Returns:
+            Contenido de solo lectura, sin copias intermedias (apto para np.frombuffer)
+
+        Raises:
+            FetchTooLarge: si el cuerpo supera max_bytes
+            FetchError: si la URL no es válida, el servidor falla o se agota el tiempo
+        """
+        deadline = time.monotonic() + self.deadline
+        try:
+            for _ in range(_MAX_REDIRECTS + 1):
+                status, location, body = self._get(url, deadline)
+                if status not in _REDIRECT_STATUSES:
+                    return body
+                url = urljoin(url, location)
+            raise FetchError('Demasiadas redirecciones al descargar la imagen')
+        except FetchTooLarge:
+            self._count('rejected_too_large')
+            raise
+        except FetchError:
+            self._count('failed')
+            raise
+        except (OSError, http.client.HTTPException) as e:
+            self._count('failed')
+            raise FetchError(f'No se pudo descargar la imagen: {e}') from e
+
+    async def fetch_async(self, url: str) -> memoryview:
+        """
+        Igual que fetch, pero esperando la red sin ocupar un hilo
+
+        Args:
+            url: URL http o https
+
+        Returns:
+            Contenido de solo lectura
+
+        Raises:
+            FetchTooLarge: si el cuerpo supera max_bytes
+            FetchError: si la URL no es válida, el servidor falla o se agota el tiempo
+        """
+        try:
+            return await asyncio.wait_for(self._fetch_async(url), self.deadline)
+        except FetchTooLarge:
+            self._count('rejected_too_large')
+            raise
+        except FetchError:
+            self._count('failed')
+            raise
+        except asyncio.TimeoutError as e:
+            self._count('failed')
+            raise FetchError('Tiempo de descarga agotado') from e
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, http.client.HTTPException) as e:
+            self._count('failed')
+            raise FetchError(f'No se pudo descargar la imagen: {e}') from e
+
+    async def _fetch_async(self, url: str) -> memoryview:
+        for _ in range(_MAX_REDIRECTS + 1):
+            status, location, body = await self._get_async(url)
+            if status not in _REDIRECT_STATUSES:
+                return body
+            url = urljoin(url, location)
+        raise FetchError('Demasiadas redirecciones al descargar la imagen')
+
+    def _prepare(self, url: str):
+        """Clave del pool, ruta, cabeceras (condicionales si hay caché) y entrada de caché de una URL"""
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise FetchError('URL no válida: solo se admiten http y https')
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+        path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        headers = {'User-Agent': _USER_AGENT, 'Accept': 'image/*', 'Accept-Encoding': 'identity'}
+        cached = self._cache_get(url)
+        if cached is not None:
+            if cached[1]:
+                headers['If-None-Match'] = cached[1]
+            if cached[2]:
+                headers['If-Modified-Since'] = cached[2]
+        return key, path, headers, cached
+
+    def _downloaded(self, url: str, body: memoryview, getheader):
+        """Cuenta una descarga completa y la guarda en caché si trae validadores"""
+        self._count('downloads')
+        self._count('bytes_downloaded', len(body))
+        cache_control = (getheader('Cache-Control') or '').lower()
+        etag, last_modified = getheader('ETag'), getheader('Last-Modified')
+        if (etag or last_modified) and 'no-store' not in cache_control:
+            self._cache_put(url, body, etag, last_modified)
+
+    def _too_large(self) -> FetchTooLarge:
+        return FetchTooLarge(f'La imagen remota supera el máximo de {self.max_bytes // (1024 * 1024)} MB')
+
+    def _get(self, url: str, deadline: float) -> Tuple[int, Optional[str], Optional[memoryview]]:
+        """Una petición GET; devuelve (estado, Location, cuerpo)"""
+        key, path, headers, cached = self._prepare(url)
+        connection, reused = self._acquire(key)
+        try:
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+            except (OSError, http.client.HTTPException):
+                if not reused:
+                    raise
+                # La conexión reutilizada pudo cerrarse en el servidor: reintentar con una nueva
+                connection.close()
+                connection = self._connect(key)
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+
+            if response.status == 304 and cached is not None:
+                response.read()
+                self._release(key, connection, response)
+                self._count('revalidated')
+                return 304, None, cached[0]
+            if response.status in _REDIRECT_STATUSES:
+                location = response.getheader('Location')
+                connection.close()
+                if not location:
+                    raise FetchError(f'Redirección sin destino (HTTP {response.status})')
+                return response.status, location, None
+            if response.status != 200:
+                connection.close()
+                raise FetchError(f'El servidor respondió HTTP {response.status}')
+
+            body = self._read_body(response, deadline)
+            self._release(key, connection, response)
+        except BaseException:
+            connection.close()
+            raise
+
+        self._downloaded(url, body, response.getheader)
+        return 200, None, body
+
+    def _read_body(self, response: http.client.HTTPResponse, deadline: float) -> memoryview:
+        """Lee el cuerpo en un único buffer sin superar max_bytes ni el tiempo máximo"""
+        length = response.getheader('Content-Length')
+        expected = int(length) if length and length.isdigit() else None
+        if expected is not None and expected > self.max_bytes:
+            raise self._too_large()
+
+        # Con Content-Length se reserva el buffer exacto; si no, crece por bloques hasta max_bytes + 1
+        buffer = bytearray(expected if expected is not None else _CHUNK_SIZE)
+        view = memoryview(buffer)
+        size = 0
+        while True:
+            if time.monotonic() > deadline:
+                raise FetchError('Tiempo de descarga agotado')
+            if size == len(buffer):
+                if expected is not None:
+                    break
+                if size > self.max_bytes:
+                    raise self._too_large()
+                view.release()
+                buffer.extend(bytes(min(len(buffer), self.max_bytes + 1 - size)))
+                view = memoryview(buffer)
+            read = response.readinto(view[size:])
+            if not read:
+                break
+            size += read
+        if size > self.max_bytes:
+            raise self._too_large()
+        if expected is not None and size < expected:
+            raise FetchError('Descarga incompleta')
+        return view[:size].toreadonly()
+
+    async def _get_async(self, url: str) -> Tuple[int, Optional[str], Optional[memoryview]]:
+        """Una petición GET sobre asyncio; devuelve (estado, Location, cuerpo)"""
+        key, path, headers, cached = self._prepare(url)
+        host = key[1] if key[2] in (80, 443) else f'{key[1]}:{key[2]}'
+        request = ''.join([f'GET {path} HTTP/1.1\r\nHost: {host}\r\n']
+                          + [f'{name}: {value}\r\n' for name, value in headers.items()] + ['\r\n'])
+
+        reader, writer, reused = await self._acquire_async(key)
+        try:
+            try:
+                status, response_headers = await self._exchange_async(reader, writer, request)
+            except (OSError, asyncio.IncompleteReadError):
+                if not reused:
+                    raise
+                # La conexión reutilizada pudo cerrarse en el servidor: reintentar con una nueva
+                writer.close()
+                reader, writer = await self._connect_async(key)
+                status, response_headers = await self._exchange_async(reader, writer, request)
+
+            if status == 304 and cached is not None:
+                _, keep_alive = await self._read_body_async(reader, response_headers, status)
+                self._release_async(key, reader, writer, keep_alive)
+                self._count('revalidated')
+                return 304, None, cached[0]
+            if status in _REDIRECT_STATUSES:
+                writer.close()
+                if not response_headers.get('location'):
+                    raise FetchError(f'Redirección sin destino (HTTP {status})')
+                return status, response_headers['location'], None
+            if status != 200:
+                writer.close()
+                raise FetchError(f'El servidor respondió HTTP {status}')
+
+            body, keep_alive = await self._read_body_async(reader, response_headers, status)
+            self._release_async(key, reader, writer, keep_alive)
+        except BaseException:
+            writer.close()
+            raise
+
+        self._downloaded(url, body, lambda name: response_headers.get(name.lower()))
+        return 200, None, body
+
+    async def _exchange_async(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, request: str):
+        """Envía la petición y lee la línea de estado y las cabeceras"""
+        writer.write(request.encode('latin-1'))
+        await asyncio.wait_for(writer.drain(), self.timeout)
+        head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.timeout)
+        lines = head.decode('latin-1').split('\r\n')
+        version, status = lines[0].split(' ', 2)[:2]
+        if not version.startswith('HTTP/') or not status.isdigit():
+            raise http.client.BadStatusLine(lines[0])
+        response_headers = {'_version': version}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            if name:
+                response_headers[name.strip().lower()] = value.strip()
+        return int(status), response_headers
+
+    async def _read_body_async(self, reader: asyncio.StreamReader, response_headers: dict,
+                               status: int) -> Tuple[memoryview, bool]:
+        """Lee el cuerpo (Content-Length, chunked o hasta el cierre); devuelve (cuerpo, conexión reutilizable)"""
+        connection = response_headers.get('connection', '').lower()
+        keep_alive = connection != 'close' and (response_headers['_version'] != 'HTTP/1.0' or connection == 'keep-alive')
+        length = response_headers.get('content-length')
+        if status == 304:
+            return memoryview(b''), keep_alive
+
+        if 'chunked' in response_headers.get('transfer-encoding', '').lower():
+            chunks, size = [], 0
+            while True:
+                line = await asyncio.wait_for(reader.readuntil(b'\r\n'), self.timeout)
+                try:
+                    chunk_size = int(line.split(b';', 1)[0].strip(), 16)
+                except ValueError as e:
+                    raise FetchError('Respuesta chunked inválida') from e
+                if chunk_size == 0:
+                    # Trailers opcionales hasta la línea vacía
+                    while (await asyncio.wait_for(reader.readuntil(b'\r\n'), self.timeout)) != b'\r\n':
+                        pass
+                    break
+                size += chunk_size
+                if size > self.max_bytes:
+                    raise self._too_large()
+                chunks.append(await self._read_exactly_async(reader, chunk_size))
+                await asyncio.wait_for(reader.readexactly(2), self.timeout)
+            return memoryview(b''.join(chunks)), keep_alive
+
+        if length is not None and length.isdigit():
+            if int(length) > self.max_bytes:
+                raise self._too_large()
+            return memoryview(await self._read_exactly_async(reader, int(length))).toreadonly(), keep_alive
+
+        # Sin longitud: hasta que el servidor cierre, como máximo max_bytes + 1
+        chunks, size = [], 0
+        while True:
+            chunk = await asyncio.wait_for(reader.read(_CHUNK_SIZE), self.timeout)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > self.max_bytes:
+                raise self._too_large()
+            chunks.append(chunk)
+        return memoryview(b''.join(chunks)), False
+
+    async def _read_exactly_async(self, reader: asyncio.StreamReader, count: int) -> bytearray:
+        """
+        Lee count bytes en un único buffer, por bloques de _CHUNK_SIZE con timeout por lectura
+        (como el camino síncrono: el límite de la descarga completa es el deadline de fetch_async)
+        """
+        buffer = bytearray(count)
+        view = memoryview(buffer)
+        size = 0
+        try:
+            while size < count:
+                chunk = await asyncio.wait_for(reader.read(min(_CHUNK_SIZE, count - size)), self.timeout)
+                if not chunk:
+                    raise FetchError('Descarga incompleta')
+                view[size:size + len(chunk)] = chunk
+                size += len(chunk)
+        finally:
+            view.release()
+        return buffer
+
+    async def _connect_async(self, key: Tuple[str, str, int]):
+        scheme, host, port = key
+        return await asyncio.wait_for(asyncio.open_connection(host, port, ssl=scheme == 'https'), self.timeout)
+
+    async def _acquire_async(self, key: Tuple[str, str, int]):
+        """Conexión asyncio inactiva del pool del host, o una nueva; devuelve (lector, escritor, reutilizada)"""
+        with self._lock:
+            idle = self._async_pool.get(key)
+            while idle:
+                reader, writer = idle.pop()
+                if not reader.at_eof() and not writer.is_closing():
+                    self._counters['reused_connections'] += 1
+                    return reader, writer, True
+                writer.close()
+        reader, writer = await self._connect_async(key)
+        return reader, writer, False
+
+    def _release_async(self, key: Tuple[str, str, int], reader: asyncio.StreamReader,
+                       writer: asyncio.StreamWriter, keep_alive: bool):
+        if keep_alive:
+            with self._lock:
+                idle = self._async_pool.setdefault(key, [])
+                if len(idle) < self.pool_size:
+                    idle.append((reader, writer))
+                    return
+        writer.close()
+
+    def _connect(self, key: Tuple[str, str, int]) -> http.client.HTTPConnection:
+        scheme, host, port = key
+        connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        return connection_class(host, port, timeout=self.timeout)
+
+    def _acquire(self, key: Tuple[str, str, int]) -> Tuple[http.client.HTTPConnection, bool]:
+        """Conexión inactiva del pool del host, o una nueva; devuelve (conexión, reutilizada)"""
+        with self._lock:
+            idle = self._pool.get(key)
+            if idle:
+                self._counters['reused_connections'] += 1
+                return idle.pop(), True
+        return self._connect(key), False
+
+    def _release(self, key: Tuple[str, str, int], connection: http.client.HTTPConnection,
+                 response: http.client.HTTPResponse):
+        """Devuelve la conexión al pool si el servidor la mantiene abierta"""
+        if response.will_close or not response.isclosed():
+            connection.close()
+            return
+        with self._lock:
+            idle = self._pool.setdefault(key, [])
+            if len(idle) < self.pool_size:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def _cache_get(self, url: str):
+        with self._lock:
+            entry = self._cache.get(url)
+            if entry is not None:
+                self._cache.move_to_end(url)
+            return entry
+
+    def _cache_put(self, url: str, body: memoryview, etag: Optional[str], last_modified: Optional[str]):
+        if len(body) > self.cache_bytes:
+            return
+        with self._lock:
+            previous = self._cache.pop(url, None)
+            if previous is not None:
+                self._cache_used -= len(previous[0])
+            self._cache[url] = (body, etag, last_modified)
+            self._cache_used += len(body)
+            while self._cache_used > self.cache_bytes:
+                _, (evicted, _, _) = self._cache.popitem(last=False)
+                self._cache_used -= len(evicted)
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def close(self):
+        """Cierra las conexiones inactivas del pool"""
+        with self._lock:
+            pools, self._pool = self._pool, {}
+            async_pools, self._async_pool = self._async_pool, {}
+        for idle in pools.values():
+            for connection in idle:
+                connection.close()
+        for idle in async_pools.values():
+            for _, writer in idle:
+                writer.close()
+
+    def stats(self) -> dict:
+        """Contadores de descargas, caché y conexiones"""
+        with self._lock:
+            return dict(
+                self._counters,
+                cache_entries=len(self._cache),
+                cache_bytes=self._cache_used,
+                idle_connections=sum(len(idle) for idle in self._pool.values())
+                + sum(len(idle) for idle in self._async_pool.values())
+            )
+
+
+# Descargador del proceso: se replica en los procesos trabajadores del motor
+_settings = {
+    'max_bytes': 16 * 1024 * 1024,
+    'timeout': 10.0,
+    'deadline': 30.0,
+    'pool_size': 4,
+    'cache_bytes': 64 * 1024 * 1024
+}
+_fetcher: Optional[RemoteFetcher] = None
+_fetcher_lock = threading.Lock()
+
+
+def configure_fetcher(**settings):
+    """
+    Configura el descargador del proceso (max_bytes, timeout, deadline, pool_size, cache_bytes)
+    Descarta el anterior con su pool y su caché.
+    """
+    global _fetcher
+    unknown = set(settings) - set(_settings)
+    if unknown:
+        raise ValueError(f"Opciones de descarga desconocidas: {', '.join(sorted(unknown))}")
+    with _fetcher_lock:
+        _settings.update(settings)
+        previous, _fetcher = _fetcher, None
+    if previous is not None:
+        previous.close()
+
+
+def fetcher_settings() -> dict:
+    """Configuración actual (para replicarla en los procesos trabajadores con configure_fetcher)"""
+    return dict(_settings)
+
+
+def get_fetcher() -> RemoteFetcher:
+    """Descargador compartido del proceso, creado en el primer uso"""
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            _fetcher = RemoteFetcher(**_settings)
+        return _fetcher
+
+
+def fetch_image_bytes(url: str) -> memoryview:
+    """Descarga una imagen remota con el descargador del proceso (ver RemoteFetcher.fetch)"""
+    return get_fetcher().fetch(url)
+
+
+async def fetch_image_bytes_async(url: str) -> memoryview:
+    """Descarga una imagen remota sin bloquear el bucle de eventos (ver RemoteFetcher.fetch_async)"""
+    return await get_fetcher().fetch_async(url)
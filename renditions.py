@@ -0,0 +1,210 @@
+"""
+Renditions bajo demanda de un resultado
+La respuesta de procesamiento solo incluye los bordes; el montaje, el overlay, la
+imagen en grises, los bordes recodificados y la original (a tamaño completo o
+reducidas) se generan la primera vez que se piden desde su URL y se guardan en memoria.
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from image_processor import build_overlay, build_result_montage, decode_image_bytes
+from metrics import StageTimer
+from response_formats import OutputOptions, encode_image
+
+RENDITIONS = ('montage', 'overlay', 'grayscale', 'edges', 'original')
+
+
+def downscale(image: np.ndarray, max_side: Optional[int]) -> np.ndarray:
+    """Reduce la imagen para que su lado mayor no supere max_side (sin ampliar)"""
+    h, w = image.shape[:2]
+    if not max_side or max(h, w) <= max_side:
+        return image
+    scale = max_side / max(h, w)
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def render_rendition(source_bytes: bytes, edges_png: bytes, name: str, max_side: Optional[int] = None,
+                     output: Optional[dict] = None) -> dict:
+    """
+    Genera y codifica una rendition (se ejecuta en el motor de procesamiento)
+    
+    Args:
+        source_bytes: Contenido de la imagen original
+        edges_png: Bordes a resolución completa codificados en PNG
+        name: Rendition (ver RENDITIONS)
+        max_side: Lado mayor de la versión reducida (None para tamaño completo)
+        output: Opciones de codificación (OutputOptions.to_dict())
+    
+    Returns:
+        Diccionario con los bytes codificados y los tiempos por etapa
+    """
+    options = OutputOptions(**output) if output else OutputOptions()
+    timer = StageTimer()
+    with timer.stage('decode'):
+        image = None
+        if name != 'edges':
+            image = downscale(decode_image_bytes(source_bytes), max_side)
+        edges = None
+        if name in ('montage', 'overlay', 'edges'):
+            edges = cv2.imdecode(np.frombuffer(edges_png, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+            if edges is None:
+                raise ValueError("No se pudieron decodificar los bordes")
+            full_shape = edges.shape[:2]
+            if image is None:
+                edges = downscale(edges, max_side)
+            elif full_shape != image.shape[:2]:
+                edges = cv2.resize(edges, (image.shape[1], image.shape[0]), interpolation=cv2.INTER_AREA)
+            if edges.shape[:2] != full_shape:
+                # Cualquier borde dentro del área reducida se conserva como borde
+                _, edges = cv2.threshold(edges, 0, 255, cv2.THRESH_BINARY)
+
+    with timer.stage('montage'):
+        if name == 'montage':
+            gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            rendered = build_result_montage(image, gray_image, edges)
+        elif name == 'overlay':
+            rendered = build_overlay(image, edges)
+        elif name == 'grayscale':
+            rendered = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        elif name == 'edges':
+            rendered = edges
+        else:
+            rendered = image
+
+    with timer.stage('encode'):
+        data = encode_image(rendered, options.encoding, options.quality, options.compression)
+    return {'bytes': data, 'timings': timer.timings}
+
+
+class RenditionSource:
+    """
+    Datos de un resultado a partir de los que se generan sus renditions
+    
+    Args:
+        source_bytes: Contenido de la imagen original
+        edges_png: Bordes a resolución completa en PNG
+        width: Ancho de la imagen original
+        height: Alto de la imagen original
+    """
+
+    def __init__(self, source_bytes: bytes, edges_png: bytes, width: int, height: int):
+        self.source_bytes = source_bytes
+        self.edges_png = edges_png
+        self.width = width
+        self.height = height
+        self.rendered = {}   # (rendition, max_side, encoding, quality, compression) -> bytes
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.source_bytes) + len(self.edges_png) + sum(len(data) for data in self.rendered.values())
+
+
+class RenditionStore:
+    """
+    Almacén en memoria de resultados y de sus renditions ya generadas, con caducidad y presupuesto en bytes
+    
+    Args:
+        ttl: Segundos sin uso tras los que un resultado caduca
+        max_bytes: Bytes máximos ocupados por todos los resultados y sus renditions
+    """
+
+    def __init__(self, ttl: float = 600.0, max_bytes: int = 512 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()   # id -> (RenditionSource, last_used)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def render_key(name: str, max_side: Optional[int], options: OutputOptions) -> tuple:
+        """Clave de una rendition generada dentro de su resultado"""
+        return name, max_side, options.encoding, options.quality, options.compression
+
+    def add(self, source: RenditionSource) -> str:
+        """Guarda un resultado y devuelve su identificador"""
+        result_id = uuid.uuid4().hex
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            self._items[result_id] = (source, now)
+            self._bytes += source.nbytes
+            self._evict()
+        return result_id
+
+    def get(self, result_id: str) -> Optional[RenditionSource]:
+        """Devuelve el resultado (renovando su caducidad) o None"""
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            item = self._items.get(result_id)
+            if item is None:
+                return None
+            self._items[result_id] = (item[0], now)
+            self._items.move_to_end(result_id)
+            return item[0]
+
+    def get_rendered(self, source: RenditionSource, key: tuple) -> Optional[bytes]:
+        """Rendition ya generada de un resultado, o None"""
+        with self._lock:
+            data = source.rendered.get(key)
+            if data is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+            return data
+
+    def put_rendered(self, result_id: str, key: tuple, data: bytes):
+        """Guarda una rendition generada si su resultado sigue en el almacén"""
+        with self._lock:
+            item = self._items.get(result_id)
+            if item is None:
+                return
+            previous = item[0].rendered.get(key)
+            item[0].rendered[key] = data
+            self._bytes += len(data) - len(previous or b'')
+            self._evict()
+
+    def remove(self, result_id: str) -> bool:
+        """Elimina un resultado y sus renditions"""
+        with self._lock:
+            item = self._items.pop(result_id, None)
+            if item is None:
+                return False
+            self._bytes -= item[0].nbytes
+            return True
+
+    def stats(self) -> dict:
+        """Resultados guardados, ocupación y aciertos de las renditions"""
+        with self._lock:
+            return {
+                'entries': len(self._items),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+            }
+
+    def _evict(self):
+        """Expulsa los menos usados si se supera el presupuesto (llamar con el lock tomado)"""
+        while self._bytes > self.max_bytes and len(self._items) > 1:
+            _, (evicted, _) = self._items.popitem(last=False)
+            self._bytes -= evicted.nbytes
+
+    def _expire(self, now: float):
+        """Elimina los resultados caducados (llamar con el lock tomado)"""
+        while self._items:
+            result_id, (source, last_used) = next(iter(self._items.items()))
+            if now - last_used <= self.ttl:
+                break
+            del self._items[result_id]
+            self._bytes -= source.nbytes
@@ -0,0 +1,267 @@
+"""
+Formatos de respuesta negociados
+Permite devolver los resultados como JSON con base64 (por defecto), como cuerpo
+binario PNG/JPEG/WebP, como multipart, o como máscara de bordes compacta
+(1 bit por píxel o codificada por longitud de rachas).
+"""
+
+from typing import Mapping, Optional
+
+import cv2
+import numpy as np
+
+# formato -> (extensión para cv2.imencode, tipo MIME)
+IMAGE_ENCODINGS = {
+    'png': ('.png', 'image/png'),
+    'jpeg': ('.jpg', 'image/jpeg'),
+    'webp': ('.webp', 'image/webp'),
+}
+
+MASK_ENCODINGS = {
+    'mask': 'application/x-edge-mask',   # 1 bit por píxel (np.packbits, fila a fila, MSB primero)
+    'rle': 'application/x-edge-rle',     # rachas uint32 little-endian, empezando por fondo
+}
+
+FORMATS = ('json', 'multipart') + tuple(IMAGE_ENCODINGS) + tuple(MASK_ENCODINGS)
+
+# Tipo MIME de la cabecera Accept -> formato
+ACCEPT_FORMATS = {
+    'application/json': 'json',
+    'multipart/mixed': 'multipart',
+    'image/png': 'png',
+    'image/jpeg': 'jpeg',
+    'image/webp': 'webp',
+    'application/x-edge-mask': 'mask',
+    'application/x-edge-rle': 'rle',
+}
+
+
+class OutputOptions:
+    """
+    Opciones de salida de una petición
+    
+    Args:
+        format: Formato de la respuesta (ver FORMATS)
+        image: Imagen a devolver en los formatos binarios: 'edges' o 'result' (montaje)
+        encoding: Codificación de las imágenes en JSON/multipart ('png', 'jpeg', 'webp')
+        quality: Calidad JPEG/WebP (1-100)
+        compression: Nivel de compresión PNG (0-9)
+        montage: En JSON/multipart, 'inline' incluye el montaje; 'url' lo deja para
+            generarlo bajo demanda desde su propia URL (ver renditions)
+    """
+
+    MONTAGE_MODES = ('inline', 'url')
+
+    def __init__(self, format: str = 'json', image: str = 'edges', encoding: str = 'png',
+                 quality: Optional[int] = None, compression: Optional[int] = None, montage: str = 'inline'):
+        if format not in FORMATS:
+            raise ValueError(f"Formato no soportado: {format}. Use: {', '.join(FORMATS)}")
+        if image not in ('edges', 'result'):
+            raise ValueError("El parámetro image debe ser 'edges' o 'result'")
+        if format in IMAGE_ENCODINGS:
+            encoding = format
+        if encoding not in IMAGE_ENCODINGS:
+            raise ValueError(f"Codificación no soportada: {encoding}")
+        if quality is not None and not 1 <= quality <= 100:
+            raise ValueError("La calidad debe estar entre 1 y 100")
+        if compression is not None and not 0 <= compression <= 9:
+            raise ValueError("El nivel de compresión debe estar entre 0 y 9")
+        if montage not in self.MONTAGE_MODES:
+            raise ValueError("El parámetro montage debe ser 'inline' o 'url'")
+        self.format = format
+        self.image = image
+        self.encoding = encoding
+        self.quality = quality
+        self.compression = compression
+        self.montage = montage
+
+    @classmethod
+    def from_params(cls, params: Mapping, accept: str = '', montage: str = 'inline') -> 'OutputOptions':
+        """
+        Construye las opciones a partir de los parámetros de la petición y la cabecera Accept
+        El parámetro format tiene prioridad sobre Accept; montage es el valor por defecto
+        del parámetro del mismo nombre.
+        """
+        fmt = params.get('format') or negotiate_format(accept)
+        quality = params.get('quality')
+        compression = params.get('compression')
+        return cls(
+            format=str(fmt).lower(),
+            image=str(params.get('image', 'edges')).lower(),
+            encoding=str(params.get('encoding', 'png')).lower(),
+            quality=int(quality) if quality not in (None, '') else None,
+            compression=int(compression) if compression not in (None, '') else None,
+            montage=str(params.get('montage') or montage).lower(),
+        )
+
+    @property
+    def needs_result(self) -> bool:
+        """Si hay que construir y codificar el montaje"""
+        if self.format in ('json', 'multipart'):
+            return not self.lazy_result
+        return self.format in IMAGE_ENCODINGS and self.image == 'result'
+
+    @property
+    def lazy_result(self) -> bool:
+        """Si el montaje se omite de la respuesta y se sirve bajo demanda desde su URL"""
+        return self.montage == 'url' and self.format in ('json', 'multipart')
+
+    @property
+    def needs_edges(self) -> bool:
+        """Si hay que codificar la imagen de bordes"""
+        return not (self.format in IMAGE_ENCODINGS and self.image == 'result')
+
+    @property
+    def is_mask(self) -> bool:
+        return self.format in MASK_ENCODINGS
+
+    @property
+    def is_default_png(self) -> bool:
+        """Si las imágenes son PNG con parámetros por defecto (compatibles con la caché de resultados)"""
+        return not self.is_mask and self.encoding == 'png' and self.compression is None
+
+    @property
+    def image_media_type(self) -> str:
+        return IMAGE_ENCODINGS[self.encoding][1]
+
+    @property
+    def image_extension(self) -> str:
+        return IMAGE_ENCODINGS[self.encoding][0]
+
+    def to_dict(self) -> dict:
+        """Representación serializable (para enviarla a otro proceso)"""
+        return {
+            'format': self.format,
+            'image': self.image,
+            'encoding': self.encoding,
+            'quality': self.quality,
+            'compression': self.compression,
+            'montage': self.montage,
+        }
+
+
+def negotiate_format(accept: str) -> str:
+    """
+    Elige el formato según la cabecera Accept (el primero reconocido, por orden de preferencia q)
+    
+    Args:
+        accept: Valor de la cabecera Accept
+    
+    Returns:
+        Formato (json si no se reconoce ninguno)
+    """
+    candidates = []
+    for position, item in enumerate((accept or '').split(',')):
+        parts = [p.strip() for p in item.split(';')]
+        media_type = parts[0].lower()
+        q = 1.0
+        for param in parts[1:]:
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if media_type in ACCEPT_FORMATS and q > 0:
+            candidates.append((-q, position, ACCEPT_FORMATS[media_type]))
+    return min(candidates)[2] if candidates else 'json'
+
+
+def encode_image(image: np.ndarray, encoding: str = 'png', quality: Optional[int] = None,
+                 compression: Optional[int] = None) -> bytes:
+    """
+    Codifica una imagen en memoria con las opciones de calidad/compresión indicadas
+    
+    Args:
+        image: Imagen (BGR o un solo canal)
+        encoding: 'png', 'jpeg' o 'webp'
+        quality: Calidad JPEG/WebP (1-100)
+        compression: Nivel de compresión PNG (0-9)
+    
+    Returns:
+        Bytes codificados
+    """
+    extension = IMAGE_ENCODINGS[encoding][0]
+    params = []
+    if encoding == 'png' and compression is not None:
+        params = [cv2.IMWRITE_PNG_COMPRESSION, compression]
+    elif encoding == 'jpeg' and quality is not None:
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+    elif encoding == 'webp' and quality is not None:
+        params = [cv2.IMWRITE_WEBP_QUALITY, quality]
+    success, encoded = cv2.imencode(extension, image, params)
+    if not success:
+        raise ValueError("Error codificando la imagen")
+    return encoded.tobytes()
+
+
+def pack_edge_mask(edges: np.ndarray) -> bytes:
+    """
+    Empaqueta el mapa de bordes a 1 bit por píxel
+    Cada fila ocupa ceil(ancho / 8) bytes, con el bit más significativo primero.
+    
+    Args:
+        edges: Imagen de bordes
+    
+    Returns:
+        Bytes de la máscara
+    """
+    return np.packbits(edges > 0, axis=1).tobytes()
+
+
+def rle_edge_mask(edges: np.ndarray) -> bytes:
+    """
+    Codifica el mapa de bordes por longitud de rachas en orden de filas
+    Las rachas alternan fondo/borde empezando siempre por fondo (que puede ser 0).
+    
+    Args:
+        edges: Imagen de bordes
+    
+    Returns:
+        Rachas como uint32 little-endian
+    """
+    flat = (edges.reshape(-1) > 0).view(np.int8)
+    # Posiciones donde cambia el valor, más los extremos
+    changes = np.flatnonzero(np.diff(flat)) + 1
+    boundaries = np.concatenate(([0], changes, [flat.size]))
+    runs = np.diff(boundaries)
+    if flat.size and flat[0]:
+        runs = np.concatenate(([0], runs))
+    return runs.astype('<u4').tobytes()
+
+
+def encode_edges(edges: np.ndarray, options: OutputOptions) -> bytes:
+    """Codifica la imagen de bordes según las opciones (imagen o máscara compacta)"""
+    if options.format == 'mask':
+        return pack_edge_mask(edges)
+    if options.format == 'rle':
+        return rle_edge_mask(edges)
+    return encode_image(edges, options.encoding, options.quality, options.compression)
+
+
+def encode_result(montage: np.ndarray, options: OutputOptions) -> bytes:
+    """Codifica el montaje según las opciones"""
+    return encode_image(montage, options.encoding, options.quality, options.compression)
+
+
+def build_multipart(parts, boundary: str) -> bytes:
+    """
+    Construye un cuerpo multipart/mixed
+    
+    Args:
+        parts: Lista de (tipo MIME, nombre, bytes)
+        boundary: Separador
+    
+    Returns:
+        Cuerpo completo
+    """
+    chunks = []
+    for media_type, name, data in parts:
+        chunks.append(
+            f'--{boundary}\r\nContent-Type: {media_type}\r\n'
+            f'Content-Disposition: inline; name="{name}"\r\n'
+            f'Content-Length: {len(data)}\r\n\r\n'.encode('utf-8')
+        )
+        chunks.append(data)
+        chunks.append(b'\r\n')
+    chunks.append(f'--{boundary}--\r\n'.encode('utf-8'))
+    return b''.join(chunks)
@@ -0,0 +1,235 @@
+"""
+Caché de resultados direccionada por contenido
+La clave combina el hash del contenido de la imagen con los parámetros de Canny
+(kernel y sigma del suavizado, umbrales). Tiene dos niveles: un LRU en memoria
+con presupuesto en bytes y un nivel en disco con expulsión por tamaño.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+
+class ResultCache:
+    """
+    Caché de dos niveles para montajes y bordes ya procesados
+    
+    Args:
+        cache_folder: Carpeta del nivel en disco
+        memory_budget: Bytes máximos en memoria
+        disk_budget: Bytes máximos en disco
+    """
+
+    def __init__(self, cache_folder: str, memory_budget: int, disk_budget: int):
+        self.cache_folder = cache_folder
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self._memory = OrderedDict()     # clave -> (entrada, tamaño)
+        self._memory_bytes = 0
+        self._disk = OrderedDict()       # clave -> tamaño (orden = último acceso)
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._hits = {'memory': 0, 'disk': 0}
+        self._misses = 0
+        os.makedirs(cache_folder, exist_ok=True)
+        self._load_disk_index()
+
+    @staticmethod
+    def make_key(image_bytes: bytes, threshold1: int, threshold2: int, kernel, sigma: float,
+                 backend: Optional[str] = None) -> str:
+        """
+        Calcula la clave de caché
+        
+        Args:
+            image_bytes: Contenido de la imagen
+            threshold1: Umbral Bajo
+            threshold2: Umbral Alto
+            kernel: Tamaño del kernel Gaussiano
+            sigma: Sigma del kernel Gaussiano
+            backend: Backend aproximado que produjo el resultado (None para los exactos, que comparten clave)
+        
+        Returns:
+            Clave hexadecimal
+        """
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        params = f"k{kernel[0]}x{kernel[1]}_s{float(sigma)}_t{int(threshold1)}-{int(threshold2)}"
+        if backend:
+            params += f"_b{backend}"
+        return hashlib.sha256(f"{digest}:{params}".encode('utf-8')).hexdigest()[:40]
+
+    def paths(self, key: str):
+        """Rutas en disco (montaje, bordes, metadatos) de una clave"""
+        base = os.path.join(self.cache_folder, key)
+        return base + '_result.png', base + '_edges.png', base + '.json'
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        Busca una entrada en memoria y, si no está, en disco
+        
+        Returns:
+            Diccionario con result_png, edges_png, meta y tier, o None si no existe
+        """
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None:
+                self._memory.move_to_end(key)
+                self._hits['memory'] += 1
+                entry = dict(cached[0], tier='memory')
+                on_disk = key in self._disk
+                if on_disk:
+                    self._disk.move_to_end(key)
+            elif key not in self._disk:
+                self._misses += 1
+                return None
+            else:
+                entry = None
+                on_disk = True
+
+        if entry is not None:
+            # Reescribir en disco si el nivel de disco la había expulsado
+            if not on_disk:
+                self._write_disk(key, entry['result_png'], entry['edges_png'], entry['meta'])
+            return entry
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self._forget_disk(key)
+                self._misses += 1
+                return None
+            self._disk.move_to_end(key)
+            self._hits['disk'] += 1
+        try:
+            # Conservar el orden de acceso entre reinicios
+            os.utime(self.paths(key)[2])
+        except OSError:
+            pass
+        self._remember(key, entry)
+        return dict(entry, tier='disk')
+
+    def put(self, key: str, result_png: bytes, edges_png: bytes, meta: dict):
+        """
+        Guarda un resultado en ambos niveles
+        
+        Args:
+            key: Clave de caché
+            result_png: Montaje codificado en PNG (None si se genera bajo demanda)
+            edges_png: Bordes codificados en PNG
+            meta: Estadísticas serializables (porcentaje, dimensiones)
+        """
+        entry = {'result_png': result_png, 'edges_png': edges_png, 'meta': meta}
+        self._remember(key, entry)
+        self._write_disk(key, result_png, edges_png, meta)
+
+    def _remember(self, key: str, entry: dict):
+        """Inserta en el LRU de memoria respetando el presupuesto"""
+        size = len(entry['result_png'] or b'') + len(entry['edges_png'])
+        if size > self.memory_budget:
+            return
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= previous[1]
+            self._memory[key] = (entry, size)
+            self._memory_bytes += size
+            while self._memory_bytes > self.memory_budget:
+                _, (_, evicted_size) = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted_size
+
+    def _write_disk(self, key: str, result_png: bytes, edges_png: bytes, meta: dict):
+        """Escribe la entrada en disco (escritura atómica) y expulsa las más antiguas si se supera el presupuesto"""
+        size = len(result_png or b'') + len(edges_png)
+        if size > self.disk_budget:
+            return
+        for path, data in zip(self.paths(key), (result_png, edges_png, json.dumps(meta).encode('utf-8'))):
+            if data is None:
+                # Entrada sin montaje: no dejar uno anterior de la misma clave
+                self._remove_file(path)
+                continue
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+        evicted = []
+        with self._lock:
+            previous = self._disk.pop(key, None)
+            if previous is not None:
+                self._disk_bytes -= previous
+            self._disk[key] = size
+            self._disk_bytes += size
+            while self._disk_bytes > self.disk_budget:
+                evicted_key, evicted_size = self._disk.popitem(last=False)
+                self._disk_bytes -= evicted_size
+                evicted.append(evicted_key)
+        for evicted_key in evicted:
+            self._remove_disk_files(evicted_key)
+
+    def _read_disk(self, key: str) -> Optional[dict]:
+        result_path, edges_path, meta_path = self.paths(key)
+        try:
+            result_png = None
+            if os.path.exists(result_path):
+                with open(result_path, 'rb') as f:
+                    result_png = f.read()
+            with open(edges_path, 'rb') as f:
+                edges_png = f.read()
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return {'result_png': result_png, 'edges_png': edges_png, 'meta': meta}
+
+    def _forget_disk(self, key: str):
+        """Elimina una clave del índice de disco (llamar con el lock tomado)"""
+        size = self._disk.pop(key, None)
+        if size is not None:
+            self._disk_bytes -= size
+
+    def _remove_disk_files(self, key: str):
+        for path in self.paths(key):
+            self._remove_file(path)
+
+    @staticmethod
+    def _remove_file(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _load_disk_index(self):
+        """Reconstruye el índice del nivel en disco a partir de los ficheros existentes, del más antiguo al más reciente"""
+        entries = []
+        for name in os.listdir(self.cache_folder):
+            if not name.endswith('.json'):
+                continue
+            key = name[:-len('.json')]
+            result_path, edges_path, meta_path = self.paths(key)
+            try:
+                size = os.path.getsize(edges_path)
+                if os.path.exists(result_path):
+                    size += os.path.getsize(result_path)
+                mtime = os.path.getmtime(meta_path)
+            except OSError:
+                continue
+            entries.append((mtime, key, size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    def stats(self) -> dict:
+        """Aciertos, fallos y ocupación de cada nivel"""
+        with self._lock:
+            return {
+                'hits': dict(self._hits),
+                'misses': self._misses,
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+                'memory_budget': self.memory_budget,
+                'disk_entries': len(self._disk),
+                'disk_bytes': self._disk_bytes,
+                'disk_budget': self.disk_budget,
+            }
@@ -2,49 +2,826 @@
 Rutas y endpoints de la aplicación Flask
 """
 
-from flask import render_template, request, jsonify
+from flask import (render_template, request, jsonify, send_file, redirect, Request, Response, g, current_app,
+                   has_app_context, has_request_context)
+from flask_sock import Sock
 from werkzeug.utils import secure_filename
+import io
 import os
+import json
+import logging
+import time
 from datetime import datetime
 import base64
+import functools
+import uuid
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
 import cv2
 
+import config
+from frame_scheduler import FrameScheduler, FrameDropped
+from stream_processor import StreamProcessorStore, decode_stream_frame
+from adaptive_control import AdaptiveController, upscale_edges
+from processing_engine import ProcessingEngine, EngineSaturated, chain_worker_setup
+from remote_fetcher import FetchError, FetchTooLarge, configure_fetcher, fetcher_settings, get_fetcher
+from edge_backends import (
+    backend_settings,
+    backends_info,
+    calibrate,
+    configure_backends,
+    is_exact,
+    validate_backend_name
+)
+from result_cache import ResultCache
+from job_queue import PRIORITIES, JobQueue, JobQueueFull
+from prepared_images import PreparedImageStore, prepare_image_bytes
+from edge_analytics import analyze_edges_png_job, analyze_image_bytes_job, parse_analytics_params
+from renditions import RENDITIONS, RenditionSource, RenditionStore, render_rendition
+from tiled_processor import read_image_size
+from persistence import AsyncWriter
+from storage import FileStore
+from warmup import Warmup
+from video_processor import VideoProgress, process_video
+from metrics import (
+    IN_FLIGHT,
+    REGISTRY,
+    REQUEST_BYTES,
+    REQUEST_ERRORS,
+    REQUEST_SECONDS,
+    REQUESTS_TOTAL,
+    record_timings,
+    server_timing_header
+)
+from batch_processor import iter_archive, process_batch
+from response_formats import OutputOptions, IMAGE_ENCODINGS, MASK_ENCODINGS, build_multipart, encode_edges
+
 from image_processor import (
-    apply_canny_edge_detection,
-    save_result_image,
-    save_single_edge_image,
-    process_realtime_frame,
-    encode_image_to_base64,
-    process_image_from_url,
+    detect_frame_edges,
+    process_image_file_job,
+    process_image_url_job,
+    process_image_bytes_job,
+    process_large_image_bytes_job,
+    process_image_url_memory_job,
+    png_data_uri,
+    encode_edges_png,
     calculate_edge_percentage
 )
 
-# Configuración (será usada desde app.py)
-UPLOAD_FOLDER = None
-RESULT_FOLDER = None
-ALLOWED_EXTENSIONS = None
-app = None
+# Clave de los servicios de cada aplicación en app.extensions
+EXTENSION_KEY = 'canny'
+
+VIDEO_UPLOAD_PATH = '/api/video'
+
+logger = logging.getLogger(__name__)
+
+
+def max_upload_size(path):
+    """Tamaño máximo del cuerpo de una petición: las subidas de vídeo tienen su propio límite"""
+    return config.VIDEO_MAX_FILE_SIZE if path == VIDEO_UPLOAD_PATH else config.MAX_FILE_SIZE
+
+
+class UploadRequest(Request):
+    """Petición con el límite de tamaño de su ruta (ver max_upload_size)"""
+
+    @property
+    def max_content_length(self):
+        return max_upload_size(self.path)
+
+
+class InMemoryUploadRequest(UploadRequest):
+    """
+    Petición que mantiene los ficheros subidos en memoria
+    Werkzeug vuelca a un fichero temporal las subidas de más de 500 KB; aquí el
+    tamaño ya está acotado por MAX_CONTENT_LENGTH, así que se usa siempre un buffer.
+    Los vídeos sí van a un fichero temporal: se copian al almacén de subidas sin leerlos enteros.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.path == VIDEO_UPLOAD_PATH:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        return io.BytesIO()
+
+
+class AppServices:
+    """
+    Estado de una aplicación: motor de procesamiento, cachés, almacenes, colas y calentamiento
+    Cada llamada a create_app() crea el suyo y lo guarda en app.extensions[EXTENSION_KEY];
+    las rutas lo obtienen con current_services() y los hilos de fondo entran en el
+    contexto de su aplicación con bind().
+    
+    Args:
+        flask_app: Aplicación Flask a la que pertenecen los servicios
+        upload_folder: Carpeta de las subidas
+        result_folder: Carpeta de los resultados
+        allowed_extensions: Extensiones de imagen admitidas
+    """
+
+    def __init__(self, flask_app, upload_folder, result_folder, allowed_extensions):
+        self.app = flask_app
+        self.upload_folder = upload_folder
+        self.result_folder = result_folder
+        self.allowed_extensions = allowed_extensions
+        self.async_writer = AsyncWriter(workers=config.PERSIST_WORKERS)
+        # Subidas y resultados con nombres por contenido, repartidos por prefijo y con expulsión en segundo plano
+        self.upload_store = FileStore(upload_folder, '/files/uploads', config.STORAGE_TTL,
+                                      config.STORAGE_UPLOAD_MAX_BYTES, self.async_writer)
+        self.result_store = FileStore(result_folder, '/files/results', config.STORAGE_TTL,
+                                      config.STORAGE_RESULT_MAX_BYTES, self.async_writer)
+        self.upload_store.start(config.STORAGE_SWEEP_INTERVAL)
+        self.result_store.start(config.STORAGE_SWEEP_INTERVAL)
+        self.processing_engine = ProcessingEngine(
+            mode=config.PROCESSING_ENGINE,
+            workers=config.PROCESSING_WORKERS,
+            max_pending=config.PROCESSING_MAX_PENDING,
+            worker_setup=engine_worker_setup()
+        )
+        self.stream_processors = None
+        if config.REALTIME_INCREMENTAL:
+            self.stream_processors = StreamProcessorStore(
+                session_ttl=config.REALTIME_SESSION_TTL,
+                tile_size=config.REALTIME_TILE_SIZE,
+                change_threshold=config.REALTIME_CHANGE_THRESHOLD,
+                smoothing=config.REALTIME_TEMPORAL_SMOOTHING,
+                kernel=config.GAUSSIAN_KERNEL,
+                sigma=config.GAUSSIAN_SIGMA
+            )
+        self.adaptive_controller = None
+        if config.REALTIME_ADAPTIVE:
+            self.adaptive_controller = AdaptiveController(
+                cooldown_frames=config.REALTIME_ADAPTIVE_COOLDOWN,
+                session_ttl=config.REALTIME_SESSION_TTL
+            )
+        self.frame_scheduler = FrameScheduler(
+            self.bind(process_stream_frame),
+            max_workers=config.REALTIME_WORKERS,
+            session_ttl=config.REALTIME_SESSION_TTL
+        )
+        self.result_cache = None
+        if config.RESULT_CACHE_ENABLED:
+            self.result_cache = ResultCache(
+                os.path.join(result_folder, 'cache'),
+                memory_budget=config.RESULT_CACHE_MEMORY_BYTES,
+                disk_budget=config.RESULT_CACHE_DISK_BYTES
+            )
+        self.job_queue = JobQueue(
+            workers=config.JOB_WORKERS,
+            max_queued=config.JOB_MAX_QUEUED,
+            result_ttl=config.JOB_RESULT_TTL,
+            retry_on=(EngineSaturated,),
+            result_budget=config.JOB_RESULT_MAX_BYTES
+        )
+        # Vídeos en su propia cola: un vídeo largo no ocupa los hilos de los trabajos de imágenes.
+        # Sin retry_on: la saturación del motor se espera frame a frame dentro del trabajo
+        self.video_queue = JobQueue(
+            workers=config.VIDEO_JOB_WORKERS,
+            max_queued=config.VIDEO_MAX_QUEUED,
+            result_ttl=config.JOB_RESULT_TTL,
+            on_discard=discard_video_upload
+        )
+        self.prepared_store = PreparedImageStore(
+            ttl=config.PREPARED_IMAGE_TTL,
+            max_bytes=config.PREPARED_IMAGE_MAX_BYTES
+        )
+        self.rendition_store = RenditionStore(
+            ttl=config.RENDITION_TTL,
+            max_bytes=config.RENDITION_MAX_BYTES
+        )
+        self.warmup = Warmup()
+
+    def bind(self, fn):
+        """Envuelve fn para que se ejecute en el contexto de esta aplicación (hilos del planificador y de las colas)"""
+        @functools.wraps(fn)
+        def in_app_context(*args, **kwargs):
+            with self.app.app_context():
+                return fn(*args, **kwargs)
+        return in_app_context
+
+    def start_warmup(self):
+        """
+        Calibra los backends y calienta el motor en segundo plano (o, sin calentamiento,
+        calibra aquí mismo como antes); /api/ready responde 200 cuando termina
+        """
+        calibration_sizes = config.EDGE_BACKEND_CALIBRATION_SIZES if config.EDGE_BACKEND_CALIBRATE else None
+        if not config.WARMUP_ENABLED:
+            if calibration_sizes:
+                calibrate(calibration_sizes)
+                self.processing_engine.worker_setup = engine_worker_setup()
+            self.warmup.skip()
+            return
+
+        def after_calibration():
+            # Los trabajadores que arranque el calentamiento heredan la tabla de 'auto' recién medida
+            self.processing_engine.worker_setup = engine_worker_setup()
+
+        self.warmup.start(self.processing_engine, tuple(config.WARMUP_IMAGE_SIZE), calibration_sizes, after_calibration)
+
+    def close(self):
+        """Detiene los hilos de fondo y los pools (los trabajos en espera se descartan)"""
+        # La calibración no se puede interrumpir: un proceso que sale con el hilo dentro
+        # de OpenCV aborta, así que se espera a que termine antes de cerrar el motor
+        self.warmup.join()
+        self.job_queue.shutdown()
+        self.video_queue.shutdown()
+        self.frame_scheduler.shutdown()
+        self.upload_store.stop()
+        self.result_store.stop()
+        self.processing_engine.shutdown(wait=False)
+        self.async_writer.shutdown()
+
+
+def current_services():
+    """Servicios de la aplicación en curso (requiere contexto de aplicación)"""
+    return current_app.extensions[EXTENSION_KEY]
 
 
 def init_routes(flask_app, upload_folder, result_folder, allowed_extensions):
-    """Inicializa las rutas con la instancia de Flask y la configuración"""
-    global app, UPLOAD_FOLDER, RESULT_FOLDER, ALLOWED_EXTENSIONS
-    app = flask_app
-    UPLOAD_FOLDER = upload_folder
-    RESULT_FOLDER = result_folder
-    ALLOWED_EXTENSIONS = allowed_extensions
+    """
+    Crea los servicios de la aplicación y registra sus rutas
+    Se puede llamar con varias aplicaciones: cada una tiene sus propios servicios.
+    
+    Returns:
+        AppServices de la aplicación
+    """
+    flask_app.request_class = InMemoryUploadRequest if config.IN_MEMORY_PIPELINE else UploadRequest
+    # Backend de bordes, kernel Gaussiano y descargas (del proceso; los trabajadores del motor los replican).
+    # La calibración (en el calentamiento) fija qué backend usa 'auto'
+    configure_backends(config.EDGE_BACKEND, config.GAUSSIAN_KERNEL, config.GAUSSIAN_SIGMA)
+    configure_fetcher(
+        max_bytes=config.URL_FETCH_MAX_BYTES,
+        timeout=config.URL_FETCH_TIMEOUT,
+        deadline=config.URL_FETCH_DEADLINE,
+        pool_size=config.URL_FETCH_POOL_SIZE,
+        cache_bytes=config.URL_FETCH_CACHE_BYTES
+    )
+    services = AppServices(flask_app, upload_folder, result_folder, allowed_extensions)
+    flask_app.extensions[EXTENSION_KEY] = services
     
     # Registrar todas las rutas
-    register_routes()
+    register_routes(flask_app, Sock(flask_app))
+    services.start_warmup()
+    flask_app.before_request(start_request_metrics)
+    flask_app.after_request(finish_request_metrics)
+    flask_app.teardown_request(end_request_metrics)
+    return services
+
+
+def engine_worker_setup():
+    """Inicialización de los procesos trabajadores con el estado actual de este proceso (backends, descargas)"""
+    return chain_worker_setup(
+        functools.partial(configure_backends, **backend_settings()),
+        functools.partial(configure_fetcher, **fetcher_settings())
+    )
 
 
 def allowed_file(filename):
     """Verifica si la extensión del archivo es permitida"""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in current_services().allowed_extensions
 
 
-def register_routes():
-    """Registra todas las rutas de la aplicación"""
+def allowed_video(filename):
+    """Verifica si la extensión del vídeo es permitida"""
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in config.VIDEO_EXTENSIONS
+
+
+def process_stream_frame(session_id, frame_data, width, height, threshold1, threshold2, backend=None):
+    """
+    Procesa un frame de tiempo real de una sesión (se ejecuta en los hilos del planificador)
+    En modo incremental reutiliza los bordes de los mosaicos que no cambiaron; el estado
+    vive en este proceso, así que no pasa por el motor de procesamiento. Los backends
+    aproximados (p. ej. sobel) procesan siempre el frame completo.
+    """
+    services = current_services()
+    # En modo adaptativo, procesar a la resolución recomendada y ampliar los bordes
+    process_width, process_height = width, height
+    if services.adaptive_controller is not None:
+        process_width, process_height = services.adaptive_controller.processing_size(session_id, width, height)
+    
+    if services.stream_processors is None or not is_exact(backend or config.EDGE_BACKEND):
+        edges = services.processing_engine.run(detect_frame_edges, frame_data, process_width, process_height,
+                                               threshold1, threshold2, backend)
+    else:
+        gray = decode_stream_frame(frame_data, process_width, process_height)
+        edges = services.stream_processors.get(session_id).process(gray, threshold1, threshold2)
+    return upscale_edges(edges, width, height)
+
+
+def observe_realtime(session_id, latency, dropped=False):
+    """
+    Informa al control adaptativo del resultado de un frame
+    
+    Returns:
+        Tupla (recomendación o None si el modo adaptativo está desactivado, True si cambió)
+    """
+    services = current_services()
+    if services.adaptive_controller is None:
+        return None, False
+    return services.adaptive_controller.observe(session_id, latency, dropped)
+
+
+def realtime_session_id():
+    """Identificador de la sesión de tiempo real (campo, cabecera o IP del cliente)"""
+    return (request.form.get('session')
+            or request.headers.get('X-Session-Id')
+            or request.remote_addr
+            or 'anonymous')
+
+
+def frame_size(width, height):
+    """
+    Valida el tamaño de un frame de tiempo real
+    
+    Returns:
+        Tupla (ancho, alto) como enteros
+    
+    Raises:
+        ValueError: si algún lado no está entre 1 y REALTIME_MAX_FRAME_SIDE
+    """
+    width, height = int(width), int(height)
+    if not (1 <= width <= config.REALTIME_MAX_FRAME_SIDE and 1 <= height <= config.REALTIME_MAX_FRAME_SIDE):
+        raise ValueError(f'El ancho y el alto del frame deben estar entre 1 y {config.REALTIME_MAX_FRAME_SIDE}')
+    return width, height
+
+
+# Parámetros iniciales de un canal WebSocket de tiempo real
+STREAM_DEFAULTS = {'width': 640, 'height': 480, 'threshold1': 100, 'threshold2': 200, 'backend': None}
+
+
+def apply_stream_control(params, stream_options, data):
+    """
+    Aplica un mensaje de control del WebSocket de tiempo real
+    
+    Args:
+        params: Parámetros del canal (se actualizan en el sitio)
+        stream_options: OutputOptions actuales de las respuestas binarias
+        data: Mensaje JSON ya decodificado
+    
+    Returns:
+        OutputOptions a usar desde ahora
+    
+    Raises:
+        ValueError, TypeError, AttributeError: si el mensaje no es válido
+    """
+    params['width'], params['height'] = frame_size(data.get('width', params['width']),
+                                                   data.get('height', params['height']))
+    params['threshold1'] = int(data.get('thresholdLow', params['threshold1']))
+    params['threshold2'] = int(data.get('thresholdHigh', params['threshold2']))
+    if 'backend' in data:
+        params['backend'] = request_backend(data)
+    if any(key in data for key in ('format', 'quality', 'compression')):
+        options = OutputOptions.from_params(dict({'format': stream_options.format}, **data))
+        if options.format in ('json', 'multipart'):
+            raise ValueError('Formato no soportado en WebSocket')
+        return options
+    return stream_options
+
+
+def url_result_payload(result, result_path, edges_path):
+    """Campos JSON de la respuesta de /api/process-url"""
+    return {
+        'success': True,
+        'result_image': result_path,
+        'edges_image': edges_path,
+        'edge_percentage': round(result['edge_percentage'], 2),
+        'image_width': result['image_width'],
+        'image_height': result['image_height'],
+        'backend': result['backend']
+    }
+
+
+def montage_mode():
+    """Modo por defecto del montaje en JSON/multipart: bajo demanda ('url') o incluido ('inline')"""
+    return 'url' if config.LAZY_RENDITIONS else 'inline'
+
+
+def attach_renditions(payload, result, options, source_bytes, montage_bytes=None):
+    """
+    Guarda el resultado para generar sus renditions bajo demanda y añade sus URLs a la respuesta
+    
+    Args:
+        payload: Campos JSON de la respuesta
+        result: Resultado del motor (con edges_png, image_width e image_height)
+        options: OutputOptions de la petición
+        source_bytes: Contenido de la imagen original
+        montage_bytes: Montaje PNG ya disponible (p. ej. de la caché de resultados)
+    
+    Returns:
+        Campos JSON con result_id y renditions, o los mismos si el montaje va incluido
+    """
+    if not options.lazy_result or result.get('edges_png') is None or source_bytes is None:
+        return payload
+    source = RenditionSource(bytes(source_bytes), result['edges_png'], result['image_width'], result['image_height'])
+    # Los bordes en PNG ya codificados (y el montaje, si lo hay) son renditions servidas sin recalcular
+    default_png = OutputOptions()
+    source.rendered[RenditionStore.render_key('edges', None, default_png)] = result['edges_png']
+    if montage_bytes is not None:
+        source.rendered[RenditionStore.render_key('montage', None, default_png)] = montage_bytes
+    result_id = current_services().rendition_store.add(source)
+    renditions = {name: f'/api/results/{result_id}/{name}' for name in RENDITIONS}
+    payload = dict(payload, result_id=result_id, renditions=renditions)
+    if payload.get('result_image') is None:
+        payload['result_image'] = renditions['montage']
+    return payload
+
+
+def parse_threshold_pairs(data):
+    """
+    Obtiene los pares de umbrales de una petición de barrido
+    Acepta thresholdLow/thresholdHigh o una lista thresholds: [[bajo, alto], ...]
+    """
+    if 'thresholds' in data:
+        pairs = [(int(low), int(high)) for low, high in data['thresholds']]
+    else:
+        pairs = [(int(data.get('thresholdLow', 100)), int(data.get('thresholdHigh', 200)))]
+    
+    if not pairs or len(pairs) > config.SWEEP_MAX_THRESHOLDS:
+        raise ValueError(f'Se admiten entre 1 y {config.SWEEP_MAX_THRESHOLDS} pares de umbrales')
+    for low, high in pairs:
+        if low < 0 or high < 0 or low >= high:
+            raise ValueError('Umbrales inválidos. Umbral Bajo debe ser menor que Umbral Alto')
+    return pairs
+
+
+def analytics_query(params):
+    """Consultas de analítica de una petición con los límites configurados. ValueError si no son válidas"""
+    return parse_analytics_params(params, config.ANALYTICS_MAX_ROIS, config.ANALYTICS_MAX_GRID, config.ANALYTICS_MAX_BINS,
+                                  config.ANALYTICS_MAX_COORDINATE)
+
+
+def request_backend(params):
+    """Backend de bordes pedido (parámetro backend); None usa el predeterminado. ValueError si no es válido"""
+    name = params.get('backend')
+    return validate_backend_name(name) if name else None
+
+
+def upload_bytes(file):
+    """Contenido de un fichero subido, leído del buffer en memoria cuando es posible"""
+    if isinstance(file.stream, io.BytesIO):
+        return file.stream.getvalue()
+    return file.read()
+
+
+def is_large_image(image_bytes):
+    """Indica, leyendo solo la cabecera, si la imagen debe procesarse por mosaicos"""
+    size = read_image_size(image_bytes)
+    return size is not None and size[0] * size[1] >= config.TILED_PROCESSING_PIXELS
+
+
+def persist_async(store, data, suffix, extension, enabled):
+    """
+    Encola la escritura de un fichero en segundo plano si la persistencia está activada
+    El nombre sale del hash del contenido: no hay colisiones y los repetidos no se reescriben.
+    
+    Returns:
+        URL donde quedará el fichero, o None si no se persiste
+    """
+    if not enabled:
+        return None
+    return store.url(store.save(data, suffix, extension))
+
+
+def data_uri(data, media_type):
+    """Data URI para incrustar una imagen codificada en JSON"""
+    if data is None:
+        return None
+    start = time.perf_counter()
+    if media_type == 'image/png':
+        uri = png_data_uri(data)
+    else:
+        uri = f'data:{media_type};base64,' + base64.b64encode(data).decode('utf-8')
+    note_timings({'base64': time.perf_counter() - start})
+    return uri
+
+
+def note_timings(timings):
+    """
+    Registra tiempos por etapa en los histogramas y, dentro de una petición,
+    los acumula para la cabecera Server-Timing
+    """
+    if not timings:
+        return
+    record_timings(timings)
+    if has_request_context():
+        stage_timings = g.setdefault('stage_timings', {})
+        for stage, seconds in timings.items():
+            stage_timings[stage] = stage_timings.get(stage, 0.0) + seconds
+
+
+def metrics_endpoint():
+    """Etiqueta de endpoint para las métricas (la regla de la ruta, no la URL concreta)"""
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def start_request_metrics():
+    """Antes de cada petición: en curso y tamaño del cuerpo"""
+    g.metrics_start = time.perf_counter()
+    g.metrics_endpoint = metrics_endpoint()
+    IN_FLIGHT.inc(g.metrics_endpoint)
+    REQUEST_BYTES.observe(request.content_length or 0, g.metrics_endpoint)
+
+
+def finish_request_metrics(response):
+    """Después de cada petición: duración, estado, errores y cabecera Server-Timing"""
+    if 'metrics_start' not in g:
+        return response
+    elapsed = time.perf_counter() - g.metrics_start
+    status = str(response.status_code)
+    REQUEST_SECONDS.observe(elapsed, g.metrics_endpoint)
+    REQUESTS_TOTAL.inc(g.metrics_endpoint, status)
+    if response.status_code >= 400:
+        REQUEST_ERRORS.inc(g.metrics_endpoint, status)
+    if config.SERVER_TIMING_HEADER and 'stage_timings' in g:
+        response.headers['Server-Timing'] = server_timing_header(g.stage_timings, elapsed)
+    return response
+
+
+def end_request_metrics(error=None):
+    """Al cerrar la petición (también si falló): deja de contarla como en curso"""
+    if 'metrics_endpoint' in g:
+        IN_FLIGHT.dec(g.metrics_endpoint)
+
+
+def collect_service_metrics():
+    """
+    Estadísticas del motor, la cola de trabajos, las cachés, el tiempo real, las descargas y la persistencia
+    de la aplicación que atiende /metrics (fuera de una aplicación no hay nada que informar)
+    """
+    if not has_app_context() or EXTENSION_KEY not in current_app.extensions:
+        return
+    services = current_services()
+    engine = services.processing_engine.stats()
+    yield 'canny_engine_in_flight', 'gauge', 'Trabajos en el motor de procesamiento', engine['in_flight']
+    yield 'canny_engine_completed_total', 'counter', 'Trabajos completados por el motor', engine['completed']
+    yield 'canny_engine_rejected_total', 'counter', 'Trabajos rechazados por saturación', engine['rejected']
+    jobs = services.job_queue.stats()
+    yield 'canny_jobs_queued', 'gauge', 'Trabajos asíncronos en espera', jobs['jobs']['queued']
+    yield 'canny_jobs_running', 'gauge', 'Trabajos asíncronos en ejecución', jobs['jobs']['running']
+    yield 'canny_jobs_completed_total', 'counter', 'Trabajos asíncronos completados', jobs['completed']
+    yield 'canny_jobs_failed_total', 'counter', 'Trabajos asíncronos fallidos', jobs['failed']
+    yield 'canny_jobs_rejected_total', 'counter', 'Trabajos asíncronos rechazados (cola llena)', jobs['rejected']
+    yield 'canny_jobs_result_bytes', 'gauge', 'Bytes de resultados de trabajos terminados en memoria', jobs['result_bytes']
+    yield 'canny_jobs_evicted_total', 'counter', 'Trabajos terminados eliminados por JOB_RESULT_MAX_BYTES', jobs['evicted']
+    videos = services.video_queue.stats()
+    yield 'canny_video_jobs_queued', 'gauge', 'Vídeos en espera', videos['jobs']['queued']
+    yield 'canny_video_jobs_running', 'gauge', 'Vídeos en procesamiento', videos['jobs']['running']
+    yield 'canny_video_jobs_completed_total', 'counter', 'Vídeos procesados', videos['completed']
+    yield 'canny_video_jobs_failed_total', 'counter', 'Vídeos fallidos o cancelados', videos['failed']
+    if services.result_cache is not None:
+        cache = services.result_cache.stats()
+        yield 'canny_cache_hits_total', 'counter', 'Aciertos de la caché de resultados', sum(cache['hits'].values())
+        yield 'canny_cache_misses_total', 'counter', 'Fallos de la caché de resultados', cache['misses']
+        yield 'canny_cache_memory_bytes', 'gauge', 'Bytes en el nivel de memoria de la caché', cache['memory_bytes']
+        yield 'canny_cache_disk_bytes', 'gauge', 'Bytes en el nivel de disco de la caché', cache['disk_bytes']
+    renditions = services.rendition_store.stats()
+    yield 'canny_rendition_hits_total', 'counter', 'Renditions servidas ya generadas', renditions['hits']
+    yield 'canny_rendition_misses_total', 'counter', 'Renditions generadas bajo demanda', renditions['misses']
+    yield 'canny_rendition_bytes', 'gauge', 'Bytes de resultados y renditions en memoria', renditions['bytes']
+    realtime = services.frame_scheduler.stats()
+    yield 'canny_realtime_sessions', 'gauge', 'Sesiones de tiempo real activas', realtime['active_sessions']
+    yield 'canny_realtime_dropped', 'gauge', 'Frames descartados en las sesiones activas', realtime['dropped']
+    # En modo 'process' las descargas ocurren en los trabajadores: aquí solo se ven las de este proceso
+    fetcher = get_fetcher().stats()
+    yield 'canny_fetch_downloads_total', 'counter', 'Imágenes remotas descargadas', fetcher['downloads']
+    yield 'canny_fetch_revalidated_total', 'counter', 'Descargas servidas desde la caché tras un 304', fetcher['revalidated']
+    yield 'canny_fetch_failed_total', 'counter', 'Descargas remotas fallidas', fetcher['failed'] + fetcher['rejected_too_large']
+    yield 'canny_fetch_cache_bytes', 'gauge', 'Bytes en la caché de descargas', fetcher['cache_bytes']
+    for area, store in (('uploads', services.upload_store), ('results', services.result_store)):
+        storage = store.stats()
+        yield f'canny_storage_{area}_bytes', 'gauge', f'Bytes en disco ({area}) medidos en la última pasada', storage['bytes']
+        yield f'canny_storage_{area}_evicted_total', 'counter', f'Ficheros expulsados ({area})', storage['evicted']
+    writer = services.async_writer.stats()
+    yield 'canny_persist_pending', 'gauge', 'Escrituras a disco pendientes', writer['pending']
+    yield 'canny_persist_failed_total', 'counter', 'Escrituras a disco fallidas', writer['failed']
+
+
+# Un solo colector para todas las aplicaciones del proceso: informa de la que atiende la petición
+REGISTRY.add_collector(collect_service_metrics)
+
+
+def format_response(options, result_bytes, edges_bytes, payload, json_fields=('result_image_base64', 'edges_image_base64')):
+    """
+    Construye la respuesta en el formato negociado
+    
+    Args:
+        options: OutputOptions de la petición
+        result_bytes: Montaje codificado (o None)
+        edges_bytes: Bordes codificados (o máscara compacta, o None)
+        payload: Campos JSON (éxito, estadísticas, rutas)
+        json_fields: Nombres de los campos base64 del montaje y de los bordes en JSON
+    """
+    if options.format == 'json':
+        body = dict(payload)
+        result_field, edges_field = json_fields
+        if result_field:
+            body[result_field] = data_uri(result_bytes, options.image_media_type)
+        body[edges_field] = data_uri(edges_bytes, options.image_media_type)
+        return jsonify(body), 200
+    
+    # Metadatos en cabeceras para los cuerpos binarios
+    headers = {}
+    for field, header in (('edge_percentage', 'X-Edge-Percentage'), ('image_width', 'X-Image-Width'),
+                          ('image_height', 'X-Image-Height'), ('cache', 'X-Cache'),
+                          ('backend', 'X-Edge-Backend')):
+        if payload.get(field) is not None:
+            headers[header] = str(payload[field])
+    
+    if options.format in MASK_ENCODINGS:
+        headers['X-Mask-Encoding'] = options.format
+        return Response(edges_bytes, mimetype=MASK_ENCODINGS[options.format], headers=headers), 200
+    
+    if options.format in IMAGE_ENCODINGS:
+        body = result_bytes if options.image == 'result' else edges_bytes
+        return Response(body, mimetype=options.image_media_type, headers=headers), 200
+    
+    # multipart/mixed: metadatos JSON + montaje + bordes
+    boundary = uuid.uuid4().hex
+    parts = [('application/json', 'metadata', json.dumps(payload).encode('utf-8'))]
+    if result_bytes is not None:
+        parts.append((options.image_media_type, 'result', result_bytes))
+    if edges_bytes is not None:
+        parts.append((options.image_media_type, 'edges', edges_bytes))
+    return Response(build_multipart(parts, boundary), mimetype=f'multipart/mixed; boundary={boundary}', headers=headers), 200
+
+
+def run_upload_pipeline(image_bytes, filename, threshold1, threshold2, seed, options, backend=None):
+    """
+    Procesa una imagen subida en memoria (por mosaicos si es muy grande) y persiste en segundo plano
+    
+    Returns:
+        Tupla (resultado del motor, ruta de la subida, ruta del montaje, ruta de los bordes)
+    """
+    services = current_services()
+    if is_large_image(image_bytes):
+        # Imagen muy grande: procesar por mosaicos con memoria acotada y montaje reducido
+        result = services.processing_engine.run(
+            process_large_image_bytes_job,
+            image_bytes,
+            threshold1,
+            threshold2,
+            config.TILE_MEMORY_BUDGET,
+            config.TILE_HALO,
+            config.PREVIEW_MAX_SIDE,
+            options.to_dict(),
+            seed,
+            backend,
+            timeout=config.PROCESSING_TIMEOUT
+        )
+    else:
+        # Decodificar desde el buffer de la petición y codificar con imencode, sin disco
+        result = services.processing_engine.run(
+            process_image_bytes_job,
+            image_bytes,
+            threshold1,
+            threshold2,
+            seed,
+            options.to_dict(),
+            backend,
+            timeout=config.PROCESSING_TIMEOUT
+        )
+    note_timings(result.get('timings'))
+    # La persistencia es opcional y no bloquea la respuesta
+    upload_path = persist_async(services.upload_store, image_bytes, '', os.path.splitext(filename)[1], config.PERSIST_UPLOADS)
+    result_path, edges_path = persist_results_async(result, options)
+    return result, upload_path, result_path, edges_path
+
+
+def run_url_pipeline(image_url, threshold1, threshold2, options, backend=None):
+    """
+    Descarga y procesa una imagen remota en memoria y persiste en segundo plano
+    
+    Returns:
+        Tupla (resultado del motor, ruta del montaje, ruta de los bordes)
+    """
+    result = current_services().processing_engine.run(
+        process_image_url_memory_job,
+        image_url,
+        threshold1,
+        threshold2,
+        options.to_dict(),
+        backend,
+        timeout=config.PROCESSING_TIMEOUT
+    )
+    note_timings(result.get('timings'))
+    result_path, edges_path = persist_results_async(result, options)
+    return result, result_path, edges_path
+
+
+def persist_results_async(result, options):
+    """Encola la escritura del montaje y los bordes (las máscaras compactas no se guardan)"""
+    services = current_services()
+    persist_results = config.PERSIST_RESULTS and not options.is_mask
+    result_path = persist_async(services.result_store, result['result_bytes'], '_result', options.image_extension,
+                                persist_results and result['result_bytes'] is not None)
+    edges_path = persist_async(services.result_store, result['edges_bytes'], '_edges', options.image_extension,
+                               persist_results and result['edges_bytes'] is not None)
+    return result_path, edges_path
+
+
+def upload_job(image_bytes, filename, threshold1, threshold2, seed, output, backend=None):
+    """Trabajo asíncrono equivalente a /api/process"""
+    options = OutputOptions(**output)
+    result, upload_path, result_path, edges_path = run_upload_pipeline(
+        image_bytes, filename, threshold1, threshold2, seed, options, backend
+    )
+    return {
+        'options': output,
+        'result_bytes': result['result_bytes'],
+        'edges_bytes': result['edges_bytes'],
+        'payload': attach_renditions({
+            'success': True,
+            'message': 'Imagen procesada correctamente',
+            'original_image': upload_path,
+            'result_image': result_path,
+            'edges_image': edges_path,
+            'edge_percentage': round(result['edge_percentage'], 2),
+            'image_width': result['image_width'],
+            'image_height': result['image_height'],
+            'backend': result['backend'],
+            'tiled': 'tile_size' in result
+        }, result, options, image_bytes)
+    }
+
+
+def url_job(image_url, threshold1, threshold2, output, backend=None):
+    """Trabajo asíncrono equivalente a /api/process-url"""
+    options = OutputOptions(**output)
+    result, result_path, edges_path = run_url_pipeline(image_url, threshold1, threshold2, options, backend)
+    return {
+        'options': output,
+        'result_bytes': result['result_bytes'],
+        'edges_bytes': result['edges_bytes'],
+        'payload': attach_renditions(url_result_payload(result, result_path, edges_path), result, options,
+                                     result.get('source_bytes'))
+    }
+
+
+def remove_video_upload(input_path):
+    """Borra el vídeo subido salvo con PERSIST_UPLOADS"""
+    if not config.PERSIST_UPLOADS:
+        try:
+            os.remove(input_path)
+        except OSError:
+            pass
+
+
+def discard_video_upload(input_path, *args):
+    """on_discard de video_queue: un vídeo cancelado en espera o descartado al cerrar nunca llega a video_job"""
+    remove_video_upload(input_path)
+
+
+def video_job(input_path, output_name, threshold1, threshold2, frame_step, max_side, backend, progress):
+    """
+    Trabajo asíncrono de /api/video: escribe el vídeo de bordes en el almacén de resultados
+    Se ejecuta en un hilo de video_queue, que reparte los frames en el motor de procesamiento.
+    """
+    services = current_services()
+    try:
+        stats = process_video(
+            input_path, services.result_store.path(output_name), threshold1, threshold2, services.processing_engine,
+            frame_step=frame_step,
+            max_side=max_side,
+            max_in_flight=config.VIDEO_MAX_IN_FLIGHT,
+            fourcc=config.VIDEO_FOURCC,
+            timeout=config.PROCESSING_TIMEOUT,
+            backend=backend,
+            progress=progress
+        )
+    finally:
+        remove_video_upload(input_path)
+    # Tiempos acumulados de todo el vídeo: en los histogramas con etapas propias
+    note_timings({f'video_{stage}': seconds for stage, seconds in stats['timings'].items()})
+    return {'payload': dict(stats, video_url=services.result_store.url(output_name))}
+
+
+def sweep_job(prepared, pairs, include_edges):
+    """
+    Barrido de umbrales sobre una imagen preparada (se ejecuta en el motor de procesamiento)
+    
+    Returns:
+        Lista con el porcentaje de bordes de cada par y, si include_edges, su PNG en base64
+    """
+    results = []
+    for threshold1, threshold2, edges in prepared.sweep(pairs):
+        item = {
+            'thresholdLow': threshold1,
+            'thresholdHigh': threshold2,
+            'edge_percentage': calculate_edge_percentage(edges)
+        }
+        if include_edges:
+            item['edges_image_base64'] = png_data_uri(encode_edges_png(edges))
+        results.append(item)
+    return results
+
+
+def saturated_response(error):
+    """Respuesta 503 cuando el motor de procesamiento no admite más trabajos"""
+    response = jsonify({'success': False, 'message': str(error)})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+
+def register_routes(app, sock):
+    """Registra todas las rutas en la aplicación Flask y en su extensión WebSocket"""
     
     @app.route('/')
     def index():
@@ -55,8 +832,9 @@ def register_routes():
     def process_image():
         """
         Endpoint para procesar una imagen
-        Acepta: archivo de imagen, threshold1, threshold2
+        Acepta: archivo de imagen, threshold1, threshold2, backend (opcional, ver /api/backends)
         """
+        services = current_services()
         try:
             # Validar que se envió un archivo
             if 'file' not in request.files:
@@ -79,52 +857,100 @@ def register_routes():
             if threshold1 < 0 or threshold2 < 0 or threshold1 >= threshold2:
                 return jsonify({'success': False, 'message': 'Umbrales inválidos. Umbral Bajo debe ser menor que Umbral Alto'}), 400
             
-            # Guardar el archivo subido
-            filename = secure_filename(file.filename)
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
-            filename = timestamp + filename
-            upload_path = os.path.join(UPLOAD_FOLDER, filename)
-            file.save(upload_path)
-            print(f"📁 Archivo guardado en: {upload_path}")
-            
-            # Procesar la imagen
-            original_image, gray_image, edges = apply_canny_edge_detection(
-                upload_path, 
-                threshold1=threshold1, 
-                threshold2=threshold2,
-                seed=seed
-            )
-            print("✅ Imagen procesada con éxito")
+            # Formato de respuesta (parámetro format o cabecera Accept) y backend de bordes
+            options = OutputOptions.from_params(request.form, request.headers.get('Accept', ''), montage_mode())
+            backend = request_backend(request.form)
             
-            # Guardar resultados
-            result_filename = filename.rsplit('.', 1)[0] + '_result.png'
-            save_result_image(original_image, gray_image, edges, result_filename)
-            print(f"💾 Resultado guardado en: {os.path.join(RESULT_FOLDER, result_filename)}")
+            # Buscar en la caché por contenido + parámetros antes de guardar o procesar nada
+            # (los backends exactos comparten entrada: su resultado es idéntico)
+            image_bytes = upload_bytes(file)
+            cache_key = None
+            if services.result_cache is not None and options.is_default_png:
+                cache_key = ResultCache.make_key(
+                    image_bytes, threshold1, threshold2, config.GAUSSIAN_KERNEL, config.GAUSSIAN_SIGMA,
+                    None if is_exact(backend or config.EDGE_BACKEND) else backend or config.EDGE_BACKEND
+                )
+                cached = services.result_cache.get(cache_key)
+                # Una entrada guardada sin montaje no sirve a quien lo pide incluido
+                if cached is not None and (cached['result_png'] is not None or not options.needs_result):
+                    # Mismas URLs /files que un fallo: el nombre sale del hash del contenido
+                    result_bytes = cached['result_png'] if options.needs_result else None
+                    result_path, edges_path = persist_results_async(
+                        {'result_bytes': result_bytes, 'edges_bytes': cached['edges_png']}, options
+                    )
+                    meta = cached['meta']
+                    payload = attach_renditions({
+                        'success': True,
+                        'message': 'Imagen procesada correctamente',
+                        'cache': 'hit',
+                        'original_image': None,
+                        'result_image': result_path,
+                        'edges_image': edges_path,
+                        'edge_percentage': meta['edge_percentage'],
+                        'image_width': meta['image_width'],
+                        'image_height': meta['image_height'],
+                        'backend': meta.get('backend')
+                    }, dict(meta, edges_png=cached['edges_png']), options, image_bytes, cached['result_png'])
+                    return format_response(options, result_bytes, cached['edges_png'], payload)
             
-            # Guardar imagen de bordes individual
-            edges_filename = filename.rsplit('.', 1)[0] + '_edges.png'
-            save_single_edge_image(edges, edges_filename)
+            filename = secure_filename(file.filename)
             
-            # Incluir visualización en base64 para mostrar inmediatamente en la UI
-            result_b64 = encode_image_to_base64(os.path.join(RESULT_FOLDER, result_filename))
-            edges_b64 = encode_image_to_base64(os.path.join(RESULT_FOLDER, edges_filename))
+            large_image = is_large_image(image_bytes)
+            if large_image or config.IN_MEMORY_PIPELINE or options.format != 'json':
+                result, upload_path, result_path, edges_path = run_upload_pipeline(
+                    image_bytes, filename, threshold1, threshold2, seed, options, backend
+                )
+            else:
+                # Guardar el archivo subido (el trabajo lo lee de disco)
+                upload_name = services.upload_store.save(image_bytes, '', os.path.splitext(filename)[1], background=False)
+                upload_path = services.upload_store.url(upload_name)
+                logger.debug("archivo guardado path=%s bytes=%d", upload_path, len(image_bytes))
+                
+                # Procesar la imagen en el motor de procesamiento (fuera del hilo de la petición)
+                result_name = services.result_store.new_name('_result', options.image_extension)
+                edges_name = services.result_store.new_name('_edges', options.image_extension)
+                result = services.processing_engine.run(
+                    process_image_file_job,
+                    services.upload_store.path(upload_name),
+                    threshold1,
+                    threshold2,
+                    seed,
+                    services.result_store.path(result_name),
+                    services.result_store.path(edges_name),
+                    backend,
+                    timeout=config.PROCESSING_TIMEOUT
+                )
+                result_path = services.result_store.url(result_name)
+                edges_path = services.result_store.url(edges_name)
+                note_timings(result.get('timings'))
+                logger.debug("resultado guardado path=%s", result_path)
             
-            # Calcular estadísticas
-            edge_percentage = calculate_edge_percentage(edges)
+            edge_percentage = round(result['edge_percentage'], 2)
+            if cache_key is not None and result['edges_bytes'] is not None and (
+                    result['result_bytes'] is not None or options.lazy_result):
+                services.result_cache.put(cache_key, result['result_bytes'], result['edges_bytes'], {
+                    'edge_percentage': float(edge_percentage),
+                    'image_width': result['image_width'],
+                    'image_height': result['image_height'],
+                    'backend': result['backend']
+                })
             
-            return jsonify({
+            return format_response(options, result['result_bytes'], result['edges_bytes'], attach_renditions({
                 'success': True,
                 'message': 'Imagen procesada correctamente',
-                'original_image': os.path.join(UPLOAD_FOLDER, filename),
-                'result_image': os.path.join(RESULT_FOLDER, result_filename),
-                'edges_image': os.path.join(RESULT_FOLDER, edges_filename),
-                'result_image_base64': result_b64,
-                'edges_image_base64': edges_b64,
-                'edge_percentage': round(edge_percentage, 2),
-                'image_width': original_image.shape[1],
-                'image_height': original_image.shape[0]
-            }), 200
+                'cache': 'miss' if cache_key is not None else 'disabled',
+                'original_image': upload_path,
+                'result_image': result_path,
+                'edges_image': edges_path,
+                'edge_percentage': edge_percentage,
+                'image_width': result['image_width'],
+                'image_height': result['image_height'],
+                'backend': result['backend'],
+                'tiled': large_image
+            }, result, options, image_bytes))
             
+        except EngineSaturated as e:
+            return saturated_response(e)
         except ValueError as e:
             return jsonify({'success': False, 'message': str(e)}), 400
         except Exception as e:
@@ -135,6 +961,7 @@ def register_routes():
         """
         Endpoint alternativo para procesar una imagen desde URL
         """
+        services = current_services()
         try:
             data = request.get_json()
             image_url = data.get('url')
@@ -144,42 +971,401 @@ def register_routes():
             if not image_url:
                 return jsonify({'success': False, 'message': 'URL no proporcionada'}), 400
             
-            # Descargar y procesar la imagen
-            image, gray_image, edges = process_image_from_url(image_url, threshold1, threshold2)
+            try:
+                options = OutputOptions.from_params(data, request.headers.get('Accept', ''), montage_mode())
+                backend = request_backend(data)
+            except ValueError as e:
+                return jsonify({'success': False, 'message': str(e)}), 400
             
-            # Guardar resultados
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            result_filename = f'url_result_{timestamp}.png'
-            save_result_image(image, gray_image, edges, result_filename)
+            # Descargar y procesar la imagen en el motor de procesamiento
+            if config.IN_MEMORY_PIPELINE or options.format != 'json':
+                result, result_path, edges_path = run_url_pipeline(image_url, threshold1, threshold2, options, backend)
+            else:
+                result_name = services.result_store.new_name('_result', options.image_extension)
+                edges_name = services.result_store.new_name('_edges', options.image_extension)
+                result = services.processing_engine.run(
+                    process_image_url_job,
+                    image_url,
+                    threshold1,
+                    threshold2,
+                    services.result_store.path(result_name),
+                    services.result_store.path(edges_name),
+                    backend,
+                    timeout=config.PROCESSING_TIMEOUT
+                )
+                result_path = services.result_store.url(result_name)
+                edges_path = services.result_store.url(edges_name)
+                note_timings(result.get('timings'))
             
-            edges_filename = f'url_edges_{timestamp}.png'
-            save_single_edge_image(edges, edges_filename)
+            payload = attach_renditions(url_result_payload(result, result_path, edges_path), result, options,
+                                        result.get('source_bytes'))
+            return format_response(options, result['result_bytes'], result['edges_bytes'], payload)
             
-            edge_percentage = calculate_edge_percentage(edges)
+        except EngineSaturated as e:
+            return saturated_response(e)
+        except FetchTooLarge as e:
+            return jsonify({'success': False, 'message': str(e)}), 413
+        except FetchError as e:
+            return jsonify({'success': False, 'message': str(e)}), 502
+        except Exception as e:
+            return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
+
+    @app.route('/api/jobs', methods=['POST'])
+    def submit_job():
+        """
+        Encola un procesamiento y devuelve su identificador al instante
+        Acepta: file (multipart, mismos campos que /api/process) o JSON con url (como /api/process-url)
+        Parámetro opcional priority: high, normal o low
+        Retorna: 202 con job_id y la URL de estado
+        """
+        try:
+            if 'file' in request.files:
+                file = request.files['file']
+                if file.filename == '' or not allowed_file(file.filename):
+                    return jsonify({'success': False, 'message': 'Tipo de archivo no permitido. Use: PNG, JPG, JPEG, GIF, BMP'}), 400
+                params = request.form
+                threshold1 = int(params.get('thresholdLow', 100))
+                threshold2 = int(params.get('thresholdHigh', 200))
+                seed = int(params.get('seed', 0))
+                options = OutputOptions.from_params(params, request.headers.get('Accept', ''), montage_mode())
+                filename = secure_filename(file.filename)
+                kind, job_fn = 'process', upload_job
+                job_args = (upload_bytes(file), filename, threshold1, threshold2, seed, options.to_dict(),
+                            request_backend(params))
+            else:
+                params = request.get_json(silent=True) or {}
+                image_url = params.get('url')
+                if not image_url:
+                    return jsonify({'success': False, 'message': 'Envíe un archivo (file) o una URL (url)'}), 400
+                threshold1 = int(params.get('threshold1', 100))
+                threshold2 = int(params.get('threshold2', 200))
+                options = OutputOptions.from_params(params, request.headers.get('Accept', ''), montage_mode())
+                kind, job_fn = 'process-url', url_job
+                job_args = (image_url, threshold1, threshold2, options.to_dict(), request_backend(params))
+            
+            if threshold1 < 0 or threshold2 < 0 or threshold1 >= threshold2:
+                return jsonify({'success': False, 'message': 'Umbrales inválidos. Umbral Bajo debe ser menor que Umbral Alto'}), 400
+            
+            priority = params.get('priority', 'normal')
+            if priority not in PRIORITIES:
+                return jsonify({'success': False, 'message': f'Prioridad no válida. Use: {", ".join(PRIORITIES)}'}), 400
+            
+            # Los hilos de la cola no tienen contexto de aplicación: el trabajo entra en el de esta
+            services = current_services()
+            job = services.job_queue.submit(services.bind(job_fn), *job_args, kind=kind, priority=PRIORITIES[priority])
+        except JobQueueFull as e:
+            return saturated_response(e)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
+        status_url = f'/api/jobs/{job.id}'
+        body = dict(job.to_dict(), success=True, status_url=status_url, result_url=f'{status_url}/result')
+        return jsonify(body), 202, {'Location': status_url}
+
+    @app.route('/api/jobs/<job_id>', methods=['GET'])
+    def job_status(job_id):
+        """
+        Estado de un trabajo; con ?wait=segundos espera (long-poll) hasta que termine
+        """
+        services = current_services()
+        try:
+            wait = min(float(request.args.get('wait', 0)), config.JOB_MAX_WAIT)
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Parámetro wait inválido'}), 400
+        
+        job = services.job_queue.wait(job_id, wait) if wait > 0 else services.job_queue.get(job_id)
+        if job is None:
+            return jsonify({'success': False, 'message': 'Trabajo no encontrado o expirado'}), 404
+        
+        body = dict(job.to_dict(), success=True)
+        if job.status == 'done':
+            body['result'] = job.result['payload']
+            body['result_url'] = f'/api/jobs/{job.id}/result'
+        return jsonify(body), 200
+
+    @app.route('/api/jobs/<job_id>/result', methods=['GET'])
+    def job_result(job_id):
+        """Resultado de un trabajo terminado, en el formato pedido al encolarlo"""
+        job = current_services().job_queue.get(job_id)
+        if job is None:
+            return jsonify({'success': False, 'message': 'Trabajo no encontrado o expirado'}), 404
+        if job.status == 'failed':
+            return jsonify({'success': False, 'message': job.error, 'status': job.status}), 500
+        if job.status != 'done':
+            response = jsonify({'success': False, 'message': 'El trabajo aún no ha terminado', 'status': job.status})
+            response.headers['Retry-After'] = '1'
+            return response, 409
+        
+        result = job.result
+        return format_response(OutputOptions(**result['options']), result['result_bytes'],
+                               result['edges_bytes'], result['payload'])
+
+    @app.route('/api/jobs/<job_id>', methods=['DELETE'])
+    def cancel_job(job_id):
+        """Cancela un trabajo en espera o descarta uno terminado"""
+        if not current_services().job_queue.cancel(job_id):
+            return jsonify({'success': False, 'message': 'Trabajo no encontrado o en ejecución'}), 409
+        return jsonify({'success': True}), 200
+
+    @app.route('/api/jobs/stats')
+    def job_stats():
+        """Estado de la cola de trabajos asíncronos"""
+        return jsonify({'success': True, 'stats': current_services().job_queue.stats()}), 200
+
+    @app.route(VIDEO_UPLOAD_PATH, methods=['POST'])
+    def submit_video():
+        """
+        Encola la detección de bordes de un vídeo y devuelve su identificador al instante
+        Acepta: file (multipart) y los campos opcionales thresholdLow, thresholdHigh,
+        frame_step (procesar uno de cada N frames), max_side (lado mayor de la salida),
+        backend y priority
+        Retorna: 202 con job_id y la URL de estado (con el avance)
+        """
+        services = current_services()
+        file = request.files.get('file')
+        if file is None or file.filename == '' or not allowed_video(file.filename):
+            formats = ', '.join(sorted(config.VIDEO_EXTENSIONS)).upper()
+            return jsonify({'success': False, 'message': f'Tipo de vídeo no permitido. Use: {formats}'}), 400
+        params = request.form
+        try:
+            threshold1 = int(params.get('thresholdLow', 100))
+            threshold2 = int(params.get('thresholdHigh', 200))
+            frame_step = int(params.get('frame_step', 1))
+            max_side = int(params['max_side']) if params.get('max_side') else None
+            backend = request_backend(params)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': f'Parámetros inválidos: {e}'}), 400
+        
+        if threshold1 < 0 or threshold2 < 0 or threshold1 >= threshold2:
+            return jsonify({'success': False, 'message': 'Umbrales inválidos. Umbral Bajo debe ser menor que Umbral Alto'}), 400
+        if not 1 <= frame_step <= config.VIDEO_MAX_FRAME_STEP:
+            return jsonify({'success': False, 'message': f'frame_step debe estar entre 1 y {config.VIDEO_MAX_FRAME_STEP}'}), 400
+        if max_side is not None and max_side < 16:
+            return jsonify({'success': False, 'message': 'max_side debe ser al menos 16'}), 400
+        priority = params.get('priority', 'normal')
+        if priority not in PRIORITIES:
+            return jsonify({'success': False, 'message': f'Prioridad no válida. Use: {", ".join(PRIORITIES)}'}), 400
+        
+        # La subida ya está en un fichero temporal: se copia por bloques al almacén de subidas
+        input_name = services.upload_store.new_name('', '.' + file.filename.rsplit('.', 1)[1].lower())
+        input_path = services.upload_store.path(input_name)
+        file.save(input_path)
+        output_name = services.result_store.new_name('_edges', config.VIDEO_OUTPUT_EXTENSION)
+        progress = VideoProgress()
+        try:
+            job = services.video_queue.submit(services.bind(video_job), input_path, output_name, threshold1, threshold2,
+                                              frame_step, max_side, backend, progress, kind='video',
+                                              priority=PRIORITIES[priority], progress=progress)
+        except JobQueueFull as e:
+            os.remove(input_path)
+            return saturated_response(e)
+        
+        status_url = f'{VIDEO_UPLOAD_PATH}/{job.id}'
+        body = dict(job.to_dict(), success=True, status_url=status_url, result_url=f'{status_url}/result')
+        return jsonify(body), 202, {'Location': status_url}
+
+    @app.route('/api/video/<job_id>', methods=['GET'])
+    def video_status(job_id):
+        """
+        Estado y avance de un vídeo; con ?wait=segundos espera (long-poll) hasta que termine
+        """
+        services = current_services()
+        try:
+            wait = min(float(request.args.get('wait', 0)), config.JOB_MAX_WAIT)
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Parámetro wait inválido'}), 400
+        
+        job = services.video_queue.wait(job_id, wait) if wait > 0 else services.video_queue.get(job_id)
+        if job is None:
+            return jsonify({'success': False, 'message': 'Trabajo no encontrado o expirado'}), 404
+        
+        body = dict(job.to_dict(), success=True)
+        if job.status == 'done':
+            body['result'] = job.result['payload']
+            body['video_url'] = job.result['payload']['video_url']
+        return jsonify(body), 200
+
+    @app.route('/api/video/<job_id>/result', methods=['GET'])
+    def video_result(job_id):
+        """Redirige al vídeo de bordes de un trabajo terminado (servido desde /files, con Range)"""
+        job = current_services().video_queue.get(job_id)
+        if job is None:
+            return jsonify({'success': False, 'message': 'Trabajo no encontrado o expirado'}), 404
+        if job.status == 'failed':
+            return jsonify({'success': False, 'message': job.error, 'status': job.status}), 500
+        if job.status != 'done':
+            response = jsonify({'success': False, 'message': 'El trabajo aún no ha terminado', 'status': job.status})
+            response.headers['Retry-After'] = '1'
+            return response, 409
+        return redirect(job.result['payload']['video_url'], code=303)
+
+    @app.route('/api/video/<job_id>', methods=['DELETE'])
+    def cancel_video(job_id):
+        """Cancela un vídeo en espera, detiene uno en procesamiento o descarta uno terminado"""
+        services = current_services()
+        job = services.video_queue.get(job_id)
+        if job is None:
+            return jsonify({'success': False, 'message': 'Trabajo no encontrado o expirado'}), 404
+        if services.video_queue.cancel(job_id):
+            return jsonify({'success': True}), 200
+        # En ejecución: se detiene en el siguiente frame y el trabajo termina como fallido
+        job.progress.cancel()
+        return jsonify({'success': True, 'status': 'cancelling'}), 202
+
+    @app.route('/api/video/stats')
+    def video_stats():
+        """Estado de la cola de vídeos"""
+        return jsonify({'success': True, 'stats': current_services().video_queue.stats()}), 200
+
+    @app.route('/api/batch', methods=['POST'])
+    def process_batch_request():
+        """
+        Endpoint para procesar un lote de imágenes
+        Acepta: archive (zip/tar) o varios files, thresholdLow, thresholdHigh
+        Retorna: un registro JSON por línea (NDJSON) a medida que termina cada imagen
+        """
+        services = current_services()
+        try:
+            threshold1 = int(request.form.get('thresholdLow', 100))
+            threshold2 = int(request.form.get('thresholdHigh', 200))
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Umbrales inválidos'}), 400
+        
+        if threshold1 < 0 or threshold2 < 0 or threshold1 >= threshold2:
+            return jsonify({'success': False, 'message': 'Umbrales inválidos. Umbral Bajo debe ser menor que Umbral Alto'}), 400
+        
+        # Copiar las entradas fuera de la petición: la respuesta se genera mientras se procesa
+        extensions = set(services.allowed_extensions)
+        try:
+            if 'archive' in request.files:
+                archive = io.BytesIO(upload_bytes(request.files['archive']))
+                # Primera pasada solo por los nombres; el contenido se lee al procesar
+                total = sum(1 for _ in iter_archive(archive, extensions))
+                items = iter_archive(archive, extensions)
+            else:
+                uploads = [f for f in request.files.getlist('files') if f.filename and allowed_file(f.filename)]
+                items = [(secure_filename(f.filename), (lambda data=upload_bytes(f): data)) for f in uploads]
+                total = len(items)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
+        if not total:
+            return jsonify({'success': False, 'message': 'El lote no contiene imágenes válidas'}), 400
+        if total > config.BATCH_MAX_FILES:
+            return jsonify({'success': False, 'message': f'Máximo {config.BATCH_MAX_FILES} imágenes por lote'}), 400
+        
+        batch_id = datetime.now().strftime('%Y%m%d_%H%M%S_') + uuid.uuid4().hex[:8]
+        output_dir = os.path.join(services.result_folder, f'batch_{batch_id}') if config.PERSIST_RESULTS else None
+        
+        def generate():
+            yield json.dumps({'batch_id': batch_id, 'total': total}) + '\n'
+            for record in process_batch(
+                items,
+                services.processing_engine,
+                threshold1=threshold1,
+                threshold2=threshold2,
+                output_dir=output_dir,
+                max_in_flight=config.BATCH_MAX_IN_FLIGHT,
+                prefetch=config.BATCH_PREFETCH,
+                chunk_size=config.BATCH_CHUNK_SIZE,
+                chunk_max_bytes=config.BATCH_CHUNK_MAX_BYTES
+            ):
+                yield json.dumps(record) + '\n'
+        
+        return Response(generate(), mimetype='application/x-ndjson')
+
+    @app.route('/api/prepare', methods=['POST'])
+    def prepare_image():
+        """
+        Sube una imagen una sola vez y guarda sus etapas independientes de los umbrales
+        (suavizado, gradientes y supresión de no máximos) para barridos posteriores
+        """
+        services = current_services()
+        try:
+            if 'file' not in request.files:
+                return jsonify({'success': False, 'message': 'No se envió ningún archivo'}), 400
+            
+            file = request.files['file']
+            
+            if file.filename == '':
+                return jsonify({'success': False, 'message': 'El archivo está vacío'}), 400
+            
+            if not allowed_file(file.filename):
+                return jsonify({'success': False, 'message': 'Tipo de archivo no permitido. Use: PNG, JPG, JPEG, GIF, BMP'}), 400
+            
+            prepared = services.processing_engine.run(
+                prepare_image_bytes,
+                upload_bytes(file),
+                config.GAUSSIAN_KERNEL,
+                config.GAUSSIAN_SIGMA,
+                timeout=config.PROCESSING_TIMEOUT
+            )
+            prepared_id = services.prepared_store.add(prepared)
+            
+            return jsonify({
+                'success': True,
+                'prepared_id': prepared_id,
+                'image_width': prepared.width,
+                'image_height': prepared.height,
+                'expires_in': config.PREPARED_IMAGE_TTL
+            }), 200
+            
+        except EngineSaturated as e:
+            return saturated_response(e)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        except Exception as e:
+            return jsonify({'success': False, 'message': f'Error preparando la imagen: {str(e)}'}), 500
+
+    @app.route('/api/prepared/<prepared_id>/edges', methods=['POST'])
+    def sweep_prepared_image(prepared_id):
+        """
+        Evalúa uno o varios pares de umbrales sobre una imagen preparada
+        Solo se ejecuta la histéresis; el suavizado y los gradientes se reutilizan
+        Body (JSON): thresholdLow/thresholdHigh o thresholds: [[bajo, alto], ...], include_edges
+        """
+        services = current_services()
+        prepared = services.prepared_store.get(prepared_id)
+        if prepared is None:
+            return jsonify({'success': False, 'message': 'Imagen preparada no encontrada o caducada'}), 404
+        
+        try:
+            data = request.get_json(silent=True) or {}
+            pairs = parse_threshold_pairs(data)
+            # Con un solo par se devuelve la imagen por defecto; en lote solo si se pide
+            include_edges = bool(data.get('include_edges', 'thresholds' not in data))
             
-            # Incluir visualización en base64
-            result_b64 = encode_image_to_base64(os.path.join(RESULT_FOLDER, result_filename))
-            edges_b64 = encode_image_to_base64(os.path.join(RESULT_FOLDER, edges_filename))
+            # La histéresis y la codificación pasan por el motor, con su límite de admisión
+            results = services.processing_engine.run(
+                sweep_job, prepared, pairs, include_edges,
+                timeout=config.PROCESSING_TIMEOUT
+            )
             
             return jsonify({
                 'success': True,
-                'result_image': os.path.join(RESULT_FOLDER, result_filename),
-                'edges_image': os.path.join(RESULT_FOLDER, edges_filename),
-                'result_image_base64': result_b64,
-                'edges_image_base64': edges_b64,
-                'edge_percentage': round(edge_percentage, 2),
-                'image_width': image.shape[1],
-                'image_height': image.shape[0]
+                'prepared_id': prepared_id,
+                'results': results
             }), 200
             
+        except EngineSaturated as e:
+            return saturated_response(e)
+        except (ValueError, TypeError) as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
         except Exception as e:
             return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
 
+    @app.route('/api/prepared/<prepared_id>', methods=['DELETE'])
+    def delete_prepared_image(prepared_id):
+        """Libera una imagen preparada"""
+        if not current_services().prepared_store.remove(prepared_id):
+            return jsonify({'success': False, 'message': 'Imagen preparada no encontrada o caducada'}), 404
+        return jsonify({'success': True}), 200
+
     @app.route('/api/process-realtime', methods=['POST'])
     def process_realtime():
         """
         Endpoint para procesar frames en tiempo real de la webcam
-        Acepta: frame (image data), width, height, threshold1, threshold2
+        Acepta: frame (image data), width, height, threshold1, threshold2, backend (opcional)
         Retorna: imagen de bordes en base64
         """
         try:
@@ -187,39 +1373,314 @@ def register_routes():
                 return jsonify({'success': False, 'message': 'No se envió ningún frame'}), 400
             
             frame_file = request.files['frame']
-            width = int(request.form.get('width', 640))
-            height = int(request.form.get('height', 480))
             threshold1 = int(request.form.get('thresholdLow', 100))
             threshold2 = int(request.form.get('thresholdHigh', 200))
+            try:
+                width, height = frame_size(request.form.get('width', 640), request.form.get('height', 480))
+                options = OutputOptions.from_params(request.form, request.headers.get('Accept', ''))
+                backend = request_backend(request.form)
+            except ValueError as e:
+                return jsonify({'success': False, 'message': str(e)}), 400
             
             # Leer datos del frame
-            frame_data = frame_file.read()
+            frame_data = upload_bytes(frame_file)
             
             if not frame_data:
                 return jsonify({'success': False, 'message': 'Frame vacío'}), 400
             
-            # Procesar el frame
-            edges_bgr = process_realtime_frame(frame_data, width, height, threshold1, threshold2)
+            # Procesar el frame a través del planificador (el último frame gana)
+            session_id = realtime_session_id()
+            start = time.perf_counter()
+            future = current_services().frame_scheduler.submit(
+                session_id, session_id, frame_data, width, height, threshold1, threshold2, backend
+            )
+            try:
+                edges = future.result(timeout=config.REALTIME_FRAME_TIMEOUT)
+            except FrameDropped:
+                adaptive, _ = observe_realtime(session_id, None, dropped=True)
+                return jsonify({'success': False, 'dropped': True, 'adaptive': adaptive,
+                                'message': 'Frame descartado por uno más reciente'}), 409
+            except FutureTimeoutError:
+                observe_realtime(session_id, None, dropped=True)
+                return jsonify({'success': False, 'message': 'Servidor saturado, reintente'}), 503
+            except EngineSaturated as e:
+                observe_realtime(session_id, None, dropped=True)
+                return saturated_response(e)
             
-            # Codificar como PNG y convertir a base64
-            success, encoded = cv2.imencode('.png', edges_bgr)
-            if not success:
-                return jsonify({'success': False, 'message': 'Error codificando la imagen'}), 500
+            frame_done = time.perf_counter()
+            adaptive, _ = observe_realtime(session_id, frame_done - start)
             
-            # Convertir bytes a base64
-            edges_base64 = 'data:image/png;base64,' + base64.b64encode(encoded).decode('utf-8')
+            # Codificar el mapa de bordes de un solo canal en el formato pedido
+            edges_bytes = encode_edges(edges, options)
+            note_timings({'frame': frame_done - start, 'encode': time.perf_counter() - frame_done})
             
-            return jsonify({
+            return format_response(options, None, edges_bytes, {
                 'success': True,
-                'edges_data': edges_base64
-            }), 200
+                'edge_percentage': calculate_edge_percentage(edges),
+                'image_width': edges.shape[1],
+                'image_height': edges.shape[0],
+                'adaptive': adaptive
+            }, json_fields=(None, 'edges_data'))
             
         except Exception as e:
-            print(f"Error en /api/process-realtime: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("error en /api/process-realtime")
             return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
 
+    @sock.route('/ws/realtime')
+    def realtime_stream(ws):
+        """
+        Canal WebSocket persistente para frames en tiempo real de la webcam
+        Mensajes de texto (JSON): thresholdLow, thresholdHigh, width, height, backend
+        Mensajes binarios: frame JPEG/PNG; se responde con los bordes en PNG
+        En modo adaptativo, antes de los bordes se envía un mensaje de texto
+        {"type": "adaptive", ...} cada vez que cambia la resolución, fps o calidad recomendada
+        """
+        params = dict(STREAM_DEFAULTS)
+        session_id = 'ws-' + uuid.uuid4().hex
+        # Formato de las respuestas binarias: png (por defecto), jpeg, webp, mask o rle
+        stream_options = OutputOptions(format='png')
+        recommendation_sent = False
+        
+        while True:
+            message = ws.receive()
+            
+            # Mensaje de control: actualizar parámetros en mitad del stream
+            if isinstance(message, str):
+                try:
+                    stream_options = apply_stream_control(params, stream_options, json.loads(message))
+                except (ValueError, TypeError, AttributeError):
+                    ws.send(json.dumps({'success': False, 'message': 'Parámetros inválidos'}))
+                continue
+            
+            if not message:
+                ws.send(json.dumps({'success': False, 'message': 'Frame vacío'}))
+                continue
+            
+            # Procesar el frame y responder con los bordes en binario
+            start = time.perf_counter()
+            try:
+                future = current_services().frame_scheduler.submit(
+                    session_id, session_id, message, params['width'], params['height'],
+                    params['threshold1'], params['threshold2'], params['backend']
+                )
+                edges = future.result(timeout=config.REALTIME_FRAME_TIMEOUT)
+                adaptive, changed = observe_realtime(session_id, time.perf_counter() - start)
+                if adaptive is not None and (changed or not recommendation_sent):
+                    ws.send(json.dumps(dict(adaptive, type='adaptive')))
+                    recommendation_sent = True
+                ws.send(encode_edges(edges, stream_options))
+            except ValueError as e:
+                ws.send(json.dumps({'success': False, 'message': str(e)}))
+            except cv2.error as e:
+                # Frame que OpenCV no puede procesar: el canal sigue abierto para los siguientes
+                logger.warning("error de OpenCV en /ws/realtime session=%s: %s", session_id, e)
+                ws.send(json.dumps({'success': False, 'message': 'No se pudo procesar el frame'}))
+            except (FutureTimeoutError, EngineSaturated):
+                observe_realtime(session_id, None, dropped=True)
+                ws.send(json.dumps({'success': False, 'message': 'Servidor saturado, reintente'}))
+
+    @app.route('/api/realtime/stats')
+    def realtime_stats():
+        """Contadores del planificador de tiempo real (global o por sesión)"""
+        services = current_services()
+        session_id = request.args.get('session')
+        if session_id:
+            stats = services.frame_scheduler.stats(session_id)
+            if stats is None:
+                return jsonify({'success': False, 'message': 'Sesión no encontrada'}), 404
+            if services.stream_processors is not None:
+                stats['incremental'] = services.stream_processors.stats(session_id)
+            if services.adaptive_controller is not None:
+                stats['adaptive'] = services.adaptive_controller.recommendation(session_id)
+            return jsonify({'success': True, 'session': session_id, 'stats': stats}), 200
+        stats = services.frame_scheduler.stats()
+        if services.stream_processors is not None:
+            stats['incremental'] = services.stream_processors.stats()
+        if services.adaptive_controller is not None:
+            stats['adaptive'] = services.adaptive_controller.stats()
+        return jsonify({'success': True, 'stats': stats}), 200
+
+    @app.route('/api/results/<result_id>/<rendition>', methods=['GET'])
+    def result_rendition(result_id, rendition):
+        """
+        Rendition de un resultado, generada la primera vez que se pide y guardada en memoria
+        Renditions: montage, overlay, grayscale, edges, original
+        Parámetros opcionales: max_side (versión reducida), encoding, quality, compression
+        """
+        services = current_services()
+        if rendition not in RENDITIONS:
+            return jsonify({'success': False, 'message': f'Rendition no válida. Use: {", ".join(RENDITIONS)}'}), 404
+        source = services.rendition_store.get(result_id)
+        if source is None:
+            return jsonify({'success': False, 'message': 'Resultado no encontrado o expirado'}), 404
+        try:
+            options = OutputOptions.from_params(dict(request.args.items(), format='json'))
+            max_side = request.args.get('max_side', type=int)
+            if max_side is not None and max_side <= 0:
+                raise ValueError('max_side debe ser positivo')
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        if max_side is not None and max_side >= max(source.width, source.height):
+            max_side = None   # sin reducción: misma rendition que a tamaño completo
+        
+        key = RenditionStore.render_key(rendition, max_side, options)
+        data = services.rendition_store.get_rendered(source, key)
+        cache_status = 'hit'
+        if data is None:
+            cache_status = 'miss'
+            try:
+                rendered = services.processing_engine.run(
+                    render_rendition,
+                    source.source_bytes,
+                    source.edges_png,
+                    rendition,
+                    max_side,
+                    options.to_dict(),
+                    timeout=config.PROCESSING_TIMEOUT
+                )
+            except EngineSaturated as e:
+                return saturated_response(e)
+            except ValueError as e:
+                return jsonify({'success': False, 'message': str(e)}), 400
+            note_timings(rendered.get('timings'))
+            data = rendered['bytes']
+            services.rendition_store.put_rendered(result_id, key, data)
+        
+        return Response(data, mimetype=options.image_media_type, headers={
+            'Cache-Control': f'private, max-age={int(config.RENDITION_TTL)}',
+            'X-Cache': cache_status
+        })
+
+    @app.route('/api/analytics', methods=['POST'])
+    def edge_analytics():
+        """
+        Estadísticas por regiones del mapa de bordes de una imagen
+        Acepta: file, thresholdLow, thresholdHigh, backend y las consultas rois, grid,
+        bands, orientation_bins, contours y min_contour_length (JSON en los campos compuestos)
+        """
+        try:
+            if 'file' not in request.files:
+                return jsonify({'success': False, 'message': 'No se envió ningún archivo'}), 400
+            
+            file = request.files['file']
+            
+            if file.filename == '' or not allowed_file(file.filename):
+                return jsonify({'success': False, 'message': 'Tipo de archivo no permitido. Use: PNG, JPG, JPEG, GIF, BMP'}), 400
+            
+            threshold1 = int(request.form.get('thresholdLow', 100))
+            threshold2 = int(request.form.get('thresholdHigh', 200))
+            if threshold1 < 0 or threshold2 < 0 or threshold1 >= threshold2:
+                return jsonify({'success': False, 'message': 'Umbrales inválidos. Umbral Bajo debe ser menor que Umbral Alto'}), 400
+            
+            result = current_services().processing_engine.run(
+                analyze_image_bytes_job,
+                upload_bytes(file),
+                threshold1,
+                threshold2,
+                analytics_query(request.form),
+                request_backend(request.form),
+                timeout=config.PROCESSING_TIMEOUT
+            )
+            note_timings(result.pop('timings', None))
+            return jsonify(dict(result, success=True)), 200
+            
+        except EngineSaturated as e:
+            return saturated_response(e)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        except Exception as e:
+            return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
+
+    @app.route('/api/results/<result_id>/analytics', methods=['POST'])
+    def result_analytics(result_id):
+        """
+        Estadísticas por regiones de un resultado ya procesado (sin volver a detectar bordes)
+        Body (JSON): rois, grid, bands, orientation_bins, contours, min_contour_length
+        """
+        services = current_services()
+        source = services.rendition_store.get(result_id)
+        if source is None:
+            return jsonify({'success': False, 'message': 'Resultado no encontrado o expirado'}), 404
+        try:
+            query = analytics_query(request.get_json(silent=True) or {})
+            result = services.processing_engine.run(
+                analyze_edges_png_job,
+                source.edges_png,
+                source.source_bytes if 'orientation_bins' in query else None,
+                query,
+                timeout=config.PROCESSING_TIMEOUT
+            )
+            note_timings(result.pop('timings', None))
+            return jsonify(dict(result, success=True, result_id=result_id)), 200
+            
+        except EngineSaturated as e:
+            return saturated_response(e)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        except Exception as e:
+            return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
+
+    @app.route('/files/<area>/<path:name>', methods=['GET'])
+    def stored_file(area, name):
+        """
+        Sirve una subida o un resultado guardado
+        El contenido de un nombre no cambia nunca: caché larga, ETag y peticiones Range
+        """
+        services = current_services()
+        store = {'uploads': services.upload_store, 'results': services.result_store}.get(area)
+        path = store.resolve(name) if store is not None else None
+        if path is None:
+            return jsonify({'success': False, 'message': 'Fichero no encontrado o expirado'}), 404
+        response = send_file(path, conditional=True, etag=True, max_age=config.STORAGE_MAX_AGE)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    @app.route('/api/storage/stats')
+    def storage_stats():
+        """Ocupación y expulsiones del almacenamiento de subidas y resultados"""
+        services = current_services()
+        return jsonify({'success': True, 'uploads': services.upload_store.stats(), 'results': services.result_store.stats()}), 200
+
+    @app.route('/api/health')
+    def health():
+        """Vivacidad: el proceso atiende peticiones (aunque aún se esté calentando)"""
+        return jsonify({'success': True, 'status': 'alive'}), 200
+
+    @app.route('/api/ready')
+    def ready():
+        """Preparación: 200 cuando ha terminado el calentamiento, 503 mientras tanto"""
+        services = current_services()
+        body = dict(services.warmup.status(), success=True)
+        if not services.warmup.ready:
+            response = jsonify(body)
+            response.headers['Retry-After'] = '1'
+            return response, 503
+        return jsonify(body), 200
+
+    @app.route('/api/engine/stats')
+    def engine_stats():
+        """Estado del motor de procesamiento"""
+        return jsonify({'success': True, 'stats': current_services().processing_engine.stats()}), 200
+
+    @app.route('/api/backends')
+    def edge_backends():
+        """Backends de bordes registrados, predeterminado y elección de 'auto' por tamaño"""
+        return jsonify(dict(backends_info(), success=True)), 200
+
+    @app.route('/api/cache/stats')
+    def cache_stats():
+        """Estado de la caché de resultados"""
+        services = current_services()
+        if services.result_cache is None:
+            return jsonify({'success': True, 'enabled': False}), 200
+        return jsonify({'success': True, 'enabled': True, 'stats': services.result_cache.stats()}), 200
+
+    @app.route('/metrics')
+    def metrics():
+        """Métricas en formato de exposición de Prometheus"""
+        return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
     @app.route('/api/info')
     def info():
         """Endpoint para obtener información sobre el algoritmo"""
@@ -232,7 +1693,9 @@ def register_routes():
                 '3. Supresión de no máximos para adelgazar bordes',
                 '4. Histéresis de umbral para conectar bordes'
             ],
-            'supported_formats': list(ALLOWED_EXTENSIONS),
+            'supported_formats': list(current_services().allowed_extensions),
+            'supported_video_formats': sorted(config.VIDEO_EXTENSIONS),
+            'backends': [backend['name'] for backend in backends_info()['backends']],
             'threshold_ranges': {
                 'threshold1': 'Umbral inferior (0-500)',
                 'threshold2': 'Umbral superior (0-500)'
@@ -242,7 +1705,8 @@ def register_routes():
     @app.errorhandler(413)
     def request_entity_too_large(error):
         """Manejo de archivos demasiado grandes"""
-        return jsonify({'success': False, 'message': 'Archivo demasiado grande. Máximo 16 MB'}), 413
+        limit_mb = max_upload_size(request.path) // (1024 * 1024)
+        return jsonify({'success': False, 'message': f'Archivo demasiado grande. Máximo {limit_mb} MB'}), 413
 
     @app.errorhandler(404)
     def not_found(error):
@@ -63,6 +63,6 @@ echo Presiona Ctrl+C para detener
 echo ========================================
 echo.
 
-python app.py
+python server.py
 
 pause
@@ -54,4 +54,4 @@ echo "Presiona Ctrl+C para detener"
 echo "========================================"
 echo ""
 
-python app.py
+python server.py
@@ -0,0 +1,56 @@
+"""
+Lanzador de producción (sin el modo debug de app.py)
+
+    python server.py                          # SERVER_MODE, SERVER_HOST, SERVER_PORT y SERVER_WORKERS de config.py
+    python server.py --mode asgi --workers 4  # asyncio con uvicorn: miles de conexiones lentas sin miles de hilos
+    python server.py --mode wsgi              # servidor de Flask con hilos
+
+En modo ASGI cada proceso importa asgi_app y crea su propia aplicación, motor y cachés.
+"""
+
+import argparse
+import sys
+
+import config
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Servidor de la aplicación de detección de bordes')
+    parser.add_argument('--mode', choices=('wsgi', 'asgi'), default=config.SERVER_MODE, help='Modo de servidor')
+    parser.add_argument('--host', default=config.SERVER_HOST, help='Host')
+    parser.add_argument('--port', type=int, default=config.SERVER_PORT, help='Puerto')
+    parser.add_argument('--workers', type=int, default=config.SERVER_WORKERS, help='Procesos del servidor')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.workers < 1:
+        sys.exit('--workers debe ser al menos 1')
+
+    if args.mode == 'asgi':
+        try:
+            import uvicorn
+        except ImportError:
+            sys.exit('El modo ASGI necesita uvicorn: pip install -r requirements.txt')
+        uvicorn.run(
+            'asgi_app:application',
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            log_level=config.LOG_LEVEL.lower(),
+            lifespan='on'
+        )
+        return
+
+    from app import create_app
+    app = create_app()
+    if args.workers > 1:
+        # El servidor de Werkzeug solo admite varios procesos sin hilos
+        app.run(host=args.host, port=args.port, debug=False, threaded=False, processes=args.workers)
+    else:
+        app.run(host=args.host, port=args.port, debug=False, threaded=config.THREADED)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""
+Almacenamiento de subidas y resultados
+Los ficheros se nombran por el hash de su contenido (sin colisiones entre peticiones
+simultáneas y sin duplicados) y se reparten en subdirectorios por prefijo del hash
+(ab/cd/abcd….png), de modo que ningún directorio crece sin límite. Un hilo en
+segundo plano expulsa los ficheros caducados y, si se supera la cuota, los más antiguos.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from typing import Optional
+
+from persistence import write_file_atomic
+
+logger = logging.getLogger(__name__)
+
+_NAME_PATTERN = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{8,64}[A-Za-z0-9_]*\.[a-z0-9]{1,5}$')
+_SHARD_PATTERN = re.compile(r'^[0-9a-f]{2}$')
+
+
+class FileStore:
+    """
+    Directorio de ficheros direccionados por contenido con caducidad y cuota
+    
+    Args:
+        root: Carpeta raíz
+        url_prefix: Prefijo de las URLs desde las que se sirven los ficheros
+        ttl: Segundos desde la última escritura tras los que un fichero caduca (0 = sin caducidad)
+        max_bytes: Bytes máximos ocupados por los ficheros (0 = sin cuota)
+        writer: AsyncWriter para las escrituras en segundo plano (None = síncronas)
+    """
+
+    def __init__(self, root: str, url_prefix: str, ttl: float = 0.0, max_bytes: int = 0, writer=None):
+        self.root = root
+        self.url_prefix = url_prefix.rstrip('/')
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.writer = writer
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {'files': 0, 'bytes': 0, 'evicted': 0, 'deduplicated': 0, 'last_sweep': None}
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def content_digest(data: bytes) -> str:
+        """Hash del contenido (BLAKE2b de 160 bits, más rápido que SHA-256 con el mismo margen de colisión)"""
+        return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+    @staticmethod
+    def name_for(digest: str, suffix: str = '', extension: str = '') -> str:
+        """Nombre relativo repartido por prefijo: ab/cd/abcd…<sufijo><extensión>"""
+        return f'{digest[:2]}/{digest[2:4]}/{digest}{suffix}{extension.lower()}'
+
+    def new_name(self, suffix: str = '', extension: str = '') -> str:
+        """
+        Nombre único para un fichero que escribirá otro proceso (contenido aún desconocido)
+        Crea su subdirectorio.
+        """
+        name = self.name_for(uuid.uuid4().hex, suffix, extension)
+        os.makedirs(os.path.dirname(self.path(name)), exist_ok=True)
+        return name
+
+    def path(self, name: str) -> str:
+        """Ruta en disco de un nombre relativo"""
+        return os.path.join(self.root, *name.split('/'))
+
+    def url(self, name: str) -> str:
+        """URL desde la que se sirve un fichero"""
+        return f'{self.url_prefix}/{name}'
+
+    def resolve(self, name: str) -> Optional[str]:
+        """Ruta en disco de un nombre pedido desde fuera, o None si no es válido o no existe"""
+        if not _NAME_PATTERN.match(name):
+            return None
+        path = self.path(name)
+        return path if os.path.isfile(path) else None
+
+    def save(self, data: bytes, suffix: str = '', extension: str = '', background: bool = True) -> str:
+        """
+        Guarda un contenido con nombre derivado de su hash
+        Si ya existe, solo se renueva su fecha (cuenta como recién escrito para la caducidad).
+        
+        Args:
+            data: Contenido
+            suffix: Sufijo del nombre (p. ej. '_edges')
+            extension: Extensión con punto
+            background: Escribir con el AsyncWriter sin esperar
+        
+        Returns:
+            Nombre relativo del fichero
+        """
+        name = self.name_for(self.content_digest(data), suffix, extension)
+        path = self.path(name)
+        try:
+            os.utime(path)
+            with self._lock:
+                self._stats['deduplicated'] += 1
+            return name
+        except OSError:
+            pass
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if background and self.writer is not None:
+            self.writer.write(path, data)
+        else:
+            write_file_atomic(path, data)
+        return name
+
+    def start(self, interval: float):
+        """Arranca el hilo de expulsión (la primera pasada también mide lo que ya hay en disco)"""
+        if self._thread is not None or interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, args=(interval,), name='storage-sweeper', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Detiene el hilo de expulsión"""
+        self._stop.set()
+
+    def _run(self, interval: float):
+        while not self._stop.is_set():
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("error expulsando ficheros root=%s", self.root)
+            self._stop.wait(interval)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """
+        Elimina los ficheros caducados y, si se supera la cuota, los escritos hace más tiempo
+        Recorre solo los subdirectorios de prefijo, los ficheros sueltos de la raíz (nombres
+        anteriores a este almacén) y los directorios batch_* (solo por caducidad).
+        
+        Returns:
+            Número de ficheros eliminados
+        """
+        now = time.time() if now is None else now
+        entries, expired_dirs = self._scan(now)
+        evicted = 0
+        for path in expired_dirs:
+            shutil.rmtree(path, ignore_errors=True)
+            evicted += 1
+
+        total = sum(size for _, size, _ in entries)
+        entries.sort()
+        kept = []
+        for mtime, size, path in entries:
+            expired = self.ttl and now - mtime > self.ttl
+            if expired or (self.max_bytes and total > self.max_bytes):
+                if self._remove(path):
+                    evicted += 1
+                    total -= size
+                    continue
+            kept.append(size)
+        with self._lock:
+            self._stats.update(files=len(kept), bytes=sum(kept), last_sweep=now)
+            self._stats['evicted'] += evicted
+        if evicted:
+            logger.info("ficheros expulsados root=%s count=%d bytes=%d", self.root, evicted, sum(kept))
+        return evicted
+
+    def _scan(self, now: float):
+        """Lista (fecha, tamaño, ruta) de los ficheros gestionados y los directorios batch_* caducados"""
+        entries, expired_dirs = [], []
+        with os.scandir(self.root) as top:
+            for entry in top:
+                if entry.is_file(follow_symlinks=False):
+                    if '.tmp' not in entry.name and not entry.name.startswith('.'):
+                        stat = entry.stat(follow_symlinks=False)
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+                elif _SHARD_PATTERN.match(entry.name):
+                    entries.extend(self._scan_shard(entry.path))
+                elif entry.name.startswith('batch_') and self.ttl and now - entry.stat().st_mtime > self.ttl:
+                    expired_dirs.append(entry.path)
+        return entries, expired_dirs
+
+    @staticmethod
+    def _scan_shard(shard_path: str):
+        entries = []
+        for directory, _, files in os.walk(shard_path):
+            for filename in files:
+                if '.tmp' in filename:
+                    continue
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    @staticmethod
+    def _remove(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def stats(self) -> dict:
+        """Ficheros y bytes medidos en la última pasada, expulsiones y escrituras evitadas"""
+        with self._lock:
+            return dict(self._stats, ttl=self.ttl, max_bytes=self.max_bytes)
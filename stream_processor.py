@@ -0,0 +1,212 @@
+"""
+Detección de bordes incremental para flujos de video en tiempo real
+Frames consecutivos de una cámara son casi idénticos: cada sesión guarda el
+último mapa de bordes y solo se recalculan los mosaicos que cambiaron respecto
+a la referencia, reutilizando el resto. Opcionalmente suaviza en el tiempo
+para reducir el parpadeo.
+"""
+
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from tiled_processor import detect_region_edges
+
+# Contexto alrededor de cada región recalculada: cubre el kernel 5x5, Sobel y la supresión de no máximos
+REGION_HALO = 8
+
+
+class IncrementalEdgeDetector:
+    """
+    Estado de un flujo: imagen de referencia y último mapa de bordes
+    Un mosaico se considera cambiado si al menos min_changed_pixels de sus píxeles
+    difieren más de change_threshold niveles de la referencia con la que se calcularon
+    sus bordes (el ruido del sensor queda por debajo y no fuerza recálculos).
+
+    Args:
+        tile_size: Lado de los mosaicos en píxeles
+        change_threshold: Diferencia de gris a partir de la cual un píxel cambió
+        min_changed_pixels: Píxeles cambiados para marcar un mosaico como sucio
+        full_refresh_ratio: Fracción de mosaicos sucios a partir de la cual se recalcula todo
+        smoothing: Peso del pasado en el suavizado temporal (0 lo desactiva)
+        kernel: Tamaño del kernel Gaussiano
+        sigma: Sigma del kernel Gaussiano
+    """
+
+    def __init__(self, tile_size: int = 32, change_threshold: int = 16, min_changed_pixels: int = 4,
+                 full_refresh_ratio: float = 0.5, smoothing: float = 0.0, kernel=(5, 5), sigma: float = 1.5):
+        self.tile_size = tile_size
+        self.change_threshold = change_threshold
+        self.min_changed_pixels = min_changed_pixels
+        self.full_refresh_ratio = full_refresh_ratio
+        self.smoothing = smoothing
+        self.kernel = tuple(kernel)
+        self.sigma = sigma
+        self._reference = None
+        self._edges = None
+        self._accumulator = None
+        self._thresholds = None
+        self.frames = 0
+        self.full_frames = 0
+        self.reused_frames = 0
+        self.tiles_total = 0
+        self.tiles_recomputed = 0
+
+    def reset(self):
+        """Olvida el estado: el siguiente frame se calcula completo"""
+        self._reference = self._edges = self._accumulator = None
+
+    def _dirty_tiles(self, gray: np.ndarray) -> np.ndarray:
+        """Rejilla booleana de mosaicos que cambiaron (dilatada un mosaico por el halo de los vecinos)"""
+        height, width = gray.shape
+        rows = -(-height // self.tile_size)
+        cols = -(-width // self.tile_size)
+        _, changed = cv2.threshold(cv2.absdiff(gray, self._reference), self.change_threshold, 1, cv2.THRESH_BINARY)
+        # Contar píxeles cambiados por mosaico con la imagen integral en las esquinas de la rejilla
+        integral = cv2.integral(changed)
+        ys = np.minimum(np.arange(rows + 1) * self.tile_size, height)
+        xs = np.minimum(np.arange(cols + 1) * self.tile_size, width)
+        corners = integral[ys][:, xs]
+        counts = corners[1:, 1:] - corners[:-1, 1:] - corners[1:, :-1] + corners[:-1, :-1]
+        dirty = (counts >= self.min_changed_pixels).astype(np.uint8)
+        # Un cambio junto al borde de un mosaico afecta a los bordes del vecino
+        return cv2.dilate(dirty, np.ones((3, 3), dtype=np.uint8)).astype(bool)
+
+    def _dirty_regions(self, dirty: np.ndarray, height: int, width: int) -> List[Tuple[int, int, int, int]]:
+        """Agrupa los mosaicos sucios de cada fila en tramos contiguos (menos llamadas a Canny)"""
+        regions = []
+        size = self.tile_size
+        for row in range(dirty.shape[0]):
+            cols = np.flatnonzero(dirty[row])
+            if cols.size == 0:
+                continue
+            # Cortar donde la columna no es consecutiva
+            breaks = np.flatnonzero(np.diff(cols) > 1)
+            starts = np.concatenate(([cols[0]], cols[breaks + 1]))
+            ends = np.concatenate((cols[breaks], [cols[-1]]))
+            y0, y1 = row * size, min((row + 1) * size, height)
+            for start, end in zip(starts, ends):
+                regions.append((y0, y1, start * size, min((end + 1) * size, width)))
+        return regions
+
+    def process(self, gray: np.ndarray, threshold1: int, threshold2: int) -> np.ndarray:
+        """
+        Calcula los bordes de un frame reutilizando los mosaicos sin cambios
+
+        Args:
+            gray: Frame en escala de grises
+            threshold1: Umbral Bajo
+            threshold2: Umbral Alto
+
+        Returns:
+            Mapa de bordes (copia: el estado interno no se comparte con el llamador)
+        """
+        height, width = gray.shape
+        rows = -(-height // self.tile_size)
+        cols = -(-width // self.tile_size)
+        self.frames += 1
+        self.tiles_total += rows * cols
+
+        full = (self._reference is None or self._reference.shape != gray.shape
+                or self._thresholds != (threshold1, threshold2))
+        if not full:
+            dirty = self._dirty_tiles(gray)
+            dirty_count = int(dirty.sum())
+            full = dirty_count > self.full_refresh_ratio * rows * cols
+
+        if full:
+            # Primer frame, cambio de tamaño o de umbrales, o escena muy cambiada
+            self._reference = gray.copy()
+            self._edges = cv2.Canny(cv2.GaussianBlur(gray, self.kernel, self.sigma), threshold1, threshold2)
+            self._accumulator = None
+            self._thresholds = (threshold1, threshold2)
+            self.full_frames += 1
+            self.tiles_recomputed += rows * cols
+        elif dirty_count == 0:
+            self.reused_frames += 1
+        else:
+            for y0, y1, x0, x1 in self._dirty_regions(dirty, height, width):
+                detect_region_edges(gray, self._edges, (y0, y1, x0, x1), threshold1, threshold2, REGION_HALO,
+                                    self.kernel, self.sigma)
+                self._reference[y0:y1, x0:x1] = gray[y0:y1, x0:x1]
+            self.tiles_recomputed += dirty_count
+
+        if self.smoothing <= 0:
+            return self._edges.copy()
+
+        # Suavizado temporal: media exponencial del mapa de bordes, umbralizada a la mitad
+        if self._accumulator is None:
+            self._accumulator = self._edges.astype(np.float32)
+        else:
+            cv2.accumulateWeighted(self._edges, self._accumulator, 1.0 - self.smoothing)
+        return np.where(self._accumulator >= 127.5, 255, 0).astype(np.uint8)
+
+    def stats(self) -> dict:
+        """Frames completos, reutilizados y fracción de mosaicos recalculados"""
+        return {
+            'frames': self.frames,
+            'full_frames': self.full_frames,
+            'reused_frames': self.reused_frames,
+            'recomputed_ratio': round(self.tiles_recomputed / self.tiles_total, 4) if self.tiles_total else 0.0
+        }
+
+
+def decode_stream_frame(frame_data: bytes, width: int, height: int) -> np.ndarray:
+    """
+    Decodifica un frame directamente en escala de grises y lo lleva al tamaño indicado
+
+    Args:
+        frame_data: Bytes del frame (JPEG/PNG)
+        width: Ancho deseado
+        height: Alto deseado
+
+    Returns:
+        Frame en escala de grises
+    """
+    gray = cv2.imdecode(np.frombuffer(frame_data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        raise ValueError("No se pudo decodificar el frame")
+    if gray.shape[0] != height or gray.shape[1] != width:
+        gray = cv2.resize(gray, (width, height))
+    return gray
+
+
+class StreamProcessorStore:
+    """
+    Detectores incrementales por sesión, olvidados tras un tiempo de inactividad
+    El planificador de frames garantiza un solo frame en curso por sesión, por lo
+    que cada detector se usa desde un único hilo a la vez.
+
+    Args:
+        session_ttl: Segundos de inactividad antes de olvidar una sesión
+        **detector_options: Argumentos de IncrementalEdgeDetector
+    """
+
+    def __init__(self, session_ttl: float = 60.0, **detector_options):
+        self._session_ttl = session_ttl
+        self._detector_options = detector_options
+        self._detectors: Dict[str, Tuple[IncrementalEdgeDetector, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> IncrementalEdgeDetector:
+        """Devuelve el detector de la sesión, creándolo si no existe"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [sid for sid, (_, seen) in self._detectors.items() if now - seen > self._session_ttl]
+            for sid in expired:
+                del self._detectors[sid]
+            entry = self._detectors.get(session_id)
+            detector = entry[0] if entry else IncrementalEdgeDetector(**self._detector_options)
+            self._detectors[session_id] = (detector, now)
+            return detector
+
+    def stats(self, session_id: Optional[str] = None) -> Optional[dict]:
+        """Estadísticas de una sesión o de todas"""
+        with self._lock:
+            if session_id is not None:
+                entry = self._detectors.get(session_id)
+                return entry[0].stats() if entry else None
+            return {sid: detector.stats() for sid, (detector, _) in self._detectors.items()}
@@ -0,0 +1,207 @@
+"""
+Procesamiento por mosaicos con memoria acotada para imágenes muy grandes
+La imagen se decodifica directamente en escala de grises y Canny se aplica por
+mosaicos con un halo de solapamiento, de modo que el suavizado, los gradientes y
+la supresión de no máximos son idénticos a los de la imagen completa. El montaje
+de comparación se genera a resolución reducida (vista previa).
+"""
+
+import math
+import struct
+from typing import Iterator, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from edge_backends import select_backend
+
+# Bytes por píxel de los temporales de un mosaico: recorte suavizado (1),
+# gradientes int16 (2 + 2), magnitud int32 (4), mapa interno de Canny y bordes (2)
+TILE_BYTES_PER_PIXEL = 11
+# Bytes por píxel que siempre quedan residentes: imagen gris + mapa de bordes
+RESIDENT_BYTES_PER_PIXEL = 2
+MIN_TILE_SIZE = 256
+
+
+def read_image_size(image_bytes: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Lee el tamaño de la imagen de la cabecera, sin decodificarla (PNG, JPEG, GIF, BMP)
+    
+    Args:
+        image_bytes: Contenido del fichero
+    
+    Returns:
+        (ancho, alto) o None si el formato no se reconoce
+    """
+    data = memoryview(image_bytes)
+    if len(data) >= 24 and bytes(data[:8]) == b'\x89PNG\r\n\x1a\n':
+        return struct.unpack('>II', data[16:24])
+    if len(data) >= 10 and bytes(data[:6]) in (b'GIF87a', b'GIF89a'):
+        return struct.unpack('<HH', data[6:10])
+    if len(data) >= 26 and bytes(data[:2]) == b'BM':
+        width, height = struct.unpack('<ii', data[18:26])
+        return width, abs(height)
+    if len(data) >= 4 and bytes(data[:2]) == b'\xff\xd8':
+        # Recorrer los segmentos JPEG hasta el marcador SOF
+        position = 2
+        while position + 9 < len(data):
+            if data[position] != 0xFF:
+                position += 1
+                continue
+            marker = data[position + 1]
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7 or marker == 0xFF:
+                position += 1 if marker == 0xFF else 2
+                continue
+            length = struct.unpack('>H', data[position + 2:position + 4])[0]
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack('>HH', data[position + 5:position + 9])
+                return width, height
+            position += 2 + length
+    return None
+
+
+def tile_size_for_budget(width: int, height: int, memory_budget: int, halo: int) -> int:
+    """
+    Calcula el lado del mosaico que respeta el presupuesto de memoria
+    
+    Args:
+        width: Ancho de la imagen
+        height: Alto de la imagen
+        memory_budget: Bytes máximos para el procesamiento de la imagen
+        halo: Píxeles de solapamiento por lado
+    
+    Returns:
+        Lado del mosaico (sin halo)
+    """
+    available = memory_budget - width * height * RESIDENT_BYTES_PER_PIXEL
+    if available <= 0:
+        raise ValueError("La imagen es demasiado grande para el presupuesto de memoria configurado")
+    side = int(math.sqrt(available / TILE_BYTES_PER_PIXEL)) - 2 * halo
+    if side < MIN_TILE_SIZE:
+        raise ValueError("La imagen es demasiado grande para el presupuesto de memoria configurado")
+    return min(side, max(width, height))
+
+
+def iter_tiles(width: int, height: int, tile_size: int, halo: int) -> Iterator[Tuple[Tuple[int, int, int, int], Tuple[int, int, int, int]]]:
+    """
+    Genera los mosaicos de la imagen
+    
+    Returns:
+        Iterador de ((y0, y1, x0, x1) del núcleo, (y0, y1, x0, x1) con halo)
+    """
+    for y0 in range(0, height, tile_size):
+        y1 = min(y0 + tile_size, height)
+        for x0 in range(0, width, tile_size):
+            x1 = min(x0 + tile_size, width)
+            yield (y0, y1, x0, x1), (max(0, y0 - halo), min(height, y1 + halo), max(0, x0 - halo), min(width, x1 + halo))
+
+
+def detect_edges_tiled(gray_image: np.ndarray, threshold1: int, threshold2: int, tile_size: int,
+                       halo: int = 32, kernel=(5, 5), sigma: float = 1.5, backend: str = 'opencv') -> np.ndarray:
+    """
+    Aplica suavizado Gaussiano + Canny por mosaicos con halo
+    El halo cubre el radio del kernel, los gradientes y la supresión de no máximos, por lo
+    que los bordes coinciden con los de la imagen completa salvo en cadenas de histéresis
+    más largas que el halo que cruzan la frontera entre mosaicos.
+    
+    Args:
+        gray_image: Imagen en escala de grises
+        threshold1: Umbral Bajo
+        threshold2: Umbral Alto
+        tile_size: Lado del mosaico (sin halo)
+        halo: Píxeles de solapamiento por lado
+        kernel: Tamaño del kernel Gaussiano
+        sigma: Sigma del kernel Gaussiano
+        backend: Backend de detección aplicado a cada mosaico
+    
+    Returns:
+        Imagen de bordes a resolución completa
+    """
+    height, width = gray_image.shape
+    edges = np.empty((height, width), dtype=np.uint8)
+    for core, _ in iter_tiles(width, height, tile_size, halo):
+        detect_region_edges(gray_image, edges, core, threshold1, threshold2, halo, kernel, sigma, backend)
+    return edges
+
+
+def detect_region_edges(gray_image: np.ndarray, edges: np.ndarray, core: Tuple[int, int, int, int],
+                        threshold1: int, threshold2: int, halo: int = 32, kernel=(5, 5), sigma: float = 1.5,
+                        backend: str = 'opencv'):
+    """
+    Recalcula los bordes de una región rectangular y los escribe en el mapa de bordes
+    
+    Args:
+        gray_image: Imagen en escala de grises completa
+        edges: Mapa de bordes de destino (mismo tamaño que gray_image)
+        core: Región (y0, y1, x0, x1) a recalcular
+        threshold1: Umbral Bajo
+        threshold2: Umbral Alto
+        halo: Píxeles de contexto alrededor de la región
+        kernel: Tamaño del kernel Gaussiano
+        sigma: Sigma del kernel Gaussiano
+        backend: Backend de detección (None para el predeterminado)
+    """
+    height, width = gray_image.shape
+    y0, y1, x0, x1 = core
+    hy0, hy1, hx0, hx1 = max(0, y0 - halo), min(height, y1 + halo), max(0, x0 - halo), min(width, x1 + halo)
+    # El recorte es una vista: no copia la imagen
+    selected = select_backend(hx1 - hx0, hy1 - hy0, backend)
+    region_edges = selected.detect(gray_image[hy0:hy1, hx0:hx1], threshold1, threshold2, kernel, sigma)
+    edges[y0:y1, x0:x1] = region_edges[y0 - hy0:y1 - hy0, x0 - hx0:x1 - hx0]
+
+
+def _reduced_color_flag(width: int, height: int, max_side: int) -> Optional[int]:
+    """
+    Elige la decodificación reducida de OpenCV (1/2, 1/4, 1/8) más pequeña que supere max_side
+    
+    Returns:
+        Flag de cv2.imdecode, o None si hay que decodificar a resolución completa
+    """
+    for factor, flag in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)):
+        if max(width, height) / factor >= max_side:
+            return flag
+    return None
+
+
+def build_preview_panels(image_bytes: bytes, gray_image: np.ndarray, edges: np.ndarray,
+                         max_side: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Paneles de vista previa (original, grises, bordes) con el lado mayor limitado a max_side
+    Solo JPEG se decodifica de verdad a escala reducida (libjpeg escala durante la decodificación);
+    los demás formatos, o un JPEG que necesitaría la resolución completa, ocuparían 3 bytes por
+    píxel fuera del presupuesto de los mosaicos, así que su panel original es la vista previa en grises.
+    
+    Args:
+        image_bytes: Contenido original (un JPEG se vuelve a decodificar en color a resolución reducida)
+        gray_image: Imagen en escala de grises a resolución completa
+        edges: Bordes a resolución completa
+        max_side: Lado mayor de la vista previa
+    
+    Returns:
+        Tupla con (original, gris, bordes) reducidos
+    """
+    height, width = gray_image.shape
+    scale = min(1.0, max_side / max(width, height))
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+
+    gray = cv2.resize(gray_image, size, interpolation=cv2.INTER_AREA)
+    flag = _reduced_color_flag(width, height, max_side)
+    if flag is not None and bytes(image_bytes[:2]) == b'\xff\xd8':
+        original = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), flag)
+        if original is None:
+            raise ValueError("No se pudo cargar la imagen")
+        original = cv2.resize(original, size, interpolation=cv2.INTER_AREA)
+    else:
+        original = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+    # Conservar visibles los bordes finos al reducir
+    edges_preview = cv2.resize(edges, size, interpolation=cv2.INTER_AREA)
+    cv2.threshold(edges_preview, 0, 255, cv2.THRESH_BINARY, dst=edges_preview)
+    return original, gray, edges_preview
+
+
+def decode_gray_bytes(image_bytes: bytes) -> np.ndarray:
+    """Decodifica directamente en escala de grises (sin la copia en color a resolución completa)"""
+    gray_image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if gray_image is None:
+        raise ValueError("No se pudo cargar la imagen")
+    return gray_image
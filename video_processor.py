@@ -0,0 +1,243 @@
+"""
+Detección de bordes sobre ficheros de vídeo
+El vídeo se decodifica frame a frame con cv2.VideoCapture, cada frame se envía al
+motor de procesamiento (como un frame de tiempo real) con un número acotado de
+frames en vuelo, y los bordes se escriben con cv2.VideoWriter en el orden original
+a medida que terminan: en memoria solo están los frames en vuelo, nunca el vídeo.
+Los frames que se saltan (frame_step) se avanzan con grab(), sin decodificarlos.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+from image_processor import detect_decoded_frame_edges
+from metrics import StageTimer
+from processing_engine import EngineSaturated
+
+
+class VideoCancelled(Exception):
+    """El procesamiento del vídeo se canceló"""
+
+
+class VideoProgress:
+    """
+    Avance de un procesamiento de vídeo
+    Lo actualiza el hilo que procesa el vídeo y lo leen las peticiones de estado.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._started = None
+        self.total_frames = None
+        self.frames_read = 0
+        self.frames_skipped = 0
+        self.frames_written = 0
+
+    def start(self, total_frames: Optional[int]):
+        """Empieza a contar (total_frames None si el contenedor no indica la duración)"""
+        with self._lock:
+            self._started = time.monotonic()
+            self.total_frames = total_frames
+
+    def update(self, read: int = 0, skipped: int = 0, written: int = 0):
+        with self._lock:
+            self.frames_read += read
+            self.frames_skipped += skipped
+            self.frames_written += written
+
+    def cancel(self):
+        """Pide que el procesamiento se detenga en el siguiente frame"""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def to_dict(self) -> dict:
+        """Frames leídos, saltados y escritos, porcentaje, velocidad y tiempo restante estimado"""
+        with self._lock:
+            elapsed = time.monotonic() - self._started if self._started else 0.0
+            # Frames del original ya resueltos: escritos más los que se saltaron
+            done = self.frames_written + self.frames_skipped
+            rate = done / elapsed if elapsed > 0 else 0.0
+            percent = eta = None
+            if self.total_frames:
+                percent = round(min(done * 100.0 / self.total_frames, 100.0), 1)
+                eta = round(max(self.total_frames - done, 0) / rate, 1) if rate > 0 else None
+            return {
+                'total_frames': self.total_frames,
+                'frames_read': self.frames_read,
+                'frames_skipped': self.frames_skipped,
+                'frames_written': self.frames_written,
+                'percent': percent,
+                'elapsed_seconds': round(elapsed, 3),
+                'frames_per_second': round(self.frames_written / elapsed, 2) if elapsed > 0 else 0.0,
+                'eta_seconds': eta,
+                'cancelled': self.cancelled,
+            }
+
+
+def output_size(width: int, height: int, max_side: Optional[int]) -> Tuple[int, int]:
+    """Tamaño de salida para que el lado mayor no supere max_side (sin ampliar; par, como piden muchos códecs)"""
+    if max_side and max(width, height) > max_side:
+        scale = max_side / max(width, height)
+        width, height = round(width * scale), round(height * scale)
+    return max(2, width - width % 2), max(2, height - height % 2)
+
+
+def process_video(input_path: str, output_path: str, threshold1: int, threshold2: int, engine,
+                  frame_step: int = 1, max_side: Optional[int] = None, max_in_flight: int = 4,
+                  fourcc: str = 'mp4v', timeout: Optional[float] = None, backend: Optional[str] = None,
+                  progress: Optional[VideoProgress] = None) -> dict:
+    """
+    Genera el vídeo de bordes de un fichero de vídeo
+    
+    Args:
+        input_path: Ruta del vídeo original
+        output_path: Ruta del vídeo de bordes (el contenedor sale de la extensión)
+        threshold1: Umbral Bajo para Canny
+        threshold2: Umbral Alto para Canny
+        engine: ProcessingEngine en el que se procesan los frames
+        frame_step: Procesar uno de cada frame_step frames (la salida conserva la duración)
+        max_side: Lado mayor de la salida (None para el tamaño original)
+        max_in_flight: Frames procesándose a la vez
+        fourcc: Código FourCC del códec de salida
+        timeout: Segundos máximos de espera por un frame
+        backend: Backend de detección (None para el predeterminado)
+        progress: Avance a actualizar (opcional; permite cancelar)
+    
+    Returns:
+        Diccionario con los frames, tamaños, fps, porcentaje medio de bordes y tiempos por etapa
+    
+    Raises:
+        ValueError: Si el vídeo no se puede leer o el códec de salida no está disponible
+        VideoCancelled: Si se canceló con progress.cancel()
+    """
+    if frame_step < 1 or max_in_flight < 1:
+        raise ValueError("frame_step y max_in_flight deben ser al menos 1")
+    progress = progress or VideoProgress()
+    timer = StageTimer()
+    capture = cv2.VideoCapture(input_path)
+    if not capture.isOpened():
+        raise ValueError("No se pudo abrir el vídeo")
+
+    # Fichero temporal con la misma extensión (VideoWriter elige el contenedor por ella);
+    # el nombre contiene '.tmp', así que la expulsión del almacenamiento lo ignora
+    temp_path = '{}.tmp{}'.format(*os.path.splitext(output_path))
+    writer = None
+    pending = deque()
+    edge_pixels = 0
+    try:
+        source_fps = capture.get(cv2.CAP_PROP_FPS)
+        source_fps = source_fps if source_fps and source_fps > 0 else 25.0
+        total_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        source_width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        source_height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if source_width <= 0 or source_height <= 0:
+            raise ValueError("El vídeo no indica el tamaño de sus frames")
+        width, height = output_size(source_width, source_height, max_side)
+        progress.start(total_frames if total_frames > 0 else None)
+
+        output_fps = source_fps / frame_step
+        writer = cv2.VideoWriter(temp_path, cv2.VideoWriter_fourcc(*fourcc), output_fps, (width, height), True)
+        if not writer.isOpened():
+            raise ValueError(f"No se pudo crear el vídeo de salida (códec {fourcc})")
+        # Un único buffer BGR reutilizado para todos los frames escritos
+        frame_bgr = np.empty((height, width, 3), dtype=np.uint8)
+
+        def write_next():
+            nonlocal edge_pixels
+            future = pending.popleft()
+            with timer.stage('wait'):
+                edges = future.result(timeout=timeout)
+            with timer.stage('encode'):
+                edge_pixels += cv2.countNonZero(edges)
+                cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR, dst=frame_bgr)
+                writer.write(frame_bgr)
+            progress.update(written=1)
+
+        def submit(frame):
+            while True:
+                try:
+                    return engine.submit(detect_decoded_frame_edges, frame, width, height,
+                                         threshold1, threshold2, backend)
+                except EngineSaturated:
+                    # Motor lleno: escribir el frame más antiguo libera un hueco; sin
+                    # frames propios en vuelo, esperar a que terminen otras peticiones
+                    if pending:
+                        write_next()
+                    else:
+                        time.sleep(0.05)
+                    if progress.cancelled:
+                        raise VideoCancelled("Procesamiento de vídeo cancelado")
+
+        index = 0
+        while True:
+            if progress.cancelled:
+                raise VideoCancelled("Procesamiento de vídeo cancelado")
+            with timer.stage('decode'):
+                if index % frame_step:
+                    if not capture.grab():
+                        break
+                    index += 1
+                    progress.update(skipped=1)
+                    continue
+                ok, frame = capture.read()
+            if not ok:
+                break
+            index += 1
+            progress.update(read=1)
+            # Orden de salida: con max_in_flight frames en vuelo se escribe el más antiguo antes de enviar otro
+            if len(pending) >= max_in_flight:
+                write_next()
+            pending.append(submit(frame))
+        while pending:
+            write_next()
+
+        frames_written = progress.frames_written
+        if not frames_written:
+            raise ValueError("El vídeo no contiene frames legibles")
+    except BaseException:
+        for future in pending:
+            future.cancel()
+        if writer is not None:
+            writer.release()
+            writer = None
+        _remove_quietly(temp_path)
+        raise
+    finally:
+        capture.release()
+        if writer is not None:
+            writer.release()
+
+    os.replace(temp_path, output_path)
+    return {
+        'frames_read': progress.frames_read,
+        'frames_skipped': progress.frames_skipped,
+        'frames_written': frames_written,
+        'frame_step': frame_step,
+        'source_width': source_width,
+        'source_height': source_height,
+        'width': width,
+        'height': height,
+        'source_fps': round(source_fps, 3),
+        'output_fps': round(output_fps, 3),
+        'duration_seconds': round(frames_written / output_fps, 3),
+        'codec': fourcc,
+        'mean_edge_percentage': round(edge_pixels * 100.0 / (frames_written * width * height), 2),
+        'timings': timer.timings,
+    }
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
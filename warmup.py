@@ -0,0 +1,138 @@
+"""
+Calentamiento del servicio al arrancar
+La calibración de backends, el arranque de los procesos trabajadores y la primera
+ejecución del pipeline (inicialización de OpenCV, códecs, kernels OpenCL) se hacen
+en segundo plano sobre una imagen sintética, de modo que el servidor acepta
+conexiones enseguida y la primera petición real no paga el arranque en frío.
+/api/ready informa de cuándo ha terminado.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import wait
+from typing import Callable, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def synthetic_image_bytes(width: int, height: int) -> bytes:
+    """PNG sintético con bordes para ejecutar el pipeline completo"""
+    import cv2
+    import numpy as np
+
+    image = np.full((height, width, 3), 96, dtype=np.uint8)
+    cv2.rectangle(image, (width // 8, height // 8), (width // 2, height // 2), (220, 220, 220), -1)
+    cv2.circle(image, (width * 2 // 3, height * 2 // 3), max(4, min(width, height) // 6), (20, 20, 20), -1)
+    success, encoded = cv2.imencode('.png', image)
+    if not success:
+        raise ValueError("Error codificando la imagen de calentamiento")
+    return encoded.tobytes()
+
+
+class Warmup:
+    """
+    Estado y ejecución del calentamiento
+    
+    Estados: 'pending' (sin empezar), 'running', 'ready' y 'failed' (el servicio
+    funciona igualmente; solo se pierde la ventaja del calentamiento).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._status = 'pending'
+        self._error = None
+        self._started = None
+        self._finished = None
+        self._timings = {}
+        self._ready = threading.Event()
+        self._thread = None
+
+    @property
+    def ready(self) -> bool:
+        """Si el calentamiento ha terminado (también si falló: el servicio puede atender)"""
+        return self._ready.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que termine el calentamiento"""
+        return self._ready.wait(timeout)
+
+    def join(self, timeout: Optional[float] = None):
+        """Espera a que termine el hilo del calentamiento, si se lanzó (antes de cerrar el motor)"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def start(self, engine, image_size: Tuple[int, int], calibration_sizes: Optional[Iterable[Tuple[int, int]]] = None,
+              after_calibration: Optional[Callable[[], None]] = None, background: bool = True):
+        """
+        Lanza el calentamiento
+        
+        Args:
+            engine: ProcessingEngine a calentar (se ejecuta un pipeline por trabajador)
+            image_size: Tamaño (ancho, alto) de la imagen sintética
+            calibration_sizes: Tamaños para calibrar el backend 'auto' (None = sin calibración)
+            after_calibration: Función llamada tras calibrar y antes de arrancar los trabajadores
+            background: Ejecutar en un hilo (True) o en el hilo actual
+        """
+        with self._lock:
+            if self._status != 'pending':
+                return
+            self._status = 'running'
+            self._started = time.time()
+        args = (engine, image_size, calibration_sizes, after_calibration)
+        if background:
+            self._thread = threading.Thread(target=self._run, args=args, name='warmup', daemon=True)
+            self._thread.start()
+        else:
+            self._run(*args)
+
+    def skip(self):
+        """Marca el servicio como listo sin calentar"""
+        with self._lock:
+            self._status = 'ready'
+            self._finished = time.time()
+        self._ready.set()
+
+    def _run(self, engine, image_size, calibration_sizes, after_calibration):
+        try:
+            if calibration_sizes:
+                start = time.perf_counter()
+                from edge_backends import calibrate
+                calibrate(calibration_sizes)
+                self._timings['calibrate'] = time.perf_counter() - start
+            if after_calibration is not None:
+                after_calibration()
+
+            # Un pipeline por trabajador, a la vez: en modo 'process' arranca todos los
+            # procesos y cada uno importa OpenCV/NumPy y ejecuta su primera detección
+            start = time.perf_counter()
+            from image_processor import process_image_bytes_job
+            image_bytes = synthetic_image_bytes(*image_size)
+            futures = [engine.submit(process_image_bytes_job, image_bytes, 100, 200)
+                       for _ in range(engine.workers)]
+            wait(futures)
+            for future in futures:
+                future.result()
+            self._timings['pipeline'] = time.perf_counter() - start
+            status, error = 'ready', None
+            logger.info("calentamiento terminado %s", {k: round(v, 3) for k, v in self._timings.items()})
+        except Exception as e:
+            status, error = 'failed', str(e)
+            logger.exception("error en el calentamiento")
+        with self._lock:
+            self._status = status
+            self._error = error
+            self._finished = time.time()
+        self._ready.set()
+
+    def status(self) -> dict:
+        """Estado, duración y tiempos por paso del calentamiento"""
+        with self._lock:
+            finished = self._finished or time.time()
+            return {
+                'status': self._status,
+                'ready': self._ready.is_set(),
+                'error': self._error,
+                'elapsed': round(finished - self._started, 3) if self._started else None,
+                'timings': {step: round(seconds, 3) for step, seconds in self._timings.items()},
+            }